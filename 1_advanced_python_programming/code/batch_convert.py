@@ -0,0 +1,332 @@
+# import needed libraries
+import argparse  # needed for passing terminal arguments
+import glob
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2  # import opencv
+
+from image_cache import ImageCache
+from image_decoding import read_image
+from image_operations import OPERATIONS, OperationChain, parse_operations
+
+# The batch version of convert_image.py: it converts many images with a
+# chain of operations, and writes the results with no window. The images
+# are converted on a pool of processes, a chunk of images per task. Only
+# the file paths are sent to the processes, each process reads and writes
+# its own images. The operations are the kernels of image_operations.py,
+# which reuse their buffers from one image to the next. With --max_size
+# the outputs are thumbnails, and the images are decoded at a reduced
+# size (see image_decoding.py). With --cache_dir the decoded images are
+# kept on disk, and the next runs memory-map them instead of decoding
+# them again (see image_cache.py).
+#
+# USAGE
+# python batch_convert.py --inputs photos/ "scans/*.png" --operations gray
+# python batch_convert.py --inputs photos/ --operations gray,flip --recursive
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def find_images(inputs, output_dir, recursive=False):
+    """Find the images to convert, and where to save each of them.
+
+    The images found in a directory keep their path relative to that
+    directory in the output directory. The other images are saved with
+    their file name.
+
+    Arguments:
+        inputs {list} -- image files, directories or glob patterns
+        output_dir {str} -- folder for the output images
+
+    Keyword Arguments:
+        recursive {bool} -- also look in the sub directories
+            (default: {False})
+
+    Returns:
+        [generator] -- (input path, output path) tuples
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                walk = os.walk(item)
+            else:
+                walk = [(item, [], sorted(os.listdir(item)))]
+            for folder, _, names in walk:
+                for name in sorted(names):
+                    path = os.path.join(folder, name)
+                    if name.lower().endswith(IMAGE_EXTENSIONS) and (
+                        os.path.isfile(path)
+                    ):
+                        relative = os.path.relpath(path, item)
+                        yield path, os.path.join(output_dir, relative)
+        else:
+            # a single file is a glob pattern matching itself
+            for path in sorted(glob.iglob(item, recursive=recursive)):
+                if os.path.isfile(path):
+                    name = os.path.basename(path)
+                    yield path, os.path.join(output_dir, name)
+
+
+# the operation chains of this process, kept between chunks so their
+# buffers are reused for the whole batch
+_chains = {}
+
+
+def operation_chain(operations):
+    """The operation chain of this process for a list of operations."""
+    key = tuple(operations)
+    if key not in _chains:
+        _chains[key] = OperationChain(operations)
+    return _chains[key]
+
+
+# the image caches of this process, by directory
+_caches = {}
+
+
+def image_cache(directory, max_bytes):
+    """The image cache of this process for a directory."""
+    if directory not in _caches:
+        _caches[directory] = ImageCache(directory, max_bytes)
+    return _caches[directory]
+
+
+def convert_chunk(jobs, operations, max_size=None, cache=None):
+    """Convert a chunk of images. This runs in the worker processes.
+
+    Arguments:
+        jobs {list} -- (input path, output path) tuples
+        operations {list} -- operation names, applied in order
+
+    Keyword Arguments:
+        max_size {tuple} -- (width, height) the outputs must fit in
+            (default: {None})
+        cache {tuple} -- (directory, max bytes) of the image cache, no
+            cache when None (default: {None})
+
+    Returns:
+        [tuple] -- (number of images converted, list of (path, error)
+            failures, {stage: seconds taken})
+    """
+    read = read_image
+    if cache is not None:
+        read = image_cache(*cache).read_image
+    timings = {"read": 0.0, "write": 0.0}
+    timings.update(dict.fromkeys(operations, 0.0))
+    chain = operation_chain(operations)
+    converted = 0
+    failures = []
+    for input_path, output_path in jobs:
+        try:
+            start = time.perf_counter()
+            img = read(input_path, operations, max_size)
+            timings["read"] += time.perf_counter() - start
+            if img is None:
+                raise ValueError("could not read the image")
+
+            # a decoded image is ours, so it may be overwritten, but the
+            # images from the cache are read-only
+            img = chain(img, overwrite=img.flags.writeable, timings=timings)
+
+            start = time.perf_counter()
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            written = cv2.imwrite(output_path, img)
+            timings["write"] += time.perf_counter() - start
+            if not written:
+                raise ValueError("could not write " + output_path)
+            converted += 1
+        except Exception as error:
+            # one bad image must not stop the whole batch
+            failures.append((input_path, str(error)))
+    return converted, failures, timings
+
+
+def chunks(items, chunk_size):
+    """Split an iterable into lists of chunk_size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def convert_images(
+    jobs, operations, workers=None, chunk_size=32, max_size=None, cache=None
+):
+    """Convert images on a pool of processes.
+
+    Arguments:
+        jobs {iterable} -- (input path, output path) tuples
+        operations {list} -- operation names, applied in order
+
+    Keyword Arguments:
+        workers {int} -- number of processes, one per cpu when None
+            (default: {None})
+        chunk_size {int} -- images sent to a process at a time
+            (default: {32})
+        max_size {tuple} -- (width, height) the outputs must fit in, full
+            size when None (default: {None})
+        cache {tuple} -- (directory, max bytes) of the image cache, no
+            cache when None (default: {None})
+
+    Returns:
+        [dict] -- "converted" and "failed" counts, the list of
+            "failures", the total "seconds", the "images_per_second" and
+            the "stage_seconds" summed over the processes
+    """
+    workers = workers or os.cpu_count()
+    summary = {"converted": 0, "failed": 0, "failures": []}
+    stage_seconds = {"read": 0.0, "write": 0.0}
+    stage_seconds.update(dict.fromkeys(operations, 0.0))
+    start = time.perf_counter()
+
+    def collect(future):
+        converted, failures, timings = future.result()
+        summary["converted"] += converted
+        summary["failed"] += len(failures)
+        summary["failures"].extend(failures)
+        for stage, seconds in timings.items():
+            stage_seconds[stage] += seconds
+
+    # only a few chunks are in flight at a time, so the memory used does
+    # not depend on the number of images
+    max_in_flight = 2 * workers
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks(jobs, chunk_size):
+            in_flight.append(
+                executor.submit(
+                    convert_chunk, chunk, operations, max_size, cache
+                )
+            )
+            if len(in_flight) >= max_in_flight:
+                collect(in_flight.popleft())
+        while in_flight:
+            collect(in_flight.popleft())
+
+    summary["seconds"] = time.perf_counter() - start
+    summary["images_per_second"] = summary["converted"] / max(
+        summary["seconds"], 1e-9
+    )
+    summary["stage_seconds"] = stage_seconds
+    return summary
+
+
+def print_summary(summary, max_failures=20):
+    """Print the images per second, the time of each stage and the
+    failures.
+
+    Arguments:
+        summary {dict} -- summary from convert_images
+
+    Keyword Arguments:
+        max_failures {int} -- number of failures listed (default: {20})
+    """
+    print(
+        "[INFO] {} images converted, {} failed in {:.2f} seconds, "
+        "{:.1f} images/sec".format(
+            summary["converted"],
+            summary["failed"],
+            summary["seconds"],
+            summary["images_per_second"],
+        )
+    )
+    for stage, seconds in summary["stage_seconds"].items():
+        print("    {:10s} {:10.3f} seconds".format(stage, seconds))
+    for path, error in summary["failures"][:max_failures]:
+        print("[ERROR] {}: {}".format(path, error))
+    if summary["failed"] > max_failures:
+        more = summary["failed"] - max_failures
+        print("[ERROR] ... and {} more".format(more))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--inputs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="image files, directories or glob patterns",
+    )
+    parser.add_argument(
+        "-o",
+        "--operations",
+        type=str,
+        required=True,
+        help="comma separated operations, from " + ", ".join(OPERATIONS),
+    )
+    parser.add_argument(
+        "-d",
+        "--output_dir",
+        type=str,
+        default="converted",
+        help="folder for the output images",
+    )
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="also look for images in the sub directories",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of processes"
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk_size",
+        type=int,
+        default=32,
+        help="images sent to a process at a time",
+    )
+    parser.add_argument(
+        "-m",
+        "--max_size",
+        type=int,
+        nargs=2,
+        default=None,
+        help="width and height the outputs must fit in, for thumbnails",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="folder of the decoded image cache, no cache when not given",
+    )
+    parser.add_argument(
+        "--cache_mb",
+        type=float,
+        default=2048,
+        help="size limit of the decoded image cache, in MB",
+    )
+    arguments = parser.parse_args()
+
+    cache = None
+    if arguments.cache_dir is not None:
+        cache = (arguments.cache_dir, int(arguments.cache_mb * 2 ** 20))
+
+    jobs = find_images(
+        arguments.inputs, arguments.output_dir, arguments.recursive
+    )
+    summary = convert_images(
+        jobs,
+        parse_operations(arguments.operations),
+        workers=arguments.workers,
+        chunk_size=arguments.chunk_size,
+        max_size=arguments.max_size and tuple(arguments.max_size),
+        cache=cache,
+    )
+    print_summary(summary)
+
+    # a non zero exit code tells the nightly job that some images failed
+    if summary["failed"]:
+        sys.exit(1)
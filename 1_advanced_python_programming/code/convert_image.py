@@ -1,10 +1,15 @@
 # import needed libraries
 import cv2  # import opencv
 import sys
-import numpy as np
 
 import argparse  # needed for passing terminal arguments
 
+# the operations, as kernels that do not allocate temporary images
+from image_operations import OperationChain
+
+# reads only what the operation needs
+from image_decoding import read_image
+
 
 # this is argparse section. Note the syntax of the module
 parser = argparse.ArgumentParser()
@@ -37,13 +42,42 @@ parser.add_argument(
     default="output_image.jpg",
 )
 
+# for a preview, the image can be decoded at a smaller size
+parser.add_argument(
+    "-m",
+    "--max_size",
+    type=int,
+    nargs=2,
+    default=None,
+    help="width and height the image must fit in, for a preview",
+)
+
 arguments = parser.parse_args()  # we need the line to finish passing arguments
 # now we can use the arguments in out program
 # note the use of `arguments.[identifier]` in the script
 
-# read the image, using cv2.imread
+# each number is the name of an operation in image_operations.py.
+# Brighten and darken add a scalar to the pixels, so we do not need
+# a full image of 100s, and only canny converts to grayscale first
+operation_names = {
+    1: "gray",  # convert to grayscale
+    2: "flip",  # flip image
+    3: "canny",  # edge detection
+    4: "brighten",  # brighten image
+    5: "darken",  # darken image
+}
+if arguments.operation not in operation_names:
+    sys.exit("Unknown operation {}.".format(arguments.operation))
+operation_name = operation_names[arguments.operation]
+
+# read the image, with cv2.imread. A grayscale operation decodes the image
+# as gray, and with --max_size a JPEG is decoded at 1/2, 1/4 or 1/8 size
 path_to_image = arguments.image_path  # path to the image, from arguments
-img = cv2.imread(cv2.samples.findFile(path_to_image))
+img = read_image(
+    cv2.samples.findFile(path_to_image),
+    [operation_name],
+    arguments.max_size,
+)
 
 # in case we cannot read the image
 if img is None:
@@ -52,23 +86,8 @@ if img is None:
 
 # we want to perform several operations on the image ##############
 # depending on what the user chooses ##############
-# for brightness and darkening
-pixel_change = np.ones(img.shape, dtype=np.uint8) * 100
-
-# multiple operations will use grayscale image, so we do it once
-gray_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-# Using if condition
-if arguments.operation == 1:  # convert to grayscale
-    converted_image = gray_image
-elif arguments.operation == 2:  # flip image
-    converted_image = np.fliplr(img)
-elif arguments.operation == 3:  # edge detection
-    converted_image = cv2.Canny(gray_image, threshold1=100, threshold2=200)
-elif arguments.operation == 4:  # brighten image
-    converted_image = cv2.add(img, pixel_change)
-elif arguments.operation == 5:  # darken image
-    dark_image = cv2.subtract(img, pixel_change)
+operation = OperationChain([operation_name])
+converted_image = operation(img)
 
 
 # image_flipped_lr = np.fliplr(img)
@@ -92,7 +111,7 @@ k = cv2.waitKey(0)
 
 # if the user presses the 's' key, save the image, using cv2.imwrite
 if k == ord("s"):
-    image_save_path = argparse.save_as
+    image_save_path = arguments.save_as
     # we convert the image to another color format
     # by using the `cv2.cvtColor` function
     # We choose the grayscale format by using the `cv2.COLOR_BGR2GRAY` object.
@@ -0,0 +1,290 @@
+# import needed libraries
+import argparse  # needed for passing terminal arguments
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import cv2  # import opencv
+import numpy as np
+
+from image_decoding import decode_flags, fit
+
+# A cache of decoded images on disk. Decoding a JPEG takes much longer
+# than reading its pixels back, so the decoded pixels are saved as raw
+# .npy files, keyed by the image path, its modification time and the
+# decode flags. Later runs memory-map the files instead of decoding: no
+# copy is made, the pages are read from disk (or the OS file cache) as
+# they are used. The cache has a size limit, and removes the least
+# recently used files first.
+#
+# USAGE (benchmark of a cold and a warm cache)
+# python image_cache.py --num_images 200
+
+
+class ImageCache:
+    """Decoded images saved as memory-mapped .npy files.
+
+    The images returned from the cache are read-only. Several processes
+    can share the same cache directory.
+
+    Arguments:
+        directory {str} -- folder of the cache files
+
+    Keyword Arguments:
+        max_bytes {int} -- size limit of the cache (default: {2 GB})
+        stale_seconds {float} -- temporary files older than this were
+            left by a process that crashed while writing, and are removed
+            when the cache starts. Younger ones may still be written by
+            another process (default: {3600})
+    """
+
+    def __init__(self, directory, max_bytes=2 * 2 ** 30, stale_seconds=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale(stale_seconds)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._bytes = sum(size for _, _, size in self._entries())
+
+    def _remove_stale(self, stale_seconds):
+        """Remove the temporary files older than stale_seconds."""
+        oldest = time.time() - stale_seconds
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                try:
+                    if entry.stat().st_mtime < oldest:
+                        os.remove(entry.path)
+                except OSError:  # removed or replaced by another process
+                    continue
+
+    def _entries(self):
+        """(last use time, path, size) of the cache files."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def key(self, path, flags, max_size=None):
+        """Cache key of an image: it changes when the file changes.
+
+        Arguments:
+            path {str} -- image path
+            flags {int} -- cv2.imread flags
+
+        Keyword Arguments:
+            max_size {tuple} -- size the image was shrunk to fit in
+                (default: {None})
+
+        Returns:
+            [str] -- the key
+        """
+        stat = os.stat(path)
+        text = "{}|{}|{}|{}|{}".format(
+            os.path.abspath(path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            flags,
+            max_size and tuple(max_size),
+        )
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        """Memory-map a cached image.
+
+        Arguments:
+            key {str} -- cache key
+
+        Returns:
+            [numpy array] -- the read-only image, or None when not cached
+        """
+        cache_path = self._path(key)
+        try:
+            img = np.load(cache_path, mmap_mode="r")
+            # the modification time of a file is its last use
+            os.utime(cache_path)
+        except (OSError, ValueError):  # not cached, or a broken file
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return img
+
+    def put(self, key, img):
+        """Save an image in the cache, then remove the least recently used
+        files if the cache is too large.
+
+        Arguments:
+            key {str} -- cache key
+            img {numpy array} -- the image
+        """
+        cache_path = self._path(key)
+        # written to a temporary file first, so other processes never see
+        # a half written file
+        handle, temporary = tempfile.mkstemp(
+            dir=self.directory, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(handle, "wb") as cache_file:
+                np.save(cache_file, np.ascontiguousarray(img))
+            os.replace(temporary, cache_path)
+        except BaseException:
+            # a full disk, or an interrupt, must not leave the file behind
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            # the size of the folder is read again, as other processes
+            # sharing it add files too. This also counts a replaced file
+            # once
+            entries = self._entries()
+            self._bytes = sum(size for _, _, size in entries)
+            if self._bytes > self.max_bytes:
+                self._evict(entries)
+
+    def _evict(self, entries):
+        """Remove the least recently used files, down to 90% of the
+        limit, so the next puts do not evict again at once.
+
+        Arguments:
+            entries {list} -- (last use time, path, size) of the files
+        """
+        for _, cache_path, size in sorted(entries):
+            if self._bytes <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(cache_path)
+            except OSError:  # removed, or still mapped on Windows
+                continue
+            self._bytes -= size
+
+    def read_image(self, path, operations=(), max_size=None):
+        """Read an image from the cache, or decode and cache it.
+
+        Arguments:
+            path {str} -- image path
+
+        Keyword Arguments:
+            operations {list} -- operation names, which choose the decode
+                flags (default: {()})
+            max_size {tuple} -- (width, height) the image must fit in
+                (default: {None})
+
+        Returns:
+            [numpy array] -- the image, or None when it cannot be read
+        """
+        flags, _ = decode_flags(path, operations, max_size)
+        key = self.key(path, flags, max_size)
+        img = self.get(key)
+        if img is None:
+            img = cv2.imread(path, flags)
+            if img is None:
+                return None
+            if max_size is not None:
+                img = fit(img, max_size)
+            self.put(key, img)
+        return img
+
+    def clear(self):
+        """Remove every file of the cache."""
+        with self._lock:
+            for _, cache_path, _ in self._entries():
+                os.remove(cache_path)
+            self._bytes = 0
+
+    def metrics(self):
+        """Hits, misses and size of the cache.
+
+        Returns:
+            [dict] -- "hits", "misses", "hit_rate" and "bytes"
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._bytes,
+            }
+
+
+def benchmark(num_images=100, size=(1920, 1080), max_mb=None, seed=0):
+    """Read a folder of JPEG images without the cache, with a cold cache
+    and with a warm cache. Every image is converted to gray, so all its
+    pixels are really read.
+
+    Keyword Arguments:
+        num_images {int} -- number of images (default: {100})
+        size {tuple} -- (width, height) of the images
+            (default: {(1920, 1080)})
+        max_mb {float} -- cache size limit in MB, no limit when None
+            (default: {None})
+        seed {int} -- random seed (default: {0})
+    """
+    rng = np.random.default_rng(seed)
+    folder = tempfile.mkdtemp()
+    try:
+        (width, height) = size
+        paths = []
+        for i in range(num_images):
+            small = rng.integers(0, 255, (30, 40, 3), dtype=np.uint8)
+            img = cv2.resize(small, size, interpolation=cv2.INTER_CUBIC)
+            paths.append(os.path.join(folder, "{}.jpg".format(i)))
+            cv2.imwrite(paths[-1], img)
+
+        max_bytes = 2 ** 60 if max_mb is None else int(max_mb * 2 ** 20)
+        cache = ImageCache(os.path.join(folder, "cache"), max_bytes)
+
+        def run(read):
+            start = time.perf_counter()
+            for path in paths:
+                cv2.cvtColor(read(path), cv2.COLOR_BGR2GRAY)
+            return (time.perf_counter() - start) / num_images
+
+        print(
+            "[INFO] {} JPEG images of {}x{}, per image:".format(
+                num_images, width, height
+            )
+        )
+        print("    no cache   {:8.2f} ms".format(run(cv2.imread) * 1000))
+        print(
+            "    cold cache {:8.2f} ms".format(run(cache.read_image) * 1000)
+        )
+        print(
+            "    warm cache {:8.2f} ms".format(run(cache.read_image) * 1000)
+        )
+        print("[INFO] cache: {}".format(cache.metrics()))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--num_images", type=int, default=100, help="number of images"
+    )
+    parser.add_argument(
+        "-m",
+        "--max_mb",
+        type=float,
+        default=None,
+        help="cache size limit in MB, to see the evictions",
+    )
+    arguments = parser.parse_args()
+    benchmark(arguments.num_images, max_mb=arguments.max_mb)
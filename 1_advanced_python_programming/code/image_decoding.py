@@ -0,0 +1,321 @@
+# import needed libraries
+import argparse  # needed for passing terminal arguments
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2  # import opencv
+import numpy as np
+
+try:
+    import resource  # peak memory of the process, not on Windows
+except ImportError:
+    resource = None
+
+# Decode only what the operations need. When the result is gray, the
+# image is decoded as gray, and when the result is only a preview of a
+# given size, a JPEG is decoded at 1/2, 1/4 or 1/8 of its size with the
+# IMREAD_REDUCED_* flags: libjpeg then skips most of the work, so a 24 MP
+# photo decodes many times faster, in a fraction of the memory.
+#
+# USAGE (benchmark of the decode time and peak memory)
+# python image_decoding.py --operations gray --max_size 1024 768
+# python image_decoding.py --image photo.jpg --operations flip,brighten
+
+# the decode flags for each scale, as (color flag, grayscale flag)
+REDUCED_FLAGS = {
+    1: (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE),
+    2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+    4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+}
+
+# operations of image_operations.py whose result is gray, and operations
+# that give the same result on a gray image as on a color one
+GRAY_OPERATIONS = {"gray", "canny"}
+COLOR_FREE_OPERATIONS = {"flip"}
+
+
+def exif_turned(segment):
+    """Whether the EXIF orientation of a JPEG turns the image by 90
+    degrees, so cv2.imread swaps its width and height.
+
+    Arguments:
+        segment {bytes} -- data of the APP1 segment
+
+    Returns:
+        [bool] -- True for the orientations 5 to 8
+    """
+    if segment[:6] != b"Exif\x00\x00":
+        return False
+    tiff = segment[6:]
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        return False
+    offset = struct.unpack(order + "I", tiff[4:8])[0]
+    count = struct.unpack(order + "H", tiff[offset : offset + 2])[0]
+    for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+        # tag, type, count, then a SHORT value in the first 2 bytes
+        (tag, _, _, value) = struct.unpack(
+            order + "HHIH", tiff[entry : entry + 10]
+        )
+        if tag == 0x0112:
+            return value in (5, 6, 7, 8)
+    return False
+
+
+def image_size(path):
+    """(width, height) of a JPEG or PNG image as cv2.imread gives it,
+    after the EXIF orientation, read from its header without decoding
+    the image.
+
+    Arguments:
+        path {str} -- image path
+
+    Returns:
+        [tuple] -- (width, height), or None for other formats and for
+            files that cannot be read or are cut short
+    """
+    try:
+        with open(path, "rb") as image_file:
+            return _read_size(image_file)
+    except (OSError, struct.error, IndexError):
+        # the full size decode is used, and fails on its own if it must
+        return None
+
+
+def _read_size(image_file):
+    """The size of image_size, read from an open file."""
+    head = image_file.read(24)
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", head[16:24])
+    if head[:2] != b"\xff\xd8":
+        return None
+
+    # walk the JPEG markers until the start of frame, which has the size
+    # of the image. The EXIF segment comes before it
+    turned = False
+    image_file.seek(2)
+    while True:
+        marker = image_file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + image_file.read(1)
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue  # markers without a length
+        length = struct.unpack(">H", image_file.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            (height, width) = struct.unpack(">xHH", image_file.read(5))
+            return (height, width) if turned else (width, height)
+        if code == 0xE1 and not turned:
+            turned = exif_turned(image_file.read(length - 2))
+        else:
+            image_file.seek(length - 2, os.SEEK_CUR)
+
+
+def decodes_gray(operations):
+    """Whether the operations give the same result on a gray image.
+
+    Arguments:
+        operations {list} -- operation names, applied in order
+
+    Returns:
+        [bool] -- True when a grayscale decode is enough
+    """
+    for name in operations:
+        if name in GRAY_OPERATIONS:
+            return True
+        if name not in COLOR_FREE_OPERATIONS:
+            return False
+    return False
+
+
+def reduced_scale(size, max_size):
+    """Largest JPEG scale (1, 2, 4 or 8) keeping the image at least as
+    large as max_size, so the reduced image is never upscaled later.
+
+    Arguments:
+        size {tuple} -- (width, height) of the image
+        max_size {tuple} -- (width, height) of the result
+
+    Returns:
+        [int] -- the scale
+    """
+    # only the limiting side matters, the image keeps its aspect ratio
+    ratio = min(size[0] / max_size[0], size[1] / max_size[1])
+    scale = 1
+    for candidate in (2, 4, 8):
+        if ratio >= candidate:
+            scale = candidate
+    return scale
+
+
+def decode_flags(path, operations=(), max_size=None):
+    """Choose the decode flags for an image.
+
+    Arguments:
+        path {str} -- image path
+
+    Keyword Arguments:
+        operations {list} -- operation names, applied in order
+            (default: {()})
+        max_size {tuple} -- (width, height) the result must fit in, the
+            full size is decoded when None (default: {None})
+
+    Returns:
+        [tuple] -- (cv2.imread flags, scale)
+    """
+    scale = 1
+    if max_size is not None:
+        size = image_size(path)
+        if size is not None:
+            scale = reduced_scale(size, max_size)
+    return REDUCED_FLAGS[scale][decodes_gray(operations)], scale
+
+
+def fit(img, max_size):
+    """Shrink an image to fit in max_size, keeping its aspect ratio.
+
+    Arguments:
+        img {numpy array} -- the image
+        max_size {tuple} -- (width, height)
+
+    Returns:
+        [numpy array] -- the image, shrunk when it was too large
+    """
+    (height, width) = img.shape[:2]
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    if ratio >= 1:
+        return img
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    # INTER_AREA averages the pixels, the best for shrinking
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def read_image(path, operations=(), max_size=None):
+    """Read an image, decoding only what the operations need.
+
+    Arguments:
+        path {str} -- image path
+
+    Keyword Arguments:
+        operations {list} -- operation names, applied in order
+            (default: {()})
+        max_size {tuple} -- (width, height) the image must fit in, the
+            full size is read when None (default: {None})
+
+    Returns:
+        [numpy array] -- the image, or None when it cannot be read
+    """
+    flags, _ = decode_flags(path, operations, max_size)
+    img = cv2.imread(path, flags)
+    if img is not None and max_size is not None:
+        img = fit(img, max_size)
+    return img
+
+
+def peak_rss():
+    """Peak resident memory of this process, in MB, or nan."""
+    if resource is None:
+        return float("nan")
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_decode(path, operations, max_size, repeats):
+    """Decode an image a few times. This runs in a fresh process, so the
+    peak memory is its own.
+
+    Returns:
+        [tuple] -- (seconds per decode, peak MB, MB added by decoding,
+            shape of the image)
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if operations is None:
+            img = cv2.imread(path)  # the full decode of convert_image.py
+            if max_size is not None:
+                img = fit(img, max_size)
+        else:
+            img = read_image(path, operations, max_size)
+    seconds = (time.perf_counter() - start) / repeats
+    return seconds, peak_rss(), peak_rss() - baseline, img.shape
+
+
+def benchmark(path, operations, max_size, repeats=5):
+    """Print the decode time and peak memory, full decode vs strategy.
+
+    Arguments:
+        path {str} -- image path
+        operations {list} -- operation names
+        max_size {tuple} -- (width, height) of the result, or None
+
+    Keyword Arguments:
+        repeats {int} -- decodes per measure (default: {5})
+    """
+    flags, scale = decode_flags(path, operations, max_size)
+    print(
+        "[INFO] {} {}, operations {}, max size {}: scale 1/{}, {}".format(
+            path,
+            image_size(path),
+            ",".join(operations),
+            max_size,
+            scale,
+            "gray" if decodes_gray(operations) else "color",
+        )
+    )
+    for name, ops in (("full decode", None), ("strategy", operations)):
+        # one process per measure, so the peak memory does not carry over
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            seconds, peak, added, shape = executor.submit(
+                measure_decode, path, ops, max_size, repeats
+            ).result()
+        print(
+            "    {:12s} {:8.1f} ms {:8.1f} MB peak RSS ({:+.1f} MB) "
+            "-> {}".format(name, seconds * 1000, peak, added, shape)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--image",
+        type=str,
+        default=None,
+        help="JPEG image, a synthetic 24 MP photo when not given",
+    )
+    parser.add_argument(
+        "-o",
+        "--operations",
+        type=str,
+        default="gray",
+        help="comma separated operations",
+    )
+    parser.add_argument(
+        "-m",
+        "--max_size",
+        type=int,
+        nargs=2,
+        default=[1024, 768],
+        help="width and height of the result",
+    )
+    arguments = parser.parse_args()
+
+    image_path = arguments.image
+    if image_path is None:
+        # a smooth 6000x4000 photo, noisy enough to be a real JPEG
+        rng = np.random.default_rng(0)
+        small = rng.integers(0, 255, (40, 60, 3), dtype=np.uint8)
+        photo = cv2.resize(small, (6000, 4000), interpolation=cv2.INTER_CUBIC)
+        photo = cv2.add(photo, rng.integers(0, 20, photo.shape, np.uint8))
+        image_path = os.path.join(tempfile.gettempdir(), "synthetic_24mp.jpg")
+        cv2.imwrite(image_path, photo)
+
+    names = [name.strip() for name in arguments.operations.split(",")]
+    benchmark(image_path, names, tuple(arguments.max_size))
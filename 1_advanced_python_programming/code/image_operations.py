@@ -0,0 +1,273 @@
+# import needed libraries
+import time
+import tracemalloc
+
+import cv2  # import opencv
+import numpy as np
+
+# The image operations of convert_image.py and batch_convert.py, as a
+# registry of kernels that write into an output buffer given to them.
+# OperationChain keeps one buffer per step and reuses it for the next
+# image, so converting a batch of images of the same size allocates
+# nothing once the first image is done. Brighten and darken add a
+# saturated scalar, instead of a full image of 100s.
+#
+# USAGE (benchmark of the time and memory of each operation)
+# python image_operations.py
+
+
+class Kernel:
+    """An image operation writing into a given output buffer.
+
+    Arguments:
+        function {callable} -- function(img, dst) returning dst
+        output_shape {callable} -- shape of the output for an input shape
+
+    Keyword Arguments:
+        gray_input {bool} -- the input must be a grayscale image
+            (default: {False})
+        in_place {bool} -- dst may be the input itself (default: {False})
+    """
+
+    def __init__(
+        self, function, output_shape, gray_input=False, in_place=False
+    ):
+        self.function = function
+        self.output_shape = output_shape
+        self.gray_input = gray_input
+        self.in_place = in_place
+
+    def __call__(self, img, dst):
+        return self.function(img, dst)
+
+
+def same_shape(shape):
+    return shape
+
+
+def gray_shape(shape):
+    return shape[:2]
+
+
+def to_gray(img, dst):
+    if img.ndim == 2:
+        np.copyto(dst, img)
+        return dst
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=dst)
+
+
+def flip(img, dst):
+    # same as np.fliplr, but written into dst
+    return cv2.flip(img, 1, dst=dst)
+
+
+def blur(img, dst):
+    return cv2.blur(img, (23, 23), dst=dst)
+
+
+def canny(img, dst):
+    return cv2.Canny(img, threshold1=100, threshold2=200, edges=dst)
+
+
+# the 4th value is for the alpha channel, which we leave as it is
+PIXEL_CHANGE = (100, 100, 100, 0)
+
+
+def brighten(img, dst):
+    # cv2.add saturates at 255, where uint8 numpy addition would wrap
+    return cv2.add(img, PIXEL_CHANGE, dst=dst)
+
+
+def darken(img, dst):
+    return cv2.subtract(img, PIXEL_CHANGE, dst=dst)
+
+
+OPERATIONS = {
+    "gray": Kernel(to_gray, gray_shape),
+    "flip": Kernel(flip, same_shape),
+    "blur": Kernel(blur, same_shape),
+    "canny": Kernel(canny, gray_shape, gray_input=True),
+    "brighten": Kernel(brighten, same_shape, in_place=True),
+    "darken": Kernel(darken, same_shape, in_place=True),
+}
+
+
+def parse_operations(text):
+    """Turn a comma separated list of operation names into a list.
+
+    Arguments:
+        text {str} -- for example "gray,canny,flip"
+
+    Raises:
+        ValueError: an operation name is not known
+
+    Returns:
+        [list] -- operation names
+    """
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    for name in names:
+        if name not in OPERATIONS:
+            raise ValueError(
+                "unknown operation {!r}, choose from {}".format(
+                    name, ", ".join(OPERATIONS)
+                )
+            )
+    return names
+
+
+class OperationChain:
+    """A chain of operations, with output buffers reused between images.
+
+    The returned image is one of the buffers of the chain, so it is only
+    valid until the chain is called again. Copy it to keep it.
+
+    Arguments:
+        operations {list} -- operation names, applied in order
+    """
+
+    def __init__(self, operations):
+        self.operations = list(operations)
+        self.steps = []
+        for name in self.operations:
+            kernel = OPERATIONS[name]
+            if kernel.gray_input:
+                # the color images are converted once, into a buffer
+                self.steps.append(("gray", OPERATIONS["gray"], True))
+            self.steps.append((name, kernel, False))
+        self._buffers = [None] * len(self.steps)
+        self.allocations = 0  # number of buffers allocated so far
+
+    def _buffer(self, index, shape, dtype):
+        """The output buffer of a step, allocated when the shape changes."""
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self._buffers[index] = buffer
+            self.allocations += 1
+        return buffer
+
+    def __call__(self, img, overwrite=False, timings=None):
+        """Apply the operations to an image.
+
+        Arguments:
+            img {numpy array} -- input image
+
+        Keyword Arguments:
+            overwrite {bool} -- the in place operations may write into img
+                (default: {False})
+            timings {dict} -- when given, the seconds taken by each
+                operation are added to it (default: {None})
+
+        Returns:
+            [numpy array] -- the converted image
+        """
+        # the in place operations may always write into our own buffers
+        owned = overwrite
+        for index, (name, kernel, color_only) in enumerate(self.steps):
+            if color_only and img.ndim == 2:
+                continue
+            start = time.perf_counter()
+            if kernel.in_place and owned:
+                img = kernel(img, img)
+            else:
+                dst = self._buffer(
+                    index, kernel.output_shape(img.shape), img.dtype
+                )
+                img = kernel(img, dst)
+                owned = True
+            if timings is not None and not color_only:
+                timings[name] = (
+                    timings.get(name, 0.0) + time.perf_counter() - start
+                )
+        return img
+
+
+# the operations as convert_image.py did them before, for the benchmark
+def allocating_operation(name, img):
+    pixel_change = np.ones(img.shape, dtype=np.uint8) * 100
+    gray_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if name == "gray":
+        return gray_image
+    if name == "flip":
+        return np.ascontiguousarray(np.fliplr(img))
+    if name == "blur":
+        return cv2.blur(img, (23, 23))
+    if name == "canny":
+        return cv2.Canny(gray_image, threshold1=100, threshold2=200)
+    if name == "brighten":
+        return cv2.add(img, pixel_change)
+    return cv2.subtract(img, pixel_change)
+
+
+def measure(function, images):
+    """Mean seconds and peak bytes allocated per call of function.
+
+    Arguments:
+        function {callable} -- function(img)
+        images {list} -- the images
+
+    Returns:
+        [tuple] -- (seconds per call, peak bytes allocated per call)
+    """
+    function(images[0])  # warm up, and let the chains allocate
+    tracemalloc.start()
+    peak = 0
+    for img in images:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(img)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for img in images:
+        function(img)
+    seconds = (time.perf_counter() - start) / len(images)
+    return seconds, peak
+
+
+def benchmark(num_images=50, size=(1920, 1080), seed=0):
+    """Compare the time and memory of each operation, done the old way
+    and with the kernels.
+
+    Keyword Arguments:
+        num_images {int} -- images per operation (default: {50})
+        size {tuple} -- (width, height) of the images
+            (default: {(1920, 1080)})
+        seed {int} -- random seed (default: {0})
+    """
+    rng = np.random.default_rng(seed)
+    (width, height) = size
+    images = [
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        for _ in range(num_images)
+    ]
+    print(
+        "[INFO] {} images of {}x{}, per call:".format(
+            num_images, width, height
+        )
+    )
+    print(
+        "    {:10s} {:>12s} {:>12s} {:>12s} {:>12s}".format(
+            "operation", "old ms", "old MB", "kernel ms", "kernel MB"
+        )
+    )
+    for name in OPERATIONS:
+        old_seconds, old_peak = measure(
+            lambda img: allocating_operation(name, img), images
+        )
+        chain = OperationChain([name])
+        seconds, peak = measure(chain, images)
+        print(
+            "    {:10s} {:12.3f} {:12.2f} {:12.3f} {:12.2f}".format(
+                name,
+                old_seconds * 1000,
+                old_peak / 2 ** 20,
+                seconds * 1000,
+                peak / 2 ** 20,
+            )
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -18,6 +18,7 @@ image_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 # canny_edges = cv2.Canny(image_gray, threshold1=50, threshold2=250)
 
 blurred_image = cv2.blur(img, (23,23))
+# for very large kernels (51 pixels and more), see fast_blur.py
 
 # bilateral=cv2.bilateralFilter(image,9,75,75)
 
@@ -0,0 +1,247 @@
+# import needed libraries
+import argparse  # needed for passing terminal arguments
+import time
+
+import cv2  # import opencv
+import numpy as np
+
+# Blurs for very large kernels, like the 51 to 301 pixel kernels used to
+# estimate the background of a page before thresholding it for OCR.
+#
+# - box_blur: a box filter from the integral image of the picture. Every
+#   output pixel is 4 lookups in the integral image, whatever the kernel
+#   size.
+# - gaussian_box_blur: a Gaussian blur approximated by 3 box blurs, whose
+#   sizes are chosen to give the same standard deviation.
+# - downsampled_blur: for huge kernels, the picture is shrunk, blurred
+#   with a small kernel and enlarged back. The background is smooth, so
+#   little is lost, and far fewer pixels are blurred.
+#
+# USAGE (benchmark against cv2.blur and cv2.GaussianBlur)
+# python fast_blur.py --image page.jpg --sizes 23 51 101 201 301
+
+
+def box_blur(img, ksize):
+    """Mean of the ksize x ksize box around every pixel, from the integral
+    image. The borders are reflected, like cv2.blur does.
+
+    Arguments:
+        img {numpy array} -- gray or color image
+        ksize {int} -- size of the box, in pixels
+
+    Returns:
+        [numpy array] -- the blurred image, with the type of img
+    """
+    before = ksize // 2
+    after = ksize - 1 - before
+    padded = cv2.copyMakeBorder(
+        img, before, after, before, after, cv2.BORDER_REFLECT_101
+    )
+    # 32 bit sums are exact for uint8 images below 8 million pixels
+    num_pixels = padded.shape[0] * padded.shape[1]
+    if img.dtype == np.uint8 and num_pixels < 2 ** 23:
+        sums = cv2.integral(padded, sdepth=cv2.CV_32S)
+    else:
+        sums = cv2.integral(padded, sdepth=cv2.CV_64F)
+
+    (height, width) = img.shape[:2]
+    # the sums of the boxes, in one buffer reused by every step
+    box = cv2.subtract(
+        sums[ksize:ksize + height, ksize:ksize + width],
+        sums[:height, ksize:ksize + width],
+    )
+    cv2.subtract(box, sums[ksize:ksize + height, :width], dst=box)
+    cv2.add(box, sums[:height, :width], dst=box)
+    if img.ndim == 3 and box.ndim == 2:  # cv2 drops a single channel
+        box = box[:, :, None]
+    if img.dtype == np.uint8:
+        # scaled, rounded and saturated to uint8 in one pass
+        return cv2.convertScaleAbs(box, alpha=1.0 / (ksize * ksize))
+    return (box / (ksize * ksize)).astype(img.dtype)
+
+
+def gaussian_box_sizes(sigma, passes=3):
+    """Box sizes whose repeated blurs approximate a Gaussian of standard
+    deviation sigma (W. Jarosz, "Fast image convolutions").
+
+    Arguments:
+        sigma {float} -- standard deviation of the Gaussian
+
+    Keyword Arguments:
+        passes {int} -- number of box blurs (default: {3})
+
+    Returns:
+        [list] -- odd box sizes, one per pass
+    """
+    ideal = np.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(np.floor(ideal))
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+    # number of passes with the lower size
+    num_lower = round(
+        (12 * sigma * sigma - passes * lower * lower - 4 * passes * lower
+         - 3 * passes) / (-4 * lower - 4)
+    )
+    return [lower if i < num_lower else upper for i in range(passes)]
+
+
+def gaussian_box_blur(img, sigma, passes=3):
+    """Gaussian blur approximated by repeated box blurs. The boxes are
+    done by cv2.blur, which keeps running sums, so its cost does not
+    depend on the size of the box either.
+
+    Arguments:
+        img {numpy array} -- gray or color image
+        sigma {float} -- standard deviation of the Gaussian
+
+    Keyword Arguments:
+        passes {int} -- number of box blurs (default: {3})
+
+    Returns:
+        [numpy array] -- the blurred image, with the type of img
+    """
+    # the passes are done in float, so the rounding errors do not add up
+    blurred = img.astype(np.float32)
+    for size in gaussian_box_sizes(sigma, passes):
+        cv2.blur(blurred, (size, size), dst=blurred)
+    if img.dtype == np.uint8:
+        return np.clip(np.rint(blurred), 0, 255).astype(np.uint8)
+    return blurred.astype(img.dtype)
+
+
+def downsampled_blur(img, ksize, gaussian=False, min_small_ksize=15):
+    """Blur with a huge kernel by blurring a shrunk copy of the image.
+
+    Arguments:
+        img {numpy array} -- gray or color image
+        ksize {int} -- kernel size, in pixels of img. For a Gaussian, the
+            kernel covers 3 standard deviations on each side
+
+    Keyword Arguments:
+        gaussian {bool} -- Gaussian instead of box blur (default: {False})
+        min_small_ksize {int} -- the image is shrunk as much as possible,
+            while the kernel stays at least this large (default: {15})
+
+    Returns:
+        [numpy array] -- the blurred image
+    """
+    factor = max(1, ksize // min_small_ksize)
+    (height, width) = img.shape[:2]
+    small_size = (max(1, width // factor), max(1, height // factor))
+    # INTER_AREA averages the pixels, which is a box blur already
+    small = cv2.resize(img, small_size, interpolation=cv2.INTER_AREA)
+
+    small_ksize = max(1, round(ksize / factor)) | 1
+    if gaussian:
+        small = cv2.GaussianBlur(small, (small_ksize, small_ksize), 0)
+    else:
+        small = cv2.blur(small, (small_ksize, small_ksize))
+    return cv2.resize(
+        small, (width, height), interpolation=cv2.INTER_LINEAR
+    )
+
+
+def timed(function, repeats):
+    """Mean seconds per call of function, and its last result."""
+    result = function()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def benchmark(img, sizes, repeats=5):
+    """Print the megapixels per second and the mean error of each blur,
+    for each kernel size.
+
+    Arguments:
+        img {numpy array} -- the image
+        sizes {list} -- kernel sizes
+
+    Keyword Arguments:
+        repeats {int} -- calls per measure (default: {5})
+    """
+    megapixels = img.shape[0] * img.shape[1] / 1e6
+    print(
+        "[INFO] {}x{} image, megapixels/sec (mean abs error)".format(
+            img.shape[1], img.shape[0]
+        )
+    )
+    print(
+        "    {:>6s} {:>12s} {:>18s} {:>18s} | {:>14s} {:>18s} {:>18s}"
+        .format(
+            "ksize",
+            "cv2.blur",
+            "box_blur",
+            "downsampled",
+            "GaussianBlur",
+            "gaussian_box",
+            "downsampled",
+        )
+    )
+    for ksize in sizes:
+        sigma = ksize / 6
+        rows = []
+        for reference, candidates in (
+            (
+                lambda: cv2.blur(img, (ksize, ksize)),
+                [
+                    lambda: box_blur(img, ksize),
+                    lambda: downsampled_blur(img, ksize),
+                ],
+            ),
+            (
+                lambda: cv2.GaussianBlur(img, (ksize, ksize), sigma),
+                [
+                    lambda: gaussian_box_blur(img, sigma),
+                    lambda: downsampled_blur(img, ksize, gaussian=True),
+                ],
+            ),
+        ):
+            seconds, expected = timed(reference, repeats)
+            row = ["{:12.1f}".format(megapixels / seconds)]
+            for candidate in candidates:
+                seconds, result = timed(candidate, repeats)
+                error = np.mean(
+                    np.abs(result.astype(float) - expected.astype(float))
+                )
+                row.append(
+                    "{:10.1f} ({:5.2f})".format(megapixels / seconds, error)
+                )
+            rows.append(" ".join(row))
+        print("    {:6d} {} | {}".format(ksize, rows[0], rows[1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--image",
+        type=str,
+        default=None,
+        help="image to blur, a synthetic page when not given",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[23, 51, 101, 201, 301],
+        help="kernel sizes",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.image is not None:
+        image = cv2.imread(cv2.samples.findFile(arguments.image))
+    else:
+        # a 2000x1500 page with text-like noise and uneven lighting
+        rng = np.random.default_rng(0)
+        x = np.linspace(0, 1, 2000)[None, :]
+        y = np.linspace(0, 1, 1500)[:, None]
+        light = 150 + 80 * x * y
+        text = rng.random((1500, 2000)) < 0.05
+        image = np.where(text, 30, light).astype(np.uint8)
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    benchmark(image, arguments.sizes)
@@ -43,7 +43,13 @@ arguments = parser.parse_args()  # we need the line to finish passing arguments
 
 # read the image, using cv2.imread
 path_to_image = arguments.image_path  # path to the image, from arguments
-img = cv2.imread(cv2.samples.findFile(path_to_image))
+# grayscale and edge detection only need a gray image, which cv2.imread
+# can decode directly, without making the color image first
+if arguments.operation in (1, 3):
+    read_flag = cv2.IMREAD_GRAYSCALE
+else:
+    read_flag = cv2.IMREAD_COLOR
+img = cv2.imread(cv2.samples.findFile(path_to_image), read_flag)
 
 # in case we cannot read the image
 if img is None:
@@ -52,11 +58,13 @@ if img is None:
 
 # we want to perform several operations on the image ##############
 # depending on what the user chooses ##############
-# for brightness and darkening
-pixel_change = np.ones(img.shape, dtype=np.uint8) * 100
+# for brightness and darkening, a scalar is added to every pixel
+# (the 4th value is for the alpha channel). cv2.add saturates at 255,
+# and needs no full image of 100s
+pixel_change = (100, 100, 100, 0)
 
-# multiple operations will use grayscale image, so we do it once
-gray_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+# multiple operations will use grayscale image, which was read as gray
+gray_image = img
 
 # Using if condition
 if arguments.operation == 1:  # convert to grayscale
@@ -68,7 +76,7 @@ elif arguments.operation == 3:  # edge detection
 elif arguments.operation == 4:  # brighten image
     converted_image = cv2.add(img, pixel_change)
 elif arguments.operation == 5:  # darken image
-    dark_image = cv2.subtract(img, pixel_change)
+    converted_image = cv2.subtract(img, pixel_change)
 
 
 # image_flipped_lr = np.fliplr(img)
@@ -92,7 +100,7 @@ k = cv2.waitKey(0)
 
 # if the user presses the 's' key, save the image, using cv2.imwrite
 if k == ord("s"):
-    image_save_path = argparse.save_as
+    image_save_path = arguments.save_as
     # we convert the image to another color format
     # by using the `cv2.cvtColor` function
     # We choose the grayscale format by using the `cv2.COLOR_BGR2GRAY` object.
@@ -1,29 +1,35 @@
 # import opencv
+import time
+
 import cv2
 
-# Create a VideoCapture object
+# the threaded capture and writer
+from video_pipeline import AsyncVideoWriter, FrameGrabber
+
+# Create a FrameGrabber, which reads frames from a VideoCapture object
+# on its own thread.
 # Pass the number signifying the camera into the function.
 # 0 is the first camera, or only camera.
-cap = cv2.VideoCapture(0)
+grabber = FrameGrabber(0)
 
 # Check if camera opened successfully
-if cap.isOpened() == False:
+if grabber.isOpened() == False:
     print("Error opening video stream or file")
 
-
 # Default resolutions of the frame are obtained.
 # The default resolutions are system dependent.
-# We convert the resolutions from float to integer.
-# obtain width (3) and height (4) properties of cap.
-frame_width = int(cap.get(3))
-frame_height = int(cap.get(4))
-
-# Define the codec and create VideoWriter object.
-# The output is stored in 'outpy.avi' file.
-# Define the fps to be equal to 30. Also frame size is passed.
-# the writing speed is faster than the cap reading speed so we divide by 2
-fps = 30//2
-out = cv2.VideoWriter(
+frame_width, frame_height = grabber.frame_size
+
+# start reading frames, and measure how fast the camera really is for a
+# second. The frames read meanwhile wait in the grabber buffer
+grabber.start()
+time.sleep(1.0)
+fps = grabber.fps or 30
+
+# Define the codec and create the writer, which writes on its own thread.
+# The output is stored in 'output.avi' file.
+# The fps is the measured camera fps, so the video plays at real speed.
+out = AsyncVideoWriter(
     "output.avi",
     cv2.VideoWriter_fourcc("M", "J", "P", "G"),
     fps,
@@ -31,29 +37,38 @@ out = cv2.VideoWriter(
 )
 
 # Read until video is completed
-while cap.isOpened():
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-
-    # if a frame is read successfully
-    if ret == True:
-        # Write the frame into the file 'output.avi'
-        out.write(frame)
-        # Display the resulting frame
-        cv2.imshow("Frame", frame)
-
-        # Press Q on keyboard to exit
-        frames_delay = 1  # this is essentially the duration of delay between each frame display
-        if cv2.waitKey(frames_delay) & 0xFF == ord("q"):
-            break
-
-    # Break the loop
-    else:
+while True:
+    # Take the next captured frame
+    frame = grabber.read()
+
+    # Break the loop at the end of the video
+    if frame is None:
+        break
+
+    # Queue the frame to be written into the file 'output.avi'
+    out.write(frame)
+    # Display the resulting frame
+    cv2.imshow("Frame", frame)
+
+    # Press Q on keyboard to exit
+    frames_delay = 1  # this is essentially the duration of delay between each frame display
+    if cv2.waitKey(frames_delay) & 0xFF == ord("q"):
         break
 
 # the following lines are needed to quit the program successfully
-# 1. When everything done, release the video capture object
-cap.release()
+# 1. When everything done, release the video capture and writer objects
+grabber.stop()
 out.release()
 # 2. Closes all the frames
 cv2.destroyAllWindows()
+
+print(
+    "[INFO] capture {:.1f} fps, {} frames read, {} dropped, "
+    "{} written, {} dropped by the writer".format(
+        grabber.fps,
+        grabber.frames_read,
+        grabber.buffer.dropped,
+        out.frames_written,
+        out.dropped,
+    )
+)
@@ -0,0 +1,306 @@
+# import needed libraries
+import argparse  # needed for passing terminal arguments
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2  # import opencv
+import numpy as np
+
+# A headless engine that reads videos, applies a chain of frame
+# operations and writes the result, with no window. The frames are
+# processed on a pool of processes, a chunk of frames per task, and put
+# back in order before they are written.
+#
+# USAGE
+# python video_engine.py --input input.avi --operations gray,blur,canny
+# python video_engine.py --synthetic 300 --operations gray,canny
+
+# the frame operations are the kernels of image_operations.py, in the
+# folder of the advanced python programming lessons
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.pardir,
+        os.pardir,
+        "1_advanced_python_programming",
+        "code",
+    ),
+)
+from image_operations import (  # noqa: E402
+    OPERATIONS,
+    OperationChain,
+    parse_operations,
+)
+
+
+# the operation chains of this process, kept between chunks so their
+# buffers are reused for the whole video
+_chains = {}
+
+
+def operation_chain(operations):
+    """The operation chain of this process for a list of operations."""
+    key = tuple(operations)
+    if key not in _chains:
+        _chains[key] = OperationChain(operations)
+    return _chains[key]
+
+
+def process_chunk(frames, operations):
+    """Apply the chain of operations to a chunk of frames. This runs in
+    the worker processes.
+
+    Arguments:
+        frames {list} -- frames to process
+        operations {list} -- operation names, applied in order
+
+    Returns:
+        [tuple] -- (processed frames, {operation: seconds taken})
+    """
+    chain = operation_chain(operations)
+    timings = dict.fromkeys(operations, 0.0)
+    processed = []
+    for frame in frames:
+        # the frames were sent to this process, so they may be written
+        # over. The result is a buffer of the chain, kept with a copy
+        processed.append(chain(frame, overwrite=True, timings=timings).copy())
+    return processed, timings
+
+
+def video_frames(path):
+    """Read the frames of a video file.
+
+    Arguments:
+        path {str} -- video file path
+
+    Returns:
+        [generator] -- the frames
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def video_fps(path):
+    """Frames per second of a video file.
+
+    Arguments:
+        path {str} -- video file path
+
+    Returns:
+        [float] -- the fps, None when the video does not have one
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        # 0 when the container has no fps, -1 when it cannot be read
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return fps if fps > 0 else None
+    finally:
+        cap.release()
+
+
+def synthetic_frames(num_frames, frame_size=(640, 480), seed=0):
+    """Make moving test frames, so the engine can run without a video.
+
+    Arguments:
+        num_frames {int} -- number of frames
+
+    Keyword Arguments:
+        frame_size {tuple} -- (width, height) (default: {(640, 480)})
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [generator] -- the frames
+    """
+    rng = np.random.default_rng(seed)
+    (width, height) = frame_size
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        frame = np.roll(background, 4 * i, axis=1)
+        cv2.circle(
+            frame, (i * 7 % width, height // 2), 40, (255, 255, 255), -1
+        )
+        yield frame
+
+
+class VideoEngine:
+    """Apply a chain of frame operations to videos, on a process pool.
+
+    Arguments:
+        operations {list} -- operation names, applied in order
+
+    Keyword Arguments:
+        workers {int} -- number of processes, one per cpu when None
+            (default: {None})
+        chunk_size {int} -- frames sent to a process at a time
+            (default: {8})
+        fps {float} -- fps of the output videos, when the input does not
+            have one (default: {30})
+    """
+
+    def __init__(self, operations, workers=None, chunk_size=8, fps=30):
+        self.operations = list(operations)
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.fps = fps
+
+    def run(self, frames, output_path=None, fps=None):
+        """Process frames and write them to a video.
+
+        Arguments:
+            frames {iterable} -- input frames
+
+        Keyword Arguments:
+            output_path {str} -- output video path, nothing is written when
+                None (default: {None})
+            fps {float} -- output fps (default: {None})
+
+        Returns:
+            [dict] -- the number of "frames" and the frames per second of
+                each stage: "read", each operation, "write" and "total"
+        """
+        stage_times = {"read": 0.0, "write": 0.0}
+        stage_times.update(dict.fromkeys(self.operations, 0.0))
+        writer = None
+        num_frames = 0
+        start = time.perf_counter()
+
+        def write(chunk_future):
+            nonlocal writer, num_frames
+            processed, timings = chunk_future.result()
+            for name, seconds in timings.items():
+                stage_times[name] += seconds
+
+            write_start = time.perf_counter()
+            for frame in processed:
+                if output_path is not None:
+                    if writer is None:
+                        # the operations may return gray frames
+                        (height, width) = frame.shape[:2]
+                        writer = cv2.VideoWriter(
+                            output_path,
+                            cv2.VideoWriter_fourcc("M", "J", "P", "G"),
+                            fps or self.fps,
+                            (width, height),
+                            frame.ndim == 3,
+                        )
+                    writer.write(frame)
+                num_frames += 1
+            stage_times["write"] += time.perf_counter() - write_start
+
+        # only a few chunks are in flight at a time, so the memory used
+        # does not depend on the length of the video. The chunks are
+        # written in the order they were submitted
+        max_in_flight = 2 * self.workers
+        in_flight = deque()
+        frames = iter(frames)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                read_start = time.perf_counter()
+                chunk = []
+                for frame in frames:
+                    chunk.append(frame)
+                    if len(chunk) == self.chunk_size:
+                        break
+                stage_times["read"] += time.perf_counter() - read_start
+                if not chunk:
+                    break
+
+                in_flight.append(
+                    executor.submit(process_chunk, chunk, self.operations)
+                )
+                if len(in_flight) >= max_in_flight:
+                    write(in_flight.popleft())
+
+            while in_flight:
+                write(in_flight.popleft())
+
+        if writer is not None:
+            writer.release()
+
+        total = time.perf_counter() - start
+        report = {"frames": num_frames}
+        for stage, seconds in stage_times.items():
+            report[stage] = num_frames / max(seconds, 1e-9)
+        report["total"] = num_frames / max(total, 1e-9)
+        return report
+
+
+def print_report(name, report):
+    """Print the frames per second of each stage.
+
+    Arguments:
+        name {str} -- name of the video
+        report {dict} -- report from VideoEngine.run
+    """
+    print("[INFO] {}: {} frames".format(name, report["frames"]))
+    for stage, fps in report.items():
+        if stage != "frames":
+            print("    {:10s} {:10.1f} frames/sec".format(stage, fps))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", type=str, nargs="*", default=[], help="input videos"
+    )
+    parser.add_argument(
+        "-o",
+        "--operations",
+        type=str,
+        required=True,
+        help="comma separated operations, from " + ", ".join(OPERATIONS),
+    )
+    parser.add_argument(
+        "-d",
+        "--output_dir",
+        type=str,
+        default="processed",
+        help="folder for the output videos",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of processes"
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk_size",
+        type=int,
+        default=8,
+        help="frames sent to a process at a time",
+    )
+    parser.add_argument(
+        "-s",
+        "--synthetic",
+        type=int,
+        default=0,
+        help="also process this many synthetic frames",
+    )
+    arguments = parser.parse_args()
+
+    engine = VideoEngine(
+        parse_operations(arguments.operations),
+        workers=arguments.workers,
+        chunk_size=arguments.chunk_size,
+    )
+    os.makedirs(arguments.output_dir, exist_ok=True)
+
+    for path in arguments.input:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output_path = os.path.join(arguments.output_dir, name + ".avi")
+        report = engine.run(video_frames(path), output_path, video_fps(path))
+        print_report(path, report)
+
+    if arguments.synthetic:
+        output_path = os.path.join(arguments.output_dir, "synthetic.avi")
+        report = engine.run(synthetic_frames(arguments.synthetic), output_path)
+        print_report("synthetic", report)
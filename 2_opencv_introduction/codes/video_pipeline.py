@@ -0,0 +1,224 @@
+# import needed libraries
+import threading
+import time
+from collections import deque
+
+import cv2  # import opencv
+
+
+class FrameBuffer:
+    """A bounded ring buffer of frames, shared between threads.
+    When the buffer is full, the oldest frame is dropped, so the thread
+    putting frames in never waits for the thread taking them out.
+
+    Keyword Arguments:
+        size {int} -- maximum number of frames in the buffer (default: {64})
+        drop {bool} -- drop the oldest frame when the buffer is full. When
+            False, put waits for space instead, which is what we want for
+            video files where every frame counts (default: {True})
+    """
+
+    def __init__(self, size=64, drop=True):
+        self._frames = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.drop = drop
+        self.dropped = 0  # frames dropped because the buffer was full
+
+    def put(self, frame):
+        """Add a frame, dropping the oldest frame if the buffer is full.
+        A frame put after close is ignored, and not counted as dropped.
+
+        Arguments:
+            frame {numpy array} -- the frame
+        """
+        with self._condition:
+            if not self.drop:
+                self._condition.wait_for(
+                    lambda: len(self._frames) < self._frames.maxlen
+                    or self._closed
+                )
+            if self._closed:
+                return
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Take the oldest frame, waiting for one if the buffer is empty.
+
+        Keyword Arguments:
+            timeout {float} -- seconds to wait, forever when None
+                (default: {None})
+
+        Returns:
+            [numpy array] -- the frame, or None when the buffer is closed
+                and empty, or on timeout
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._frames or self._closed, timeout
+            )
+            if self._frames:
+                frame = self._frames.popleft()
+                # wake up a put waiting for space
+                self._condition.notify_all()
+                return frame
+            return None
+
+    def close(self):
+        """Mark the end of the frames, and wake up the waiting threads."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._condition:
+            return len(self._frames)
+
+
+class FrameGrabber:
+    """Read frames from a camera or video file on its own thread.
+
+    Keyword Arguments:
+        source {int or str} -- camera number or video file path
+            (default: {0})
+        buffer_size {int} -- number of frames kept waiting to be used
+            (default: {64})
+        drop_frames {bool} -- drop the oldest frames when they are not used
+            fast enough. By default frames are dropped for cameras, and
+            not for video files (default: {None})
+    """
+
+    def __init__(self, source=0, buffer_size=64, drop_frames=None):
+        self.cap = cv2.VideoCapture(source)
+        if drop_frames is None:
+            drop_frames = isinstance(source, int)
+        self.buffer = FrameBuffer(buffer_size, drop_frames)
+        self.frames_read = 0
+        self._start_time = None
+        self._end_time = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    @property
+    def frame_size(self):
+        """(width, height) of the frames."""
+        # obtain width (3) and height (4) properties of cap.
+        return (int(self.cap.get(3)), int(self.cap.get(4)))
+
+    @property
+    def fps(self):
+        """Measured number of frames read per second."""
+        if self._start_time is None or self.frames_read == 0:
+            return 0.0
+        end_time = self._end_time or time.time()
+        return self.frames_read / (end_time - self._start_time)
+
+    def start(self):
+        """Start reading frames.
+
+        Returns:
+            [FrameGrabber] -- the grabber itself
+        """
+        self._start_time = time.time()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """Read frames until the video ends or the grabber is stopped."""
+        try:
+            while not self._stopped.is_set() and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                self.buffer.put(frame)
+                self.frames_read += 1
+        finally:
+            self._end_time = time.time()
+            self.buffer.close()
+
+    def read(self, timeout=None):
+        """Take the next frame.
+
+        Keyword Arguments:
+            timeout {float} -- seconds to wait, forever when None
+                (default: {None})
+
+        Returns:
+            [numpy array] -- the frame, or None at the end of the video
+        """
+        return self.buffer.get(timeout)
+
+    def stop(self):
+        """Stop reading and release the capture."""
+        self._stopped.set()
+        # wake up the reading thread if it waits for space in the buffer
+        self.buffer.close()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.cap.release()
+
+
+class AsyncVideoWriter:
+    """Write frames to a video file on its own thread, so encoding never
+    blocks the capture or the display.
+
+    Arguments:
+        path {str} -- output video path
+        fourcc {int} -- codec, from cv2.VideoWriter_fourcc
+        fps {float} -- frames per second of the output video
+        frame_size {tuple} -- (width, height) of the frames
+
+    Keyword Arguments:
+        buffer_size {int} -- number of frames waiting to be written
+            (default: {64})
+    """
+
+    def __init__(self, path, fourcc, fps, frame_size, buffer_size=64):
+        self.out = cv2.VideoWriter(path, fourcc, fps, frame_size)
+        self.buffer = FrameBuffer(buffer_size)
+        self.frames_written = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """Queue a frame to be written. Never blocks.
+
+        Arguments:
+            frame {numpy array} -- the frame
+        """
+        self.buffer.put(frame)
+
+    @property
+    def queued(self):
+        """Number of frames waiting to be written."""
+        return len(self.buffer)
+
+    @property
+    def dropped(self):
+        """Frames dropped because the writer could not keep up."""
+        return self.buffer.dropped
+
+    def _run(self):
+        """Write frames until the writer is released."""
+        while True:
+            frame = self.buffer.get()
+            if frame is None:
+                break
+            self.out.write(frame)
+            self.frames_written += 1
+
+    def release(self):
+        """Write the queued frames and close the video file."""
+        self.buffer.close()
+        self._thread.join()
+        self.out.release()
@@ -0,0 +1,217 @@
+"""Benchmarks for the EAST text detector
+
+Checks that the vectorized geometry decoder gives the same boxes as the
+original python loop, and times both of them. When a model is given, the
+throughput of batched detection is measured too.
+
+USAGE
+python benchmark_east.py --size 1280
+python benchmark_east.py --east frozen_east_text_detection.pb \
+    --image ../images/lazy_sheet.jpg --batch-sizes 1 4 8 16
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from east_text_detector import TextDetector, decode_predictions
+
+
+def decode_predictions_loop(scores, geometry, min_confidence=0.5):
+    """The original loop decoder, kept as the reference implementation.
+    Every value is made float32 explicitly, like the network outputs, so
+    the result does not depend on the promotion rules of the numpy
+    version.
+
+    Arguments:
+        scores {numpy array} -- score volume of shape (1, 1, rows, cols)
+        geometry {numpy array} -- geometry volume of shape (1, 5, rows, cols)
+
+    Keyword Arguments:
+        min_confidence {float} -- minimum probability of a text cell
+            (default: {0.5})
+
+    Returns:
+        [tuple] -- (rects, confidences) as python lists
+    """
+    (numRows, numCols) = scores.shape[2:4]
+    rects = []
+    confidences = []
+
+    for y in range(0, numRows):
+        scoresData = scores[0, 0, y]
+        xData0 = geometry[0, 0, y]
+        xData1 = geometry[0, 1, y]
+        xData2 = geometry[0, 2, y]
+        xData3 = geometry[0, 3, y]
+        anglesData = geometry[0, 4, y]
+
+        for x in range(0, numCols):
+            if scoresData[x] < min_confidence:
+                continue
+
+            (offsetX, offsetY) = (np.float32(x * 4.0), np.float32(y * 4.0))
+            angle = anglesData[x]
+            cos = np.cos(angle)
+            sin = np.sin(angle)
+
+            h = xData0[x] + xData2[x]
+            w = xData1[x] + xData3[x]
+
+            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
+            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
+            startX = int(np.float32(endX) - w)
+            startY = int(np.float32(endY) - h)
+
+            rects.append((startX, startY, endX, endY))
+            confidences.append(scoresData[x])
+
+    return rects, confidences
+
+
+def random_predictions(size, seed=0):
+    """Make random score and geometry volumes like the ones EAST returns
+    for a (size x size) input image.
+
+    Arguments:
+        size {int} -- input image width and height (multiple of 32)
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [tuple] -- (scores, geometry) float32 volumes
+    """
+    rng = np.random.default_rng(seed)
+    cells = size // 4
+    scores = rng.random((1, 1, cells, cells), dtype=np.float32)
+    geometry = rng.random((1, 5, cells, cells), dtype=np.float32) * 40
+    # angles are predicted between -pi/4 and pi/4
+    geometry[0, 4] = (geometry[0, 4] / 40 - 0.5) * (np.pi / 2)
+    return scores, geometry
+
+
+def check_decoding(size, min_confidence):
+    """Check that both decoders agree and print their timings.
+
+    Arguments:
+        size {int} -- input image width and height (multiple of 32)
+        min_confidence {float} -- minimum probability of a text cell
+    """
+    scores, geometry = random_predictions(size)
+
+    start = time.perf_counter()
+    loop_rects, loop_confidences = decode_predictions_loop(
+        scores, geometry, min_confidence
+    )
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rects, confidences = decode_predictions(scores, geometry, min_confidence)
+    vector_time = time.perf_counter() - start
+
+    np.testing.assert_array_equal(
+        rects, np.array(loop_rects, dtype=int).reshape(-1, 4)
+    )
+    np.testing.assert_array_equal(
+        confidences, np.array(loop_confidences, dtype=np.float32)
+    )
+
+    print(
+        "[INFO] {}x{}: {} boxes, loop {:.4f}s, vectorized {:.4f}s "
+        "({:.0f}x faster)".format(
+            size,
+            size,
+            len(rects),
+            loop_time,
+            vector_time,
+            loop_time / max(vector_time, 1e-9),
+        )
+    )
+
+
+def benchmark_batches(detector, image, batch_sizes, num_images):
+    """Print the detection throughput for each batch size.
+
+    Arguments:
+        detector {TextDetector} -- loaded text detector
+        image {numpy array} -- image to detect text in
+        batch_sizes {list} -- batch sizes to measure
+        num_images {int} -- number of images detected for each batch size
+    """
+    images = [image] * num_images
+
+    # warm up the network, the first forward pass is always slower
+    detector.detect_batch(images[:1], batch_size=1)
+
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        detector.detect_batch(images, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(
+            "[INFO] batch size {:2d}: {:.2f} images/sec".format(
+                batch_size, num_images / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-s",
+        "--size",
+        type=int,
+        nargs="+",
+        default=[320, 640, 1280],
+        help="input sizes to check (multiples of 32)",
+    )
+    ap.add_argument(
+        "-c",
+        "--min-confidence",
+        type=float,
+        default=0.5,
+        help="minimum probability required to inspect a region",
+    )
+    ap.add_argument(
+        "-east", "--east", type=str, help="path to input EAST text detector"
+    )
+    ap.add_argument(
+        "-i",
+        "--image",
+        type=str,
+        help="image for the batch benchmark, random noise if not given",
+    )
+    ap.add_argument(
+        "-b",
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 4, 8, 16],
+        help="batch sizes for the batch benchmark",
+    )
+    ap.add_argument(
+        "-n",
+        "--num-images",
+        type=int,
+        default=32,
+        help="number of images detected for each batch size",
+    )
+    args = vars(ap.parse_args())
+
+    for size in args["size"]:
+        check_decoding(size, args["min_confidence"])
+
+    if args["east"]:
+        if args["image"]:
+            image = cv2.imread(args["image"])
+        else:
+            image = np.random.randint(0, 255, (720, 540, 3), dtype=np.uint8)
+
+        detector = TextDetector(
+            args["east"], min_confidence=args["min_confidence"]
+        )
+        print("[INFO] startup took {:.6f} seconds".format(detector.load_time))
+        benchmark_batches(
+            detector, image, args["batch_sizes"], args["num_images"]
+        )
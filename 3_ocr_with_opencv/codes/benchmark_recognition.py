@@ -0,0 +1,236 @@
+"""Benchmark of the two text recognition modes
+
+Detects the text boxes of an image once, then recognizes them with one
+tesseract process per box ("roi" mode) and with a single tesseract run
+on the whole page ("page" mode). The roi mode is timed with every
+recognition backend, and the overhead of each ROI is split into the
+image encoding, which runs without tesseract, and the rest.
+
+USAGE
+python benchmark_recognition.py --image ../images/lazy_sheet.jpg \
+    --east frozen_east_text_detection.pb
+python benchmark_recognition.py --synthetic 50
+"""
+import argparse
+import shutil
+import subprocess
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+from east_text_detector import TextDetector
+from recognition import (
+    BACKENDS,
+    encode_pgm,
+    recognize_page,
+    recognize_roi,
+    recognize_rois,
+    tesserocr,
+)
+
+
+def padded_boxes(boxes, rW, rH, W, H, padding=0.05):
+    """Scale the detected boxes to the image and pad them, like
+    ocr_opencv.py does.
+
+    Arguments:
+        boxes {numpy array} -- boxes in the detector coordinates
+        rW {float} -- width ratio between the image and the detector input
+        rH {float} -- height ratio between the image and the detector input
+        W {int} -- image width
+        H {int} -- image height
+
+    Keyword Arguments:
+        padding {float} -- padding as a fraction of the box size
+            (default: {0.05})
+
+    Returns:
+        [list] -- (startX, startY, endX, endY) boxes
+    """
+    padded = []
+    for (startX, startY, endX, endY) in boxes:
+        startX = int(startX * rW)
+        startY = int(startY * rH)
+        endX = int(endX * rW)
+        endY = int(endY * rH)
+        dX = int((endX - startX) * padding)
+        dY = int((endY - startY) * padding)
+        padded.append(
+            (
+                max(0, startX - dX),
+                max(0, startY - dY),
+                min(W, endX + (dX * 2)),
+                min(H, endY + (dY * 2)),
+            )
+        )
+    return padded
+
+
+def synthetic_rois(num_rois, seed=0):
+    """Text lines like the ROIs of a warped page.
+
+    Arguments:
+        num_rois {int} -- number of ROIs
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [list] -- BGR views into a page, like the crops of the pipeline
+    """
+    rng = np.random.default_rng(seed)
+    page = np.full((40 * num_rois, 540, 3), 235, dtype=np.uint8)
+    rois = []
+    for i in range(num_rois):
+        word = "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), 8))
+        cv2.putText(
+            page,
+            word,
+            (10, 40 * i + 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1.0,
+            (20, 20, 20),
+            2,
+        )
+        rois.append(page[40 * i:40 * i + 40, 0:200])
+    return rois
+
+
+def per_roi(function, rois, repeats=3):
+    """Mean milliseconds of function on a ROI."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for roi in rois:
+            function(roi)
+    return 1000 * (time.perf_counter() - start) / (repeats * len(rois))
+
+
+def benchmark_overhead(rois):
+    """Print the time per ROI of the encoding of each backend, of a bare
+    tesseract process start, and of the recognition with each backend,
+    when tesseract is installed.
+
+    Arguments:
+        rois {list} -- image regions
+    """
+
+    def pytesseract_encode(roi):
+        # what pytesseract does before starting tesseract: a PIL image
+        # saved to a temporary PNG file, removed after the run
+        with pytesseract.pytesseract.save(roi):
+            pass
+
+    print("[INFO] {} ROIs, milliseconds per ROI".format(len(rois)))
+    print(
+        "    {:28s} {:8.3f}".format(
+            "encode, pytesseract (PNG)", per_roi(pytesseract_encode, rois)
+        )
+    )
+    print(
+        "    {:28s} {:8.3f}".format(
+            "encode, stdin (raw PGM)", per_roi(encode_pgm, rois)
+        )
+    )
+
+    if shutil.which(pytesseract.pytesseract.tesseract_cmd) is None:
+        print("[INFO] tesseract is not installed, no recognition timings")
+        return
+
+    def spawn(roi):
+        subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, "--version"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    print("    {:28s} {:8.3f}".format("start a process", per_roi(spawn, rois)))
+    for backend in BACKENDS:
+        if backend == "tesserocr" and tesserocr is None:
+            continue
+        milliseconds = per_roi(
+            lambda roi: recognize_roi(roi, backend=backend), rois
+        )
+        print(
+            "    {:28s} {:8.3f}".format(
+                "recognize, " + backend, milliseconds
+            )
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-i",
+        "--image",
+        type=str,
+        default="../images/lazy_sheet.jpg",
+        help="path to input image",
+    )
+    ap.add_argument(
+        "-east",
+        "--east",
+        type=str,
+        default="frozen_east_text_detection.pb",
+        help="path to input EAST text detector",
+    )
+    ap.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of tesseract workers in roi mode",
+    )
+    ap.add_argument(
+        "-s",
+        "--synthetic",
+        type=int,
+        default=0,
+        help="only benchmark the ROI overhead, on this many synthetic ROIs",
+    )
+    args = vars(ap.parse_args())
+
+    if args["synthetic"]:
+        benchmark_overhead(synthetic_rois(args["synthetic"]))
+        raise SystemExit
+
+    # the same page size as the warped page in ocr_opencv.py
+    image = cv2.resize(cv2.imread(args["image"]), (540, 720))
+    (H, W) = image.shape[:2]
+
+    detector = TextDetector(args["east"])
+    boxes, _ = detector.detect(image)
+    boxes = padded_boxes(
+        boxes, W / float(detector.width), H / float(detector.height), W, H
+    )
+
+    rois = [image[y1:y2, x1:x2] for (x1, y1, x2, y2) in boxes]
+    roi_times = {}
+    for backend in BACKENDS:
+        if backend == "tesserocr" and tesserocr is None:
+            continue
+        start = time.time()
+        roi_results = recognize_rois(
+            rois, workers=args["workers"], backend=backend
+        )
+        roi_times[backend] = time.time() - start
+
+    start = time.time()
+    page_results = recognize_page(image, boxes)
+    page_time = time.time() - start
+
+    same = sum(
+        roi_text.strip() == page_text.strip()
+        for (roi_text, _), (page_text, _) in zip(roi_results, page_results)
+    )
+    print("[INFO] {} boxes".format(len(boxes)))
+    for backend, roi_time in roi_times.items():
+        print(
+            "[INFO] roi mode ({}) took {:.4f} seconds".format(
+                backend, roi_time
+            )
+        )
+    print("[INFO] page mode took {:.4f} seconds".format(page_time))
+    print("[INFO] {} boxes have the same text in both modes".format(same))
+    benchmark_overhead(rois)
@@ -0,0 +1,259 @@
+"""Adaptive binarization of pages before recognition
+
+Tesseract reads black text on a white background best, and a global
+threshold fails on pages with uneven lighting. The local thresholds of
+Niblack and Sauvola use the mean and the standard deviation of a window
+around every pixel:
+
+    niblack:  T = mean + k * std
+    sauvola:  T = mean * (1 + k * (std / R - 1))
+
+The window means come from integral images of the pixels and of their
+squares, so the cost does not depend on the window size. A large page is
+split into bands of rows, binarized on a pool of threads: OpenCV and the
+large numpy operations release the GIL.
+
+USAGE (benchmark of the time per megapixel)
+python binarization.py --sizes 1 4 16 --workers 1 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+METHODS = ["sauvola", "niblack"]
+
+# the usual k of each method, for dark text on a light background
+DEFAULT_K = {"sauvola": 0.2, "niblack": -0.2}
+
+
+def _threshold_band(padded, top, bottom, window, method, k, dynamic_range):
+    """Binarize the rows top:bottom of the page, from the padded page.
+
+    Arguments:
+        padded {numpy array} -- gray page with window // 2 reflected
+            pixels on each side
+        top {int} -- first row of the band, in page coordinates
+        bottom {int} -- row after the band, in page coordinates
+        window {int} -- window size
+        method {str} -- "sauvola" or "niblack"
+        k {float} -- weight of the standard deviation
+        dynamic_range {float} -- R, the largest standard deviation
+
+    Returns:
+        [numpy array] -- the band, 255 for background and 0 for text
+    """
+    # the band with the rows of its windows above and below
+    rows = padded[top:bottom + window - 1]
+    sums, squares = cv2.integral2(rows, sdepth=cv2.CV_64F)
+
+    height = bottom - top
+    width = padded.shape[1] - window + 1
+
+    def window_sums(table):
+        return (
+            table[window:window + height, window:window + width]
+            - table[:height, window:window + width]
+            - table[window:window + height, :width]
+            + table[:height, :width]
+        )
+
+    area = float(window * window)
+    mean = window_sums(sums) / area
+    variance = window_sums(squares) / area - mean * mean
+    std = np.sqrt(np.maximum(variance, 0, out=variance), out=variance)
+
+    if method == "sauvola":
+        threshold = mean * (1 + k * (std / dynamic_range - 1))
+    else:
+        threshold = mean + k * std
+
+    half = window // 2
+    pixels = padded[top + half:bottom + half, half:half + width]
+    return np.where(pixels > threshold, 255, 0).astype(np.uint8)
+
+
+def binarize(
+    image,
+    method="sauvola",
+    window=31,
+    k=None,
+    dynamic_range=128.0,
+    band_height=256,
+    workers=None,
+):
+    """Binarize a page with a local threshold.
+
+    Arguments:
+        image {numpy array} -- gray or color page
+
+    Keyword Arguments:
+        method {str} -- "sauvola" or "niblack" (default: {"sauvola"})
+        window {int} -- size of the window around every pixel, about the
+            height of a text line (default: {31})
+        k {float} -- weight of the standard deviation. Uses the usual k
+            of the method when None (default: {None})
+        dynamic_range {float} -- R of sauvola, the largest standard
+            deviation (default: {128.0})
+        band_height {int} -- rows binarized by a thread at a time
+            (default: {256})
+        workers {int} -- number of threads. Uses the number of cpus when
+            None (default: {None})
+
+    Raises:
+        ValueError: the method is not known
+
+    Returns:
+        [numpy array] -- uint8 page, 255 for background and 0 for text
+    """
+    if method not in METHODS:
+        raise ValueError(
+            "unknown method {!r}, choose from {}".format(
+                method, ", ".join(METHODS)
+            )
+        )
+    if k is None:
+        k = DEFAULT_K[method]
+    window = window | 1  # odd, so the window is centered on the pixel
+
+    gray = image
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    half = window // 2
+    padded = cv2.copyMakeBorder(
+        gray, half, half, half, half, cv2.BORDER_REFLECT_101
+    )
+
+    height = gray.shape[0]
+    bands = [
+        (top, min(top + band_height, height))
+        for top in range(0, height, band_height)
+    ]
+    output = np.empty_like(gray)
+
+    def run(band):
+        (top, bottom) = band
+        output[top:bottom] = _threshold_band(
+            padded, top, bottom, window, method, k, dynamic_range
+        )
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(bands) == 1:
+        for band in bands:
+            run(band)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() raises the errors of the threads, if any
+            list(executor.map(run, bands))
+    return output
+
+
+def synthetic_page(size, seed=0):
+    """Gray page with dark text-like strokes and uneven lighting.
+
+    Arguments:
+        size {tuple} -- (width, height)
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [tuple] -- (page, text mask)
+    """
+    rng = np.random.default_rng(seed)
+    (width, height) = size
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    light = 120 + 120 * x * (1 - y)
+    text = np.zeros((height, width), np.uint8)
+    for row in range(20, height - 20, 30):
+        for column in range(10, width - 60, 70):
+            if rng.random() < 0.7:
+                cv2.putText(
+                    text,
+                    "word",
+                    (column, row),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    255,
+                    2,
+                )
+    page = np.where(text > 0, light * 0.4, light)
+    page = page + rng.normal(0, 4, page.shape)
+    return np.clip(page, 0, 255).astype(np.uint8), text > 0
+
+
+def benchmark(megapixel_sizes, worker_counts, repeats=3):
+    """Print the time per megapixel of each method, for pages of a few
+    sizes and a few thread counts, and how many text pixels are found.
+
+    Arguments:
+        megapixel_sizes {list} -- page sizes in megapixels
+        worker_counts {list} -- thread counts
+
+    Keyword Arguments:
+        repeats {int} -- calls per measure (default: {3})
+    """
+    for megapixels in megapixel_sizes:
+        width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+        height = int(megapixels * 1e6 / width)
+        page, text = synthetic_page((width, height))
+        print("[INFO] {}x{} page".format(width, height))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            _, otsu = cv2.threshold(
+                page, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU
+            )
+        seconds = (time.perf_counter() - start) / repeats
+        print(
+            "    {:8s} {:>2s} workers {:8.2f} ms/MP, text recall {:.2f}, "
+            "false text {:.3f}".format(
+                "otsu",
+                "",
+                1000 * seconds / megapixels,
+                np.mean(otsu[text] == 0),
+                np.mean(otsu[~text] == 0),
+            )
+        )
+        for method in METHODS:
+            for workers in worker_counts:
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    binary = binarize(page, method, workers=workers)
+                seconds = (time.perf_counter() - start) / repeats
+                print(
+                    "    {:8s} {:2d} workers {:8.2f} ms/MP, text recall "
+                    "{:.2f}, false text {:.3f}".format(
+                        method,
+                        workers,
+                        1000 * seconds / megapixels,
+                        np.mean(binary[text] == 0),
+                        np.mean(binary[~text] == 0),
+                    )
+                )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-s",
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1, 4, 16],
+        help="page sizes, in megapixels",
+    )
+    ap.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, os.cpu_count()}),
+        help="thread counts",
+    )
+    args = vars(ap.parse_args())
+    benchmark(args["sizes"], args["workers"])
@@ -0,0 +1,229 @@
+"""Text box tracking between frames
+
+When the text of consecutive video frames is recognized, the same words
+are recognized again and again. The tracker follows every text box from
+one frame to the next by IoU matching, and keeps the recognized text of
+each track with a signature of its pixels: a tiny, contrast normalized
+copy of the ROI. A box is only sent to tesseract when it is new or its
+pixels changed visibly.
+
+The detected boxes move by a pixel or two between frames, which changes
+a word as much as changing one of its letters. So the pixels of a track
+are always compared at the box where the track was recognized, not at
+the new box.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from recognition import DEFAULT_CONFIG, recognize_rois
+
+
+def iou_matrix(first, second):
+    """IoU of every box of `first` with every box of `second`.
+
+    Arguments:
+        first {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+        second {numpy array} -- (M, 4) boxes
+
+    Returns:
+        [numpy array] -- (N, M) IoU values
+    """
+    first = np.asarray(first, dtype=float).reshape(-1, 4)
+    second = np.asarray(second, dtype=float).reshape(-1, 4)
+    w = np.minimum(first[:, None, 2], second[None, :, 2]) - np.maximum(
+        first[:, None, 0], second[None, :, 0]
+    )
+    h = np.minimum(first[:, None, 3], second[None, :, 3]) - np.maximum(
+        first[:, None, 1], second[None, :, 1]
+    )
+    intersection = np.maximum(0, w) * np.maximum(0, h)
+    first_areas = (first[:, 2] - first[:, 0]) * (first[:, 3] - first[:, 1])
+    second_areas = (second[:, 2] - second[:, 0]) * (
+        second[:, 3] - second[:, 1]
+    )
+    union = first_areas[:, None] + second_areas[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def roi_signature(roi, size=(32, 8)):
+    """Signature of the pixels of a text region: a tiny grayscale copy,
+    normalized to zero mean and unit standard deviation so lighting
+    changes do not count.
+
+    Arguments:
+        roi {numpy array} -- text region
+
+    Keyword Arguments:
+        size {tuple} -- (width, height) of the copy (default: {(32, 8)})
+
+    Returns:
+        [numpy array] -- (height, width) float32 signature
+    """
+    if roi.ndim == 3:
+        roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+    small = small.astype(np.float32)
+    return (small - small.mean()) / (small.std() + 1e-6)
+
+
+class BoxTracker:
+    """Track text boxes between frames and cache their recognized text.
+
+    Keyword Arguments:
+        min_iou {float} -- minimum IoU for a box to continue a track
+            (default: {0.5})
+        max_change {float} -- mean difference between two signatures above
+            which the ROI is recognized again. Camera noise gives about
+            0.01 and a changed letter about 0.15 (default: {0.08})
+        max_missed {int} -- frames a track is kept without a matching box
+            (default: {5})
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+        workers {int} -- number of tesseract workers (default: {None})
+    """
+
+    def __init__(
+        self,
+        min_iou=0.5,
+        max_change=0.08,
+        max_missed=5,
+        config=DEFAULT_CONFIG,
+        workers=None,
+    ):
+        self.min_iou = min_iou
+        self.max_change = max_change
+        self.max_missed = max_missed
+        self.config = config
+        self.workers = workers
+
+        # every track is a dict with its "box", ROI "signature", "text", the
+        # "seconds" its recognition took, and the number of frames it was
+        # "missed"
+        self.tracks = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.recognition_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _match(self, boxes):
+        """Match the boxes with the current tracks, best IoU first.
+
+        Arguments:
+            boxes {list} -- (startX, startY, endX, endY) boxes
+
+        Returns:
+            [list] -- the track id of each box, or None when new
+        """
+        track_ids = list(self.tracks)
+        matches = [None] * len(boxes)
+        if not track_ids or not len(boxes):
+            return matches
+
+        track_boxes = [self.tracks[i]["box"] for i in track_ids]
+        iou = iou_matrix(boxes, track_boxes)
+        (rows, cols) = np.nonzero(iou >= self.min_iou)
+        used = set()
+        for k in np.argsort(-iou[rows, cols], kind="stable"):
+            (row, col) = (rows[k], cols[k])
+            if matches[row] is None and col not in used:
+                matches[row] = track_ids[col]
+                used.add(col)
+        return matches
+
+    def recognize(self, page, boxes, rois):
+        """Recognize the text of the boxes of a new frame, reusing the
+        text of the tracks whose pixels did not change.
+
+        Arguments:
+            page {numpy array} -- the frame
+            boxes {list} -- (startX, startY, endX, endY) boxes
+            rois {list} -- the ROI of each box
+
+        Returns:
+            [list] -- a (text, seconds taken) tuple for each box, in the
+                same order as the boxes. Reused text takes no time
+        """
+        with self._lock:
+            matches = self._match(boxes)
+
+            # the boxes that need tesseract
+            to_recognize = []
+            for i, track_id in enumerate(matches):
+                if track_id is not None:
+                    track = self.tracks[track_id]
+                    (startX, startY, endX, endY) = track["box"]
+                    roi = page[startY:endY, startX:endX]
+                    if roi.size:
+                        signature = roi_signature(roi)
+                        change = np.mean(
+                            np.abs(signature - track["signature"])
+                        )
+                        if change <= self.max_change:
+                            continue
+                to_recognize.append(i)
+
+            recognized = recognize_rois(
+                [rois[i] for i in to_recognize],
+                config=self.config,
+                workers=self.workers,
+            )
+            new_text = dict(zip(to_recognize, recognized))
+
+            results = []
+            seen = set()
+            for i, track_id in enumerate(matches):
+                if track_id is None:
+                    track_id = self._next_id
+                    self._next_id += 1
+                    self.tracks[track_id] = {}
+                track = self.tracks[track_id]
+                track["missed"] = 0
+                seen.add(track_id)
+
+                if i in new_text:
+                    # the track now follows the pixels of the new box
+                    (text, seconds) = new_text[i]
+                    track.update(
+                        box=tuple(int(v) for v in boxes[i]),
+                        signature=roi_signature(rois[i]),
+                        text=text,
+                        seconds=seconds,
+                    )
+                    self.misses += 1
+                    self.recognition_seconds += seconds
+                    results.append((text, seconds))
+                else:
+                    self.hits += 1
+                    self.saved_seconds += track["seconds"]
+                    results.append((track["text"], 0.0))
+
+            # forget the tracks that were not seen for a while
+            for track_id in list(self.tracks):
+                if track_id not in seen:
+                    self.tracks[track_id]["missed"] += 1
+                    if self.tracks[track_id]["missed"] > self.max_missed:
+                        del self.tracks[track_id]
+            return results
+
+    def metrics(self):
+        """Cache metrics.
+
+        Returns:
+            [dict] -- "hits", "misses", "hit_rate", "recognition_seconds"
+                spent in tesseract, "saved_seconds" estimated from the
+                first recognition of the reused tracks, and "tracks"
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "recognition_seconds": self.recognition_seconds,
+                "saved_seconds": self.saved_seconds,
+                "tracks": len(self.tracks),
+            }
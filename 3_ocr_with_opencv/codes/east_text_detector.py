@@ -3,12 +3,379 @@
 # --east frozen_east_text_detection.pb
 
 # import the necessary packages
-from imutils.object_detection import non_max_suppression
+from deskew import skew_angle, text_angles
+from nms import (
+    locality_aware_merge,
+    non_max_suppression,
+    rotated_non_max_suppression,
+)
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import argparse
+import threading
 import time
+import os
 import cv2
 
+# this part is model specific. Don't worry about the detail
+# Understand that this is how the model is applied.
+# will be different for another model type.
+# define the two output layer names for the EAST detector model that
+# we are interested -- the first is the output probabilities and the
+# second can be used to derive the bounding box coordinates of text
+LAYER_NAMES = ["feature_fusion/Conv_7/Sigmoid", "feature_fusion/concat_3"]
+
+# mean pixel values subtracted from the image when making the blob
+MEAN = (123.68, 116.78, 103.94)
+
+# loaded networks, keyed by (model path, backend, target). Each entry is
+# a (net, lock) pair: a cv2.dnn network can be shared, but only one
+# thread may run a forward pass on it at a time
+_loaded_nets = {}
+_loaded_nets_lock = threading.Lock()
+
+
+def load_east_net(
+    model="frozen_east_text_detection.pb",
+    backend=cv2.dnn.DNN_BACKEND_DEFAULT,
+    target=cv2.dnn.DNN_TARGET_CPU,
+):
+    """Load the EAST network once and return the cached copy afterwards.
+
+    Arguments:
+        model {str} -- path to the frozen east model weights
+
+    Keyword Arguments:
+        backend {int} -- cv2.dnn backend id (default: {DNN_BACKEND_DEFAULT})
+        target {int} -- cv2.dnn target id (default: {DNN_TARGET_CPU})
+
+    Returns:
+        [tuple] -- (net, lock, load_time). load_time is 0 when the network
+            was already loaded
+    """
+    key = (os.path.abspath(model), backend, target)
+    with _loaded_nets_lock:
+        if key in _loaded_nets:
+            net, lock = _loaded_nets[key]
+            return net, lock, 0.0
+
+        # load the pre-trained EAST text detector
+        print("[INFO] loading EAST text detector...")
+        start = time.time()
+        net = cv2.dnn.readNet(model)
+        net.setPreferableBackend(backend)
+        net.setPreferableTarget(target)
+        load_time = time.time() - start
+        print("[INFO] loading EAST took {:.6f} seconds".format(load_time))
+
+        lock = threading.Lock()
+        _loaded_nets[key] = (net, lock)
+        return net, lock, load_time
+
+
+class TextDetector:
+    """EAST text detector that loads the network once and can be called on
+    many images, from many threads.
+
+    Arguments:
+        model {str} -- path to the frozen east model weights
+
+    Keyword Arguments:
+        width {int} -- resized image width, multiple of 32 (default: {640})
+        height {int} -- resized image height, multiple of 32 (default: {640})
+        min_confidence {float} -- minimum probability of a text cell
+            (default: {0.5})
+        backend {int} -- cv2.dnn backend id (default: {DNN_BACKEND_DEFAULT})
+        target {int} -- cv2.dnn target id (default: {DNN_TARGET_CPU})
+        batch_size {int} -- images per forward pass in detect_batch
+            (default: {8})
+        rotated {bool} -- return rotated boxes, as (centerX, centerY,
+            width, height, angle) rows, suppressed with the rotated IoU
+            (default: {False})
+        locality_aware {bool} -- merge neighbouring boxes before the
+            suppression, as in the EAST paper. Axis-aligned boxes only
+            (default: {False})
+    """
+
+    def __init__(
+        self,
+        model="frozen_east_text_detection.pb",
+        width=640,
+        height=640,
+        min_confidence=0.5,
+        backend=cv2.dnn.DNN_BACKEND_DEFAULT,
+        target=cv2.dnn.DNN_TARGET_CPU,
+        batch_size=8,
+        rotated=False,
+        locality_aware=False,
+    ):
+        self.model = model
+        self.width = width
+        self.height = height
+        self.min_confidence = min_confidence
+        self.batch_size = batch_size
+        self.rotated = rotated
+        self.locality_aware = locality_aware
+        # startup cost, reported separately from the per image latency
+        self.net, self._lock, self.load_time = load_east_net(
+            model, backend, target
+        )
+        # time taken by the last call to detect, in seconds
+        self.last_latency = 0.0
+
+    def forward(self, blob):
+        """Run the network on a blob.
+
+        Arguments:
+            blob {numpy array} -- input blob made with cv2.dnn.blobFromImages
+
+        Returns:
+            [tuple] -- (scores, geometry) output volumes
+        """
+        with self._lock:
+            self.net.setInput(blob)
+            (scores, geometry) = self.net.forward(LAYER_NAMES)
+        return scores, geometry
+
+    def detect(self, image, return_skew=False):
+        """Detect text in an image.
+
+        Arguments:
+            image {numpy array} -- input image
+
+        Keyword Arguments:
+            return_skew {bool} -- also return the skew of the text in the
+                image, from the angles of the text cells. See deskew.py
+                (default: {False})
+
+        Returns:
+            [tuple] -- (boxes, confidences) of the kept boxes, and the skew
+                in degrees when return_skew is True. The boxes are in the
+                coordinates of the (width x height) resized image
+        """
+        start = time.time()
+        result = self._detect_chunk([image], return_skew)[0]
+
+        self.last_latency = time.time() - start
+        # show timing information on text prediction
+        print(
+            "[INFO] text detection took {:.6f} seconds".format(
+                self.last_latency
+            )
+        )
+        return result
+
+    def detect_batch(self, images, batch_size=None, return_skew=False):
+        """Detect text in many images, running one forward pass for every
+        `batch_size` images.
+
+        Arguments:
+            images {list} -- list of input images, of any size
+
+        Keyword Arguments:
+            batch_size {int} -- images per forward pass. Uses the detector
+                batch_size when None (default: {None})
+            return_skew {bool} -- add the skew of each image to its tuple
+                (default: {False})
+
+        Returns:
+            [list] -- a (boxes, confidences) tuple for each image, in the
+                same order as the images
+        """
+        batch_size = batch_size or self.batch_size
+        start = time.time()
+
+        results = []
+        for i in range(0, len(images), batch_size):
+            results.extend(
+                self._detect_chunk(images[i : i + batch_size], return_skew)
+            )
+
+        self.last_latency = time.time() - start
+        print(
+            "[INFO] text detection on {} images took {:.6f} seconds".format(
+                len(images), self.last_latency
+            )
+        )
+        return results
+
+    def detect_tiled(self, image, overlap=128, workers=None):
+        """Detect text in a large image at its full resolution. The image
+        is split into overlapping (width x height) tiles, the tiles are
+        detected one by one (or on a thread pool) and the boxes are mapped
+        back to the image and merged across the tile seams. Only the tiles
+        being detected are copied, so the memory used does not grow with
+        the image size.
+
+        Arguments:
+            image {numpy array} -- input image, of any size
+
+        Keyword Arguments:
+            overlap {int} -- overlap between neighbouring tiles in pixels,
+                rounded up to a multiple of 32. Should be larger than the
+                tallest text (default: {128})
+            workers {int} -- number of threads detecting tiles. Tiles are
+                detected one after the other when None (default: {None})
+
+        Returns:
+            [tuple] -- (boxes, confidences) of the kept boxes, in the
+                coordinates of the input image
+        """
+        start = time.time()
+        (H, W) = image.shape[:2]
+
+        # tile origins are multiples of 32, like the tile sizes
+        overlap = -(-overlap // 32) * 32
+        origins = [
+            (x, y)
+            for y in tile_origins(H, self.height, overlap)
+            for x in tile_origins(W, self.width, overlap)
+        ]
+
+        def detect_tile(origin):
+            (x, y) = origin
+            tile = image[y : y + self.height, x : x + self.width]
+            # pad the tiles at the right and bottom edges, so the tiles are
+            # not resized and the boxes keep the image scale
+            (tile_h, tile_w) = tile.shape[:2]
+            if (tile_h, tile_w) != (self.height, self.width):
+                tile = cv2.copyMakeBorder(
+                    tile,
+                    0,
+                    self.height - tile_h,
+                    0,
+                    self.width - tile_w,
+                    cv2.BORDER_CONSTANT,
+                    value=0,
+                )
+            (boxes, confidences) = self._detect_chunk([tile])[0]
+
+            # move the boxes from tile to image coordinates
+            boxes = boxes.astype(float)
+            if self.rotated:
+                boxes[:, :2] += (x, y)
+            else:
+                boxes += (x, y, x, y)
+            return boxes, confidences
+
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                tiles = list(executor.map(detect_tile, origins))
+        else:
+            tiles = [detect_tile(origin) for origin in origins]
+
+        boxes = np.concatenate([tile[0] for tile in tiles])
+        confidences = np.concatenate([tile[1] for tile in tiles])
+
+        # the same word is found in both tiles along a seam, and a word cut
+        # by a tile edge gives a partial box inside the full one. Remove
+        # both kinds of duplicates
+        if self.rotated:
+            boxes, keep = rotated_non_max_suppression(
+                boxes, confidences, return_indices=True
+            )
+        else:
+            boxes, keep = non_max_suppression(
+                boxes, confidences, return_indices=True, overlap="iou"
+            )
+            confidences = confidences[keep]
+            boxes, keep = non_max_suppression(
+                boxes,
+                confidences,
+                overlap_thresh=0.8,
+                return_indices=True,
+                overlap="min",
+            )
+        confidences = confidences[keep]
+
+        self.last_latency = time.time() - start
+        print(
+            "[INFO] text detection on {} tiles took {:.6f} seconds".format(
+                len(origins), self.last_latency
+            )
+        )
+        return boxes, confidences
+
+    def _detect_chunk(self, images, return_skew=False):
+        """Detect text in a list of images with a single forward pass.
+
+        Arguments:
+            images {list} -- list of input images
+
+        Keyword Arguments:
+            return_skew {bool} -- add the skew of each image to its tuple
+                (default: {False})
+
+        Returns:
+            [list] -- a (boxes, confidences) tuple for each image
+        """
+        # resize the images to the size expected by the network
+        resized = [
+            cv2.resize(image, (self.width, self.height)) for image in images
+        ]
+
+        # stack the images into one blob and then perform a forward pass
+        # of the model to obtain the two output layer sets
+        blob = cv2.dnn.blobFromImages(
+            resized,
+            1.0,
+            (self.width, self.height),
+            MEAN,
+            swapRB=True,
+            crop=False,
+        )
+        (scores, geometry) = self.forward(blob)
+
+        results = []
+        for i in range(len(images)):
+            result = self._suppress(scores[i : i + 1], geometry[i : i + 1])
+            if return_skew:
+                # the angles of all the text cells, not only of the kept
+                # boxes, so the median has many samples
+                angles = text_angles(
+                    scores[i : i + 1], geometry[i : i + 1], self.min_confidence
+                )
+                (H, W) = images[i].shape[:2]
+                scale = (W / float(self.width), H / float(self.height))
+                result = result + (skew_angle(angles, scale),)
+            results.append(result)
+        return results
+
+    def _suppress(self, scores, geometry):
+        """Decode the output volumes of one image and suppress the
+        overlapping boxes.
+
+        Arguments:
+            scores {numpy array} -- score volume of shape (1, 1, rows, cols)
+            geometry {numpy array} -- geometry volume of shape
+                (1, 5, rows, cols)
+
+        Returns:
+            [tuple] -- (boxes, confidences) of the kept boxes
+        """
+        if self.rotated:
+            rects, confidences = decode_rotated_predictions(
+                scores, geometry, self.min_confidence
+            )
+            boxes, keep = rotated_non_max_suppression(
+                rects, confidences, return_indices=True
+            )
+            return boxes, confidences[keep]
+
+        rects, confidences = decode_predictions(
+            scores, geometry, self.min_confidence
+        )
+        if self.locality_aware:
+            # the merged probabilities are the sum of the merged boxes
+            rects, confidences = locality_aware_merge(rects, confidences)
+
+        # apply non-maxima suppression to suppress weak, overlapping
+        # bounding boxes
+        boxes, keep = non_max_suppression(
+            rects, confidences, return_indices=True
+        )
+        return boxes, confidences[keep]
+
 
 def east_detector(
     image,
@@ -19,6 +386,7 @@ def east_detector(
 ):
     """Function that uses the east detector model for text detection.
     The code here is taken from the tutorial: https://www.pyimagesearch.com/2018/08/20/opencv-text-detection-east-text-detector/
+    The network is loaded on the first call only, see TextDetector.
 
     Arguments:
         image {numpy array} -- input image
@@ -27,101 +395,136 @@ def east_detector(
         height {int} -- resized image height (should be multiple of 32)
 
     Returns:
-        [numpy array] -- [text bounding boxes]
+        [tuple] -- (boxes, confidences). The boxes are in the coordinates
+            of the (width x height) resized image. The confidences are
+            those of the kept boxes, one per box in the same order. Before
+            TextDetector, they were the confidences of all the candidate
+            boxes, before non maximum suppression
+    """
+    detector = TextDetector(model, width, height, min_confidence)
+    return detector.detect(image)
+
+
+def tile_origins(length, tile, overlap):
+    """Start positions of overlapping tiles covering a length.
+
+    Arguments:
+        length {int} -- image width or height
+        tile {int} -- tile width or height
+        overlap {int} -- overlap between neighbouring tiles
+
+    Returns:
+        [list] -- start positions, the last tile may end past the length
+    """
+    step = max(tile - overlap, 32)
+    origins = [0]
+    while origins[-1] + tile < length:
+        origins.append(origins[-1] + step)
+    return origins
+
+
+def decode_predictions(scores, geometry, min_confidence=0.5):
+    """Decode the EAST score and geometry volumes into bounding boxes.
+    Every cell of the score map is checked at once with numpy, instead of
+    looping over the rows and columns in python.
+
+    Arguments:
+        scores {numpy array} -- score volume of shape (1, 1, rows, cols)
+        geometry {numpy array} -- geometry volume of shape (1, 5, rows, cols)
+
+    Keyword Arguments:
+        min_confidence {float} -- minimum probability of a text cell
+            (default: {0.5})
+
+    Returns:
+        [tuple] -- (rects, confidences). rects is an (N, 4) int array of
+            (startX, startY, endX, endY) and confidences an (N,) array
     """
+    scores_data = scores[0, 0]
+
+    # find the (y, x) position of every cell with sufficient probability.
+    # np.nonzero returns them in row-major order, the same order as
+    # looping over the rows and then the columns
+    (ys, xs) = np.nonzero(scores_data >= min_confidence)
+    confidences = scores_data[ys, xs]
+
+    # the distances to the top, right, bottom and left edges of the box,
+    # followed by the rotation angle, for the selected cells
+    (x_data0, x_data1, x_data2, x_data3, angles) = geometry[0][:, ys, xs]
+
+    # compute the offset factor as our resulting feature maps will
+    # be 4x smaller than the input image. Everything is kept in float32,
+    # the precision of the network outputs
+    offset_x = xs.astype(np.float32) * 4
+    offset_y = ys.astype(np.float32) * 4
+
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+
+    # use the geometry volume to derive the width and height of
+    # the bounding boxes
+    h = x_data0 + x_data2
+    w = x_data1 + x_data3
+
+    # compute both the starting and ending (x, y)-coordinates for
+    # the text prediction bounding boxes. astype(int) truncates
+    # towards zero, just like int()
+    end_x = (offset_x + (cos * x_data1) + (sin * x_data2)).astype(int)
+    end_y = (offset_y - (sin * x_data1) + (cos * x_data2)).astype(int)
+    start_x = (end_x.astype(np.float32) - w).astype(int)
+    start_y = (end_y.astype(np.float32) - h).astype(int)
+
+    rects = np.stack([start_x, start_y, end_x, end_y], axis=1)
+    return rects, confidences
+
+
+def decode_rotated_predictions(scores, geometry, min_confidence=0.5):
+    """Decode the EAST score and geometry volumes into rotated boxes,
+    keeping the angle predicted for each cell.
 
-    (H, W) = image.shape[:2]
-    # set the new width and height and then determine the ratio in change
-    # for both the width and height
-    (newW, newH) = (width, height)
-    rW = W / float(newW)
-    rH = H / float(newH)
-
-    # resize the image and grab the new image dimensions
-    image = cv2.resize(image, (newW, newH))
-    (H, W) = image.shape[:2]
-
-    # this part is model specific. Don't worry about the detail
-    # Understand that this is how the model is applied.
-    # will be different for another model type.
-    # define the two output layer names for the EAST detector model that
-    # we are interested -- the first is the output probabilities and the
-    # second can be used to derive the bounding box coordinates of text
-    layerNames = ["feature_fusion/Conv_7/Sigmoid", "feature_fusion/concat_3"]
-
-    # load the pre-trained EAST text detector
-    print("[INFO] loading EAST text detector...")
-    net = cv2.dnn.readNet(model)
-
-    # construct a blob from the image and then perform a forward pass of
-    # the model to obtain the two output layer sets
-    blob = cv2.dnn.blobFromImage(
-        image, 1.0, (W, H), (123.68, 116.78, 103.94), swapRB=True, crop=False
+    Arguments:
+        scores {numpy array} -- score volume of shape (1, 1, rows, cols)
+        geometry {numpy array} -- geometry volume of shape (1, 5, rows, cols)
+
+    Keyword Arguments:
+        min_confidence {float} -- minimum probability of a text cell
+            (default: {0.5})
+
+    Returns:
+        [tuple] -- (rects, confidences). rects is an (N, 5) float array of
+            (centerX, centerY, width, height, angle in degrees), like
+            cv2.RotatedRect, and confidences an (N,) array
+    """
+    scores_data = scores[0, 0]
+    (ys, xs) = np.nonzero(scores_data >= min_confidence)
+    confidences = scores_data[ys, xs]
+    (x_data0, x_data1, x_data2, x_data3, angles) = geometry[0][:, ys, xs]
+
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+    h = x_data0 + x_data2
+    w = x_data1 + x_data3
+
+    # the bottom right corner of the box, then the top right (p1) and
+    # bottom left (p3) corners, which are opposite corners of the box
+    offset_x = xs * 4.0 + (cos * x_data1) + (sin * x_data2)
+    offset_y = ys * 4.0 - (sin * x_data1) + (cos * x_data2)
+    p1_x = -sin * h + offset_x
+    p1_y = -cos * h + offset_y
+    p3_x = -cos * w + offset_x
+    p3_y = sin * w + offset_y
+
+    rects = np.stack(
+        [
+            0.5 * (p1_x + p3_x),
+            0.5 * (p1_y + p3_y),
+            w,
+            h,
+            -np.degrees(angles),
+        ],
+        axis=1,
     )
-    start = time.time()
-    net.setInput(blob)
-    (scores, geometry) = net.forward(layerNames)
-    end = time.time()
-
-    # show timing information on text prediction
-    print("[INFO] text detection took {:.6f} seconds".format(end - start))
-
-    # grab the number of rows and columns from the scores volume, then
-    # initialize our set of bounding box rectangles and corresponding
-    # confidence scores
-    (numRows, numCols) = scores.shape[2:4]
-    rects = []
-    confidences = []
-
-    # loop over the number of rows
-    for y in range(0, numRows):
-        # extract the scores (probabilities), followed by the geometrical
-        # data used to derive potential bounding box coordinates that
-        # surround text
-        scoresData = scores[0, 0, y]
-        xData0 = geometry[0, 0, y]
-        xData1 = geometry[0, 1, y]
-        xData2 = geometry[0, 2, y]
-        xData3 = geometry[0, 3, y]
-        anglesData = geometry[0, 4, y]
-
-        # loop over the number of columns
-        for x in range(0, numCols):
-            # if our score does not have sufficient probability, ignore it
-            if scoresData[x] < min_confidence:
-                continue
-
-            # compute the offset factor as our resulting feature maps will
-            # be 4x smaller than the input image
-            (offsetX, offsetY) = (x * 4.0, y * 4.0)
-
-            # extract the rotation angle for the prediction and then
-            # compute the sin and cosine
-            angle = anglesData[x]
-            cos = np.cos(angle)
-            sin = np.sin(angle)
-
-            # use the geometry volume to derive the width and height of
-            # the bounding box
-            h = xData0[x] + xData2[x]
-            w = xData1[x] + xData3[x]
-
-            # compute both the starting and ending (x, y)-coordinates for
-            # the text prediction bounding box
-            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
-            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
-            startX = int(endX - w)
-            startY = int(endY - h)
-
-            # add the bounding box coordinates and probability score to
-            # our respective lists
-            rects.append((startX, startY, endX, endY))
-            confidences.append(scoresData[x])
-
-    # apply non-maxima suppression to suppress weak, overlapping bounding
-    # boxes
-    boxes = non_max_suppression(np.array(rects), probs=confidences)
-    return boxes, confidences
+    return rects, confidences
 
 
 if __name__ == "__main__":
@@ -152,26 +555,43 @@ if __name__ == "__main__":
         default=640,
         help="resized image height (should be multiple of 32)",
     )
+    ap.add_argument(
+        "-t",
+        "--tiled",
+        action="store_true",
+        help="detect (width x height) tiles of the full resolution image",
+    )
     args = vars(ap.parse_args())
 
     # load the input image and grab the image dimensions
     image = cv2.imread(args["image"])
     orig = image.copy()
 
-    boxes, confidences = east_detector(
-        image,
-        args["east"],
-        args["width"],
-        args["height"],
-        min_confidence=args["min_confidence"],
-    )
+    if args["tiled"]:
+        detector = TextDetector(
+            args["east"],
+            args["width"],
+            args["height"],
+            min_confidence=args["min_confidence"],
+        )
+        boxes, confidences = detector.detect_tiled(image)
+        # the tiled boxes are already in the image coordinates
+        (rW, rH) = (1.0, 1.0)
+    else:
+        boxes, confidences = east_detector(
+            image,
+            args["east"],
+            args["width"],
+            args["height"],
+            min_confidence=args["min_confidence"],
+        )
 
-    (H, W) = image.shape[:2]
-    # set the new width and height and then determine the ratio in change
-    # for both the width and height
-    (newW, newH) = (args["width"], args["height"])
-    rW = W / float(newW)
-    rH = H / float(newH)
+        (H, W) = image.shape[:2]
+        # set the new width and height and then determine the ratio in
+        # change for both the width and height
+        (newW, newH) = (args["width"], args["height"])
+        rW = W / float(newW)
+        rH = H / float(newH)
 
     print(len(boxes))
 
@@ -1,6 +1,7 @@
 """
 lambda sort
 """
+from reading_order import group_lines
 
 
 data = [
@@ -171,3 +172,8 @@ print("\n\n\n")
 print(sorted(data, key=lambda r: r[0][1] * 720//40 + r[0][0]))
 print("\n\n\n")
 print(sorted(data, key=lambda r: r[0][1]))
+print("\n\n\n")
+# group the boxes into lines by their vertical overlap instead. This
+# does not depend on the image height or a fixed line height
+for line in group_lines([box for box, _ in data]):
+    print(" ".join(data[i][1] for i in line))
@@ -0,0 +1,465 @@
+"""Non-maximum suppression
+
+Suppression of overlapping text boxes, for the boxes from the EAST
+detector. There are three parts:
+
+1. `non_max_suppression` for axis-aligned (startX, startY, endX, endY)
+   boxes. The boxes are visited from the most to the least probable, and
+   the overlap of each kept box with the remaining boxes is computed at
+   once with numpy. The boxes are put in a grid first, so only the boxes
+   near the kept box are compared to it. By default it keeps the same
+   boxes as imutils.
+2. `rotated_non_max_suppression` for rotated boxes, given as
+   (centerX, centerY, width, height, angle) rows like cv2.RotatedRect.
+3. `locality_aware_merge`, the merging pass from the EAST paper, which
+   merges neighbouring boxes row by row before the suppression. This
+   leaves far fewer boxes for the (quadratic) suppression step.
+
+USAGE
+python nms.py --candidates 1000 10000 50000
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+
+def _iou(box, boxes, areas, box_area, overlap="iou"):
+    """IoU of one axis-aligned box against many boxes.
+
+    Arguments:
+        box {numpy array} -- (startX, startY, endX, endY)
+        boxes {numpy array} -- (N, 4) boxes
+        areas {numpy array} -- (N,) areas of the boxes
+        box_area {float} -- area of the box
+
+    Keyword Arguments:
+        overlap {str} -- "iou" for intersection over union, "min" for
+            intersection over the smaller area, which is 1 when a box is
+            inside the other, or "other" for intersection over the area
+            of each of the other boxes, as imutils does (default: {"iou"})
+
+    Returns:
+        [numpy array] -- (N,) overlap values
+    """
+    # the coordinates of the intersections. Box coordinates are pixel
+    # indices, so a box from 0 to 9 is 10 pixels wide
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    w = np.maximum(0, xx2 - xx1 + 1)
+    h = np.maximum(0, yy2 - yy1 + 1)
+    intersection = w * h
+    if overlap == "min":
+        return intersection / np.minimum(box_area, areas)
+    if overlap == "other":
+        return intersection / areas
+    return intersection / (box_area + areas - intersection)
+
+
+def _grid_neighbours(bounds):
+    """Bucket boxes into a uniform grid, so the boxes that may overlap a
+    box can be found without comparing it to every other box. A box is
+    put in every grid cell it covers.
+
+    Arguments:
+        bounds {numpy array} -- (N, 4) float boxes (startX, startY, endX, endY)
+
+    Returns:
+        [function] -- neighbours(i), the indices of the boxes that share a
+            grid cell with box i (including i, possibly repeated)
+    """
+    # a box given from its end to its start covers the same cells
+    bounds = np.hstack(
+        [
+            np.minimum(bounds[:, :2], bounds[:, 2:]),
+            np.maximum(bounds[:, :2], bounds[:, 2:]),
+        ]
+    )
+
+    # cells about the size of a typical box, so most boxes cover 1 to 4
+    # cells. Larger boxes are put in more cells
+    sizes = np.maximum(
+        bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]
+    )
+    cell_size = max(float(np.percentile(sizes, 90)), 1.0)
+
+    origin = bounds[:, :2].min(axis=0)
+    cells = np.floor((bounds - np.tile(origin, 2)) / cell_size).astype(int)
+    (cx1, cy1, cx2, cy2) = cells.T
+    num_cols = cx2.max() + 1
+
+    # one entry for every (box, covered cell) pair
+    nx = cx2 - cx1 + 1
+    counts = nx * (cy2 - cy1 + 1)
+    ids = np.repeat(np.arange(len(bounds)), counts)
+    first_entry = np.repeat(np.cumsum(counts) - counts, counts)
+    local = np.arange(counts.sum()) - first_entry
+    cell_x = cx1[ids] + local % nx[ids]
+    cell_y = cy1[ids] + local // nx[ids]
+    keys = cell_y * num_cols + cell_x
+
+    # sort the entries by cell, so the boxes in a cell are a slice
+    entry_order = np.argsort(keys, kind="stable")
+    keys = keys[entry_order]
+    ids = ids[entry_order]
+
+    def neighbours(i):
+        cols = np.arange(cx1[i], cx2[i] + 1)
+        rows = np.arange(cy1[i], cy2[i] + 1)
+        box_keys = (rows[:, None] * num_cols + cols).ravel()
+        starts = np.searchsorted(keys, box_keys, side="left")
+        ends = np.searchsorted(keys, box_keys, side="right")
+        # a box in several of these cells is listed more than once, which
+        # is cheaper to compare again than to remove
+        return np.concatenate(
+            [ids[start:end] for start, end in zip(starts, ends)]
+        )
+
+    return neighbours
+
+
+def non_max_suppression(
+    boxes,
+    probs=None,
+    overlap_thresh=0.3,
+    return_indices=False,
+    overlap="other",
+):
+    """Suppress axis-aligned boxes that overlap a more probable box.
+    With the default "other" overlap, a box is suppressed when its
+    intersection with a kept box covers more than overlap_thresh of its
+    own area, so the same boxes are kept as with
+    imutils.object_detection.non_max_suppression.
+
+    Arguments:
+        boxes {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+
+    Keyword Arguments:
+        probs {numpy array} -- (N,) box probabilities. When None, the
+            boxes are ranked by their bottom coordinate (default: {None})
+        overlap_thresh {float} -- boxes with a higher overlap than this
+            with a kept box are suppressed (default: {0.3})
+        return_indices {bool} -- also return the indices of the kept
+            boxes (default: {False})
+        overlap {str} -- overlap measure, "other", "iou" or "min", see
+            _iou (default: {"other"})
+
+    Returns:
+        [numpy array] -- (K, 4) kept boxes, most probable first. When
+            return_indices is True, a (boxes, indices) tuple
+    """
+    boxes = np.asarray(boxes)
+    if len(boxes) == 0:
+        boxes = boxes.reshape(0, 4).astype(int)
+        if return_indices:
+            return boxes, np.zeros(0, dtype=int)
+        return boxes
+
+    coords = boxes.astype(float)
+    widths = coords[:, 2] - coords[:, 0] + 1
+    heights = coords[:, 3] - coords[:, 1] + 1
+    areas = widths * heights
+
+    # visit the boxes from the highest to the lowest rank. The default
+    # sort of imutils, so tied ranks are visited in the same order
+    ranks = coords[:, 3] if probs is None else np.asarray(probs)
+    order = np.argsort(ranks)[::-1]
+    neighbours = _grid_neighbours(coords)
+
+    # boxes that were kept or suppressed already
+    done = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in order:
+        if done[i]:
+            continue
+
+        # keep the best remaining box and drop every remaining box that
+        # overlaps it too much. Only boxes near it can overlap it
+        keep.append(i)
+        done[i] = True
+        near = neighbours(i)
+        near = near[~done[near]]
+        iou = _iou(coords[i], coords[near], areas[near], areas[i], overlap)
+        done[near[iou > overlap_thresh]] = True
+
+    keep = np.array(keep, dtype=int)
+    if return_indices:
+        return boxes[keep].astype(int), keep
+    return boxes[keep].astype(int)
+
+
+def rotated_bounding_boxes(rects):
+    """Axis-aligned bounding boxes of rotated rectangles.
+
+    Arguments:
+        rects {numpy array} -- (N, 5) rows of
+            (centerX, centerY, width, height, angle in degrees)
+
+    Returns:
+        [numpy array] -- (N, 4) float boxes (startX, startY, endX, endY)
+    """
+    rects = np.asarray(rects, dtype=float)
+    angles = np.deg2rad(rects[:, 4])
+    cos = np.abs(np.cos(angles))
+    sin = np.abs(np.sin(angles))
+    half_w = 0.5 * (rects[:, 2] * cos + rects[:, 3] * sin)
+    half_h = 0.5 * (rects[:, 2] * sin + rects[:, 3] * cos)
+    return np.stack(
+        [
+            rects[:, 0] - half_w,
+            rects[:, 1] - half_h,
+            rects[:, 0] + half_w,
+            rects[:, 1] + half_h,
+        ],
+        axis=1,
+    )
+
+
+def _rotated_iou(rect, rects):
+    """IoU of one rotated rectangle against many rotated rectangles.
+
+    Arguments:
+        rect {numpy array} -- (centerX, centerY, width, height, angle)
+        rects {numpy array} -- (N, 5) rotated rectangles
+
+    Returns:
+        [numpy array] -- (N,) IoU values
+    """
+    area = rect[2] * rect[3]
+    first = ((rect[0], rect[1]), (rect[2], rect[3]), rect[4])
+    iou = np.zeros(len(rects))
+    for j, other in enumerate(rects):
+        second = ((other[0], other[1]), (other[2], other[3]), other[4])
+        (status, points) = cv2.rotatedRectangleIntersection(first, second)
+        if status == cv2.INTERSECT_NONE:
+            continue
+        intersection = cv2.contourArea(cv2.convexHull(points))
+        union = area + other[2] * other[3] - intersection
+        iou[j] = intersection / union if union > 0 else 0.0
+    return iou
+
+
+def rotated_non_max_suppression(
+    rects, probs, overlap_thresh=0.3, return_indices=False
+):
+    """Suppress rotated rectangles that overlap a more probable one.
+    The exact rotated IoU is only computed for the nearby rectangles whose
+    bounding boxes overlap enough.
+
+    Arguments:
+        rects {numpy array} -- (N, 5) rows of
+            (centerX, centerY, width, height, angle in degrees)
+        probs {numpy array} -- (N,) rectangle probabilities
+
+    Keyword Arguments:
+        overlap_thresh {float} -- rectangles with a higher IoU than this
+            with a kept rectangle are suppressed (default: {0.3})
+        return_indices {bool} -- also return the indices of the kept
+            rectangles (default: {False})
+
+    Returns:
+        [numpy array] -- (K, 5) kept rectangles, most probable first. When
+            return_indices is True, a (rects, indices) tuple
+    """
+    rects = np.asarray(rects, dtype=float)
+    if len(rects) == 0:
+        rects = rects.reshape(0, 5)
+        if return_indices:
+            return rects, np.zeros(0, dtype=int)
+        return rects
+
+    bounds = rotated_bounding_boxes(rects)
+    areas = rects[:, 2] * rects[:, 3]
+    order = np.argsort(np.asarray(probs), kind="stable")[::-1]
+    neighbours = _grid_neighbours(bounds)
+
+    done = np.zeros(len(rects), dtype=bool)
+    keep = []
+    for i in order:
+        if done[i]:
+            continue
+        keep.append(i)
+        done[i] = True
+
+        near = neighbours(i)
+        near = near[~done[near]]
+        # the rotated intersection is at most the intersection of the
+        # bounding boxes, which gives an upper bound of the IoU. Only the
+        # rectangles that may pass the threshold get the exact IoU
+        w = np.minimum(bounds[i, 2], bounds[near, 2]) - np.maximum(
+            bounds[i, 0], bounds[near, 0]
+        )
+        h = np.minimum(bounds[i, 3], bounds[near, 3]) - np.maximum(
+            bounds[i, 1], bounds[near, 1]
+        )
+        intersection = np.minimum(
+            np.maximum(0, w) * np.maximum(0, h),
+            np.minimum(areas[i], areas[near]),
+        )
+        upper_bound = intersection / np.maximum(areas[i], areas[near])
+        near = near[upper_bound > overlap_thresh]
+        iou = _rotated_iou(rects[i], rects[near])
+        done[near[iou > overlap_thresh]] = True
+
+    keep = np.array(keep, dtype=int)
+    if return_indices:
+        return rects[keep], keep
+    return rects[keep]
+
+
+def locality_aware_merge(boxes, probs, merge_thresh=0.3):
+    """Merge neighbouring boxes, as in the locality-aware NMS of the EAST
+    paper. The boxes are visited in the order they come from the detector
+    (row by row), and each box is merged into the previous one when they
+    overlap by more than `merge_thresh`. The merged coordinates are the
+    probability weighted average of the boxes, and the probabilities add
+    up.
+
+    Arguments:
+        boxes {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+        probs {numpy array} -- (N,) box probabilities
+
+    Keyword Arguments:
+        merge_thresh {float} -- minimum IoU for two boxes to be merged
+            (default: {0.3})
+
+    Returns:
+        [tuple] -- (boxes, probs) of the merged boxes, as float arrays
+    """
+    boxes = np.asarray(boxes, dtype=float)
+    probs = np.asarray(probs, dtype=float)
+    if len(boxes) == 0:
+        return boxes.reshape(0, 4), probs
+
+    # plain python floats, as the boxes are visited one at a time
+    merged_boxes = []
+    merged_probs = []
+    (x1, y1, x2, y2) = boxes[0].tolist()
+    current_prob = float(probs[0])
+    for (bx1, by1, bx2, by2), prob in zip(
+        boxes[1:].tolist(), probs[1:].tolist()
+    ):
+        w = min(x2, bx2) - max(x1, bx1) + 1
+        h = min(y2, by2) - max(y1, by1) + 1
+        intersection = max(0.0, w) * max(0.0, h)
+        union = (
+            (x2 - x1 + 1) * (y2 - y1 + 1)
+            + (bx2 - bx1 + 1) * (by2 - by1 + 1)
+            - intersection
+        )
+
+        if union > 0 and intersection / union > merge_thresh:
+            # merge the box into the current one, weighted by probability
+            total = current_prob + prob
+            x1 = (x1 * current_prob + bx1 * prob) / total
+            y1 = (y1 * current_prob + by1 * prob) / total
+            x2 = (x2 * current_prob + bx2 * prob) / total
+            y2 = (y2 * current_prob + by2 * prob) / total
+            current_prob = total
+        else:
+            merged_boxes.append((x1, y1, x2, y2))
+            merged_probs.append(current_prob)
+            (x1, y1, x2, y2) = (bx1, by1, bx2, by2)
+            current_prob = prob
+
+    merged_boxes.append((x1, y1, x2, y2))
+    merged_probs.append(current_prob)
+    return np.array(merged_boxes), np.array(merged_probs)
+
+
+def random_candidates(num_candidates, size=1280, seed=0):
+    """Make random candidate boxes, clustered like EAST cells on words.
+
+    Arguments:
+        num_candidates {int} -- number of boxes
+
+    Keyword Arguments:
+        size {int} -- image width and height (default: {1280})
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [tuple] -- (boxes, probs, angles)
+    """
+    rng = np.random.default_rng(seed)
+    # about 20 candidate cells for each word
+    num_words = max(1, num_candidates // 20)
+    words = rng.uniform(0, size - 100, (num_words, 2))
+    sizes = rng.uniform([30, 10], [100, 30], (num_words, 2))
+
+    word = rng.integers(0, num_words, num_candidates)
+    jitter = rng.normal(0, 3, (num_candidates, 4))
+    start = words[word] + jitter[:, :2]
+    end = np.maximum(words[word] + sizes[word] + jitter[:, 2:], start + 1)
+    boxes = np.hstack([start, end]).astype(int)
+    probs = rng.uniform(0.5, 1.0, num_candidates)
+    angles = rng.normal(0, 5, num_candidates)
+    return boxes, probs, angles
+
+
+def benchmark(num_candidates, repeat=3):
+    """Print the time taken by each suppression for random candidates.
+
+    Arguments:
+        num_candidates {int} -- number of candidate boxes
+
+    Keyword Arguments:
+        repeat {int} -- number of runs, the best is reported (default: {3})
+    """
+    boxes, probs, angles = random_candidates(num_candidates)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    sizes = boxes[:, 2:] - boxes[:, :2]
+    rects = np.hstack([centers, sizes, angles[:, None]])
+
+    def best_time(function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return min(times), len(result)
+
+    timings = {
+        "numpy nms": best_time(lambda: non_max_suppression(boxes, probs)),
+        "rotated nms": best_time(
+            lambda: rotated_non_max_suppression(rects, probs)
+        ),
+        "merge + nms": best_time(
+            lambda: non_max_suppression(*locality_aware_merge(boxes, probs))
+        ),
+    }
+
+    # the imutils version, which this module replaces, if installed
+    try:
+        from imutils import object_detection
+
+        timings["imutils nms"] = best_time(
+            lambda: object_detection.non_max_suppression(boxes, probs=probs)
+        )
+    except ImportError:
+        pass
+
+    for name, (seconds, kept) in timings.items():
+        print(
+            "[INFO] {:6d} candidates, {:12s}: {:.4f}s ({} kept)".format(
+                num_candidates, name, seconds, kept
+            )
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-n",
+        "--candidates",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="numbers of candidate boxes to benchmark",
+    )
+    args = vars(ap.parse_args())
+
+    for num_candidates in args["candidates"]:
+        benchmark(num_candidates)
@@ -0,0 +1,627 @@
+"""OCR pipeline
+
+The steps of ocr_opencv.py as a reusable object. The models are loaded
+once, when the pipeline is made, and the pipeline can then be called on
+many images (file paths or numpy arrays) without any window or file
+output. Each call goes through these stages:
+
+    load -> warp -> detect -> deskew -> binarize -> crop -> recognize
+        -> order -> emit
+
+and the time taken by every stage is recorded, for each call and in
+total, to find the slow stages. With a result cache, a page seen before
+skips from load straight to emit.
+
+USAGE
+python ocr_pipeline.py --image lazy_sheet.jpg \
+    --east frozen_east_text_detection.pb
+"""
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from binarization import binarize
+from deskew import deskew
+from east_text_detector import TextDetector
+from reading_order import reading_order
+from recognition import (
+    DEFAULT_BACKEND,
+    DEFAULT_CONFIG,
+    PAGE_CONFIG,
+    recognize_page,
+    recognize_rois,
+)
+from result_cache import ResultCache, content_key
+from result_writer import ResultWriter
+
+STAGES = [
+    "load",
+    "cache",
+    "warp",
+    "detect",
+    "deskew",
+    "binarize",
+    "crop",
+    "recognize",
+    "order",
+    "emit",
+]
+
+
+class OCRPipeline:
+    """Detect and recognize the text on a page.
+
+    Keyword Arguments:
+        detector {TextDetector} -- loaded text detector. One is made from
+            `model` when None (default: {None})
+        model {str} -- path to the frozen east model weights
+            (default: {"frozen_east_text_detection.pb"})
+        page_size {tuple} -- (width, height) of the warped page
+            (default: {(540, 720)})
+        padding {float} -- padding added around the text boxes, as a
+            fraction of the box size (default: {0.05})
+        recognition_mode {str} -- "roi" to recognize every box with its own
+            tesseract process, "page" to run tesseract once on the page
+            (default: {"roi"})
+        config {str} -- tesseract options. Uses the default of the
+            recognition mode when None (default: {None})
+        workers {int} -- number of tesseract workers in "roi" mode
+            (default: {None})
+        corner_finder {function} -- function returning the 4 paper corners
+            of an image, used when no corners are given. The image is only
+            resized when None (default: {None})
+        emit {function} -- function called with every result, to save or
+            send it (default: {None})
+        columns {bool} -- read the text columns of the page one after the
+            other (default: {False})
+        tracker {BoxTracker} -- box tracker reusing the text of unchanged
+            boxes between calls, for video frames. Used in "roi" mode
+            (default: {None})
+        binarization {str} -- "sauvola" or "niblack" to binarize the page
+            before recognition, None to recognize the page as it is
+            (default: {None})
+        binarization_window {int} -- window size of the binarization,
+            about the height of a text line on the page (default: {31})
+        cache {ResultCache} -- cache of the results, keyed by the image
+            and the configuration of the pipeline (default: {None})
+        backend {str} -- how the ROIs are handed to tesseract in "roi"
+            mode, see recognition.recognize_roi (default: {None})
+        pool {TesseractPool} -- started pool of warm tesseract workers,
+            used in "roi" mode instead of starting tesseract for every
+            ROI (default: {None})
+        deskewing {bool} -- rotate the page to make its text level, by
+            the skew found from the angles of the detector, before the
+            text is recognized (default: {False})
+        min_skew {float} -- smaller skews, in degrees, are not removed
+            (default: {0.5})
+    """
+
+    def __init__(
+        self,
+        detector=None,
+        model="frozen_east_text_detection.pb",
+        page_size=(540, 720),
+        padding=0.05,
+        recognition_mode="roi",
+        config=None,
+        workers=None,
+        corner_finder=None,
+        emit=None,
+        columns=False,
+        tracker=None,
+        binarization=None,
+        binarization_window=31,
+        cache=None,
+        backend=None,
+        pool=None,
+        deskewing=False,
+        min_skew=0.5,
+    ):
+        self.detector = detector or TextDetector(model)
+        self.page_size = page_size
+        self.padding = padding
+        self.recognition_mode = recognition_mode
+        if config is None and recognition_mode == "page":
+            config = PAGE_CONFIG
+        self.config = config or DEFAULT_CONFIG
+        self.workers = workers
+        self.corner_finder = corner_finder
+        self.emit_function = emit
+        self.columns = columns
+        self.tracker = tracker
+        self.binarization = binarization
+        self.binarization_window = binarization_window
+        self.cache = cache
+        self.backend = backend
+        self.pool = pool
+        self.deskewing = deskewing
+        self.min_skew = min_skew
+
+        # time spent in each stage over all the calls, and number of calls
+        self.total_timings = dict.fromkeys(STAGES, 0.0)
+        self.calls = 0
+        self._timings_lock = threading.Lock()
+
+    def load(self, image):
+        """Read an image file, or pass an image through.
+
+        Arguments:
+            image {str or numpy array} -- image path or image
+
+        Raises:
+            ValueError: the image cannot be read
+
+        Returns:
+            [numpy array] -- the image
+        """
+        if isinstance(image, str):
+            path = image
+            image = cv2.imread(path)
+            if image is None:
+                raise ValueError("Could not read the image: {}".format(path))
+        return image
+
+    def recognition_settings(self):
+        """The tesseract options and backend the text is recognized with,
+        which are the tracker's or the pool's when there is one.
+
+        Returns:
+            [tuple] -- (config, backend)
+        """
+        if self.recognition_mode == "page":
+            return self.config, "pytesseract"
+        if self.tracker is not None:
+            return self.tracker.config, DEFAULT_BACKEND
+        if self.pool is not None:
+            return self.pool.config, self.pool.backend
+        return self.config, self.backend or DEFAULT_BACKEND
+
+    def cache_config(self):
+        """Everything in the configuration that changes the results.
+
+        Returns:
+            [dict] -- JSON serializable configuration
+        """
+        (config, backend) = self.recognition_settings()
+        return {
+            "model": self.detector.model,
+            "min_confidence": self.detector.min_confidence,
+            "detector_size": [self.detector.width, self.detector.height],
+            "rotated": self.detector.rotated,
+            "locality_aware": self.detector.locality_aware,
+            "page_size": list(self.page_size),
+            "padding": self.padding,
+            "recognition_mode": self.recognition_mode,
+            "config": config,
+            "backend": backend,
+            "corner_finder": getattr(self.corner_finder, "__name__", None),
+            "columns": self.columns,
+            "binarization": self.binarization,
+            "binarization_window": self.binarization_window,
+            "deskewing": self.deskewing,
+            "min_skew": self.min_skew,
+        }
+
+    def lookup(self, image, corners=None, use_cache=True):
+        """Look an image up in the result cache.
+
+        Arguments:
+            image {numpy array} -- loaded image
+
+        Keyword Arguments:
+            corners {list} -- the paper corners given with the image
+                (default: {None})
+            use_cache {bool} -- only compute the key when False
+                (default: {True})
+
+        Returns:
+            [tuple] -- (cache key, cached result or None)
+        """
+        config = self.cache_config()
+        config["corners"] = None if corners is None else np.asarray(
+            corners, dtype=float
+        ).tolist()
+        key = content_key(image, config)
+        return key, self.cache.get(key) if use_cache else None
+
+    def warp(self, image, corners=None, find_corners=True):
+        """Warp the paper in the image to a flat page.
+
+        Arguments:
+            image {numpy array} -- input image
+
+        Keyword Arguments:
+            corners {list} -- the 4 paper corners, ordered top-left,
+                top-right, bottom-left, bottom-right. Found with the
+                corner_finder when None (default: {None})
+            find_corners {bool} -- use the corner_finder when no corners
+                are given, else only resize (default: {True})
+
+        Returns:
+            [tuple] -- (the (page_size) page, the corners used or None
+                when the image was only resized)
+        """
+        (page_w, page_h) = self.page_size
+        if corners is None and find_corners and self.corner_finder:
+            corners = self.corner_finder(image)
+        if corners is None:
+            return cv2.resize(image, (page_w, page_h)), None
+
+        new_corners = np.float32(
+            [[0, 0], [page_w, 0], [0, page_h], [page_w, page_h]]
+        )
+        # get the transformation matrix between the points
+        transform_matrix = cv2.getPerspectiveTransform(
+            np.float32(corners), new_corners
+        )
+        page = cv2.warpPerspective(image, transform_matrix, (page_w, page_h))
+        return page, np.asarray(corners, dtype=float).tolist()
+
+    def detect(self, page):
+        """Detect the text boxes on the page.
+
+        Arguments:
+            page {numpy array} -- warped page
+
+        Returns:
+            [tuple] -- ((startX, startY, endX, endY) boxes in page
+                coordinates, their confidences, skew of the text in
+                degrees, 0.0 when the pipeline does not deskew)
+        """
+        skew = 0.0
+        if self.deskewing:
+            boxes, confidences, skew = self.detector.detect(
+                page, return_skew=True
+            )
+        else:
+            boxes, confidences = self.detector.detect(page)
+
+        # the ratio in change between the page and the detector input
+        (H, W) = page.shape[:2]
+        rW = W / float(self.detector.width)
+        rH = H / float(self.detector.height)
+        boxes = [
+            (int(x1 * rW), int(y1 * rH), int(x2 * rW), int(y2 * rH))
+            for (x1, y1, x2, y2) in boxes
+        ]
+        return boxes, [float(c) for c in confidences], skew
+
+    def deskew(self, page, boxes, skew):
+        """Rotate the page and its boxes to make the text level, when the
+        skew is large enough. A rotated page is gray, as recognition only
+        reads the gray pixels, and a gray page rotates 3 times faster.
+
+        Arguments:
+            page {numpy array} -- warped page
+            boxes {list} -- (startX, startY, endX, endY) boxes
+            skew {float} -- skew of the text in degrees
+
+        Returns:
+            [tuple] -- (page, boxes, skew removed in degrees)
+        """
+        if abs(skew) >= self.min_skew and page.ndim == 3:
+            page = cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+        return deskew(page, boxes, skew, self.min_skew)
+
+    def binarize(self, page):
+        """Binarize the page for recognition, when asked to.
+
+        Arguments:
+            page {numpy array} -- warped page
+
+        Returns:
+            [numpy array] -- the binary page, or the page itself
+        """
+        if self.binarization is None:
+            return page
+        return binarize(
+            page,
+            self.binarization,
+            window=self.binarization_window,
+            workers=self.workers,
+        )
+
+    def crop(self, page, boxes):
+        """Pad the boxes and crop them from the page.
+
+        Arguments:
+            page {numpy array} -- warped page
+            boxes {list} -- (startX, startY, endX, endY) boxes
+
+        Returns:
+            [tuple] -- (padded boxes, ROIs)
+        """
+        (H, W) = page.shape[:2]
+        padded_boxes = []
+        rois = []
+        for (startX, startY, endX, endY) in boxes:
+            # in order to obtain a better OCR of the text we apply a bit
+            # of padding surrounding the bounding box
+            dX = int((endX - startX) * self.padding)
+            dY = int((endY - startY) * self.padding)
+            startX = max(0, startX - dX)
+            startY = max(0, startY - dY)
+            endX = min(W, endX + (dX * 2))
+            endY = min(H, endY + (dY * 2))
+
+            padded_boxes.append((startX, startY, endX, endY))
+            rois.append(page[startY:endY, startX:endX])
+        return padded_boxes, rois
+
+    def recognize(self, page, boxes, rois, confidences=None):
+        """Recognize the text of every box.
+
+        Arguments:
+            page {numpy array} -- warped page
+            boxes {list} -- padded boxes
+            rois {list} -- ROIs cropped from the page
+
+        Keyword Arguments:
+            confidences {list} -- detector confidence of every box
+                (default: {None})
+
+        Returns:
+            [list] -- words, as dicts with the "box", "text", detector
+                "confidence" and "seconds" taken to recognize it
+        """
+        if self.recognition_mode == "page":
+            recognized = recognize_page(page, boxes, config=self.config)
+        elif self.tracker is not None:
+            recognized = self.tracker.recognize(page, boxes, rois)
+        elif self.pool is not None:
+            recognized = self.pool.recognize(rois)
+        else:
+            recognized = recognize_rois(
+                rois,
+                config=self.config,
+                workers=self.workers,
+                backend=self.backend,
+            )
+
+        if confidences is None:
+            confidences = [None] * len(boxes)
+        words = []
+        for box, confidence, (text, seconds) in zip(
+            boxes, confidences, recognized
+        ):
+            # strip out non-ASCII text so we can draw the text on the
+            # image using OpenCV
+            text = "".join([c if ord(c) < 128 else "" for c in text]).strip()
+            words.append(
+                {
+                    "box": box,
+                    "text": text,
+                    "confidence": confidence,
+                    "seconds": seconds,
+                }
+            )
+        return words
+
+    def order(self, words):
+        """Sort the words in reading order.
+
+        Arguments:
+            words {list} -- recognized words
+
+        Returns:
+            [list] -- the words line by line from top to bottom, and from
+                left to right in a line
+        """
+        boxes = [word["box"] for word in words]
+        return [words[i] for i in reading_order(boxes, self.columns)]
+
+    def emit(self, result):
+        """Pass the result to the emit function, if any.
+
+        Arguments:
+            result {dict} -- OCR result
+        """
+        if self.emit_function is not None:
+            self.emit_function(result)
+
+    def __call__(self, image, corners=None, use_cache=True):
+        """Run all the stages on an image.
+
+        Arguments:
+            image {str or numpy array} -- image path or image
+
+        Keyword Arguments:
+            corners {list} -- the 4 paper corners (default: {None})
+            use_cache {bool} -- look the image up in the result cache, if
+                the pipeline has one. When False, the image is processed
+                again and its cached result replaced (default: {True})
+
+        Returns:
+            [dict] -- the result, with the image path as "source" (None
+                for an image array), the "words" in reading order, the
+                whole "text", the "page" image (gray when it was
+                deskewed), the paper "corners", the "skew" removed from
+                the page in degrees, the "timings" of the stages in
+                seconds, and whether it came from the "cache"
+        """
+        timings = {}
+        source = image if isinstance(image, str) else None
+
+        def timed(stage, function, *args):
+            start = time.time()
+            value = function(*args)
+            timings[stage] = time.time() - start
+            return value
+
+        image = timed("load", self.load, image)
+
+        key = cached = None
+        if self.cache is not None:
+            key, cached = timed(
+                "cache", self.lookup, image, corners, use_cache
+            )
+
+        if cached is not None:
+            # the page is warped again with the saved corners, which
+            # takes a few milliseconds and no corner finding
+            page, corners = timed(
+                "warp", self.warp, image, cached["corners"], False
+            )
+            # the saved boxes are on the deskewed page. The saved skew was
+            # large enough to be removed, or is 0.0
+            skew = cached.get("skew", 0.0)
+            if skew:
+                page, _, _ = timed("deskew", self.deskew, page, [], skew)
+            words = [
+                dict(word, box=tuple(word["box"]))
+                for word in cached["words"]
+            ]
+        else:
+            page, corners = timed("warp", self.warp, image, corners)
+            boxes, confidences, skew = timed("detect", self.detect, page)
+            page, boxes, skew = timed(
+                "deskew", self.deskew, page, boxes, skew
+            )
+            # the text is recognized on the binary page, the detector and
+            # the result keep the page in color, or gray when deskewed
+            binary = timed("binarize", self.binarize, page)
+            padded_boxes, rois = timed("crop", self.crop, binary, boxes)
+            words = timed(
+                "recognize",
+                self.recognize,
+                binary,
+                padded_boxes,
+                rois,
+                confidences,
+            )
+            words = timed("order", self.order, words)
+            if key is not None:
+                start = time.time()
+                self.cache.put(
+                    key, {"words": words, "corners": corners, "skew": skew}
+                )
+                timings["cache"] += time.time() - start
+
+        result = {
+            "source": source,
+            "words": words,
+            "text": " ".join(word["text"] for word in words),
+            "page": page,
+            "corners": corners,
+            "skew": skew,
+            "timings": timings,
+            "cache": cached is not None,
+        }
+        timed("emit", self.emit, result)
+
+        with self._timings_lock:
+            self.calls += 1
+            for stage, seconds in timings.items():
+                self.total_timings[stage] += seconds
+        return result
+
+    def timing_report(self):
+        """Average time of each stage over all the calls.
+
+        Returns:
+            [str] -- one line per stage
+        """
+        with self._timings_lock:
+            calls = max(self.calls, 1)
+            return "\n".join(
+                "{:10s} {:.6f} seconds".format(stage, seconds / calls)
+                for stage, seconds in self.total_timings.items()
+            )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-i", "--image", type=str, nargs="+", help="paths to input images"
+    )
+    ap.add_argument(
+        "-east",
+        "--east",
+        type=str,
+        default="frozen_east_text_detection.pb",
+        help="path to input EAST text detector",
+    )
+    ap.add_argument(
+        "-m",
+        "--mode",
+        type=str,
+        default="roi",
+        choices=["roi", "page"],
+        help="recognition mode",
+    )
+    ap.add_argument(
+        "-b",
+        "--binarize",
+        type=str,
+        default=None,
+        choices=["sauvola", "niblack"],
+        help="binarize the page before recognition",
+    )
+    ap.add_argument(
+        "-c",
+        "--cache",
+        type=str,
+        default=None,
+        help="SQLite file of the result cache, no cache when not given",
+    )
+    ap.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="process the images again, and replace their cached results",
+    )
+    ap.add_argument(
+        "-d",
+        "--deskew",
+        action="store_true",
+        help="rotate the page to make its text level before recognition",
+    )
+    ap.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="JSON Lines file of the results, gzip when it ends with .gz",
+    )
+    ap.add_argument(
+        "--tsv", type=str, default=None, help="TSV file of the words"
+    )
+    ap.add_argument(
+        "--hocr_dir", type=str, default=None, help="folder of hOCR files"
+    )
+    ap.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="skip the images already in the output, and add to it",
+    )
+    args = vars(ap.parse_args())
+
+    cache = ResultCache(args["cache"]) if args["cache"] else None
+    writer = None
+    if args["output"]:
+        writer = ResultWriter(
+            args["output"], args["tsv"], args["hocr_dir"], args["resume"]
+        )
+    pipeline = OCRPipeline(
+        model=args["east"],
+        recognition_mode=args["mode"],
+        binarization=args["binarize"],
+        cache=cache,
+        deskewing=args["deskew"],
+        emit=writer,
+    )
+    for path in args["image"]:
+        if writer is not None and path in writer.written:
+            continue
+        print(pipeline(path, use_cache=not args["no_cache"])["text"])
+
+    print("[INFO] average stage timings")
+    print(pipeline.timing_report())
+    if cache is not None:
+        print("[INFO] cache: {}".format(cache.metrics()))
+    if writer is not None:
+        writer.close()
+        print("[INFO] writer: {}".format(writer.metrics()))
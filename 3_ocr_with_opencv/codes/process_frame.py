@@ -1,6 +1,10 @@
 """Script to process frame
 """
+import argparse
+import time
+
 import cv2
+import numpy as np
 
 
 def get_paper_corners(frame):
@@ -46,5 +50,192 @@ def get_paper_corners(frame):
     return corners
 
 
+def order_corners(corners):
+    """Order 4 corner points as top-left, top-right, bottom-left and
+    bottom-right, the order used to warp the paper.
+
+    Arguments:
+        corners {list} -- 4 (x, y) points in any order
+
+    Returns:
+        [numpy array] -- (4, 2) float32 ordered corners
+    """
+    corners = np.float32(corners).reshape(4, 2)
+    # walk around the centroid. With y pointing down, a growing angle
+    # turns clockwise on the screen: top-left, top-right, bottom-right,
+    # bottom-left. Unlike sorting by x + y and y - x, this never picks
+    # the same corner twice, even for a paper held at 45 degrees
+    center = corners.mean(axis=0)
+    angles = np.arctan2(corners[:, 1] - center[1], corners[:, 0] - center[0])
+    corners = corners[np.argsort(angles, kind="stable")]
+
+    # start from the top-left corner, the smallest x + y. For a paper at
+    # 45 degrees, two corners tie and the higher one is taken
+    sums = corners.sum(axis=1)
+    start = np.lexsort((corners[:, 1], sums))[0]
+    (top_left, top_right, bottom_right, bottom_left) = np.roll(
+        corners, -start, axis=0
+    )
+    return np.float32([top_left, top_right, bottom_left, bottom_right])
+
+
+def find_paper_corners(frame, max_size=500):
+    """Find the corners of a sheet of paper automatically. The paper is
+    taken to be the largest 4 sided contour of the edges of the image. The
+    search is done on a copy of the image downscaled to `max_size`
+    pixels, which is much faster and good enough for the corners.
+
+    Arguments:
+        frame {numpy array} -- input frame or image
+
+    Keyword Arguments:
+        max_size {int} -- largest side of the downscaled copy
+            (default: {500})
+
+    Returns:
+        [tuple] -- (corners, confidence). corners is a (4, 2) float32 array
+            of ordered corners in frame coordinates, or None when no paper
+            was found. confidence is the fraction of the image covered by
+            the paper, 0 when not found
+    """
+    (H, W) = frame.shape[:2]
+    scale = min(1.0, max_size / float(max(H, W)))
+    small = cv2.resize(frame, (int(W * scale), int(H * scale)))
+
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+
+    # detect paper edges, and close small gaps in them
+    edges = cv2.Canny(small, threshold1=50, threshold2=150)
+    edges = cv2.dilate(edges, None)
+
+    contours, _ = cv2.findContours(
+        edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    image_area = float(small.shape[0] * small.shape[1])
+
+    # check the largest contours first, the first one with 4 sides is
+    # taken as the paper
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        perimeter = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            corners = order_corners(approx) / scale
+            confidence = cv2.contourArea(approx) / image_area
+            return corners, confidence
+
+    return None, 0.0
+
+
+def get_paper_corners_auto(frame, min_confidence=0.2, max_size=500):
+    """Find the paper corners automatically, and ask the user to click
+    them only when the paper is not found with enough confidence.
+
+    Arguments:
+        frame {numpy array} -- input frame or image
+
+    Keyword Arguments:
+        min_confidence {float} -- minimum fraction of the image covered by
+            the paper (default: {0.2})
+        max_size {int} -- largest side of the downscaled copy
+            (default: {500})
+
+    Returns:
+        [numpy array] -- (4, 2) float32 ordered corners
+    """
+    corners, confidence = find_paper_corners(frame, max_size)
+    if corners is None or confidence < min_confidence:
+        print(
+            "[INFO] paper not found (confidence {:.2f}), "
+            "please click the 4 corners".format(confidence)
+        )
+        corners = order_corners(get_paper_corners(frame)[:4])
+    return corners
+
+
+def synthetic_page(size=(1600, 1200), seed=0):
+    """Make an image of a page of text on a dark table, seen in
+    perspective.
+
+    Keyword Arguments:
+        size {tuple} -- (width, height) of the image
+            (default: {(1600, 1200)})
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [tuple] -- (image, corners). corners are the ordered page corners
+    """
+    rng = np.random.default_rng(seed)
+    (W, H) = size
+    page = np.full((1100, 850, 3), 235, dtype=np.uint8)
+    # lines of "words"
+    for y in range(80, 1020, 40):
+        x = 60
+        while x < 760:
+            w = int(rng.integers(30, 120))
+            end = (min(x + w, 790), y + 18)
+            cv2.rectangle(page, (x, y), end, (40, 40, 40), -1)
+            x += w + 20
+
+    # random page corners, roughly in the middle of the image
+    margin = rng.uniform(0.05, 0.2, (4, 2)) * (W, H)
+    corners = np.float32(
+        [
+            margin[0],
+            (W - margin[1][0], margin[1][1]),
+            (margin[2][0], H - margin[2][1]),
+            (W - margin[3][0], H - margin[3][1]),
+        ]
+    )
+    page_corners = np.float32([[0, 0], [850, 0], [0, 1100], [850, 1100]])
+    transform_matrix = cv2.getPerspectiveTransform(page_corners, corners)
+
+    table = rng.integers(30, 80, (H, W, 3), dtype=np.uint8)
+    image = cv2.warpPerspective(
+        page,
+        transform_matrix,
+        (W, H),
+        dst=table,
+        borderMode=cv2.BORDER_TRANSPARENT,
+    )
+    return image, corners
+
+
 if __name__ == "__main__":
-    pass
+    # benchmark the automatic corner detection on synthetic pages
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-n", "--pages", type=int, default=20, help="number of pages"
+    )
+    ap.add_argument(
+        "-s",
+        "--max-size",
+        type=int,
+        nargs="+",
+        default=[250, 500, 1000, 4000],
+        help="largest side of the downscaled copies",
+    )
+    args = vars(ap.parse_args())
+
+    pages = [synthetic_page(seed=seed) for seed in range(args["pages"])]
+    for max_size in args["max_size"]:
+        errors = []
+        found = 0
+        start = time.perf_counter()
+        for image, true_corners in pages:
+            corners, confidence = find_paper_corners(image, max_size)
+            if corners is not None:
+                found += 1
+                errors.append(np.abs(corners - true_corners).max())
+        elapsed = (time.perf_counter() - start) / len(pages)
+        print(
+            "[INFO] max size {:4d}: {:.2f} ms per page, found {}/{}, "
+            "max corner error {:.1f} px".format(
+                max_size,
+                elapsed * 1000,
+                found,
+                len(pages),
+                max(errors) if errors else float("nan"),
+            )
+        )
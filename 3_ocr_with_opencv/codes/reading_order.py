@@ -0,0 +1,221 @@
+"""Reading order of text boxes
+
+Puts the (startX, startY, endX, endY) boxes of the recognized words in
+the order a person would read them: lines from top to bottom, words in a
+line from left to right and, for pages with several columns, the columns
+from left to right.
+
+Lines are found with a sweep over the boxes sorted by their top edge. A
+box joins an open line when it overlaps the line vertically, so slightly
+skewed lines stay together, without comparing every pair of boxes. A box
+much taller or shorter than the line, like a figure or a drop cap, does
+not join it, so it cannot pull the words beside it into one line.
+
+USAGE
+python reading_order.py --boxes 1000 10000 50000
+"""
+import argparse
+import time
+
+import numpy as np
+
+
+def group_lines(boxes, min_overlap=0.5, max_height_ratio=2.0):
+    """Group boxes into lines of text.
+
+    Arguments:
+        boxes {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+
+    Keyword Arguments:
+        min_overlap {float} -- minimum vertical overlap between a box and a
+            line, as a fraction of the smaller height, for the box to join
+            the line (default: {0.5})
+        max_height_ratio {float} -- a box and a line whose heights differ
+            by more than this ratio are not joined (default: {2.0})
+
+    Returns:
+        [list] -- lines from top to bottom, each a list of box indices from
+            left to right
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    order = np.argsort(boxes[:, 1], kind="stable")
+
+    # each line is [top, bottom, number of boxes, box indices]. The top
+    # and bottom are the mean of the box edges, so the line follows the
+    # text instead of growing with every box
+    lines = []
+    # indices of the lines that can still be joined
+    open_lines = []
+    for i in order.tolist():
+        (_, top, _, bottom) = boxes[i]
+        height = bottom - top
+
+        # the lines are opened from top to bottom, so a line that ends
+        # above this box cannot be joined by any later box either
+        open_lines = [j for j in open_lines if lines[j][1] > top]
+
+        best = None
+        best_overlap = 0.0
+        for j in open_lines:
+            (line_top, line_bottom) = lines[j][:2]
+            line_height = line_bottom - line_top
+            if max(height, line_height) > max_height_ratio * max(
+                min(height, line_height), 1e-9
+            ):
+                continue
+            overlap = min(bottom, line_bottom) - max(top, line_top)
+            smaller = max(min(height, line_height), 1e-9)
+            if overlap / smaller >= min_overlap and overlap > best_overlap:
+                best = j
+                best_overlap = overlap
+
+        if best is None:
+            open_lines.append(len(lines))
+            lines.append([top, bottom, 1, [i]])
+        else:
+            line = lines[best]
+            count = line[2] + 1
+            line[0] += (top - line[0]) / count
+            line[1] += (bottom - line[1]) / count
+            line[2] = count
+            line[3].append(i)
+
+    # order the lines by their mean top edge and the words by x
+    lines.sort(key=lambda line: line[0])
+    return [
+        sorted(line[3], key=lambda i: (boxes[i, 0], boxes[i, 1]))
+        for line in lines
+    ]
+
+
+def find_columns(boxes, min_gap=None):
+    """Find the text columns of a page, separated by vertical gaps with no
+    text.
+
+    Arguments:
+        boxes {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+
+    Keyword Arguments:
+        min_gap {float} -- narrowest gap between two columns, in pixels.
+            Uses 3 times the median box height when None (default: {None})
+
+    Returns:
+        [numpy array] -- x positions of the column separators, from left
+            to right. Empty for a single column
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0)
+    if min_gap is None:
+        min_gap = 3 * np.median(boxes[:, 3] - boxes[:, 1])
+
+    # sweep over the box starts and ends along x. A gap is where the
+    # number of boxes covering x drops to zero
+    starts = np.sort(boxes[:, 0])
+    ends = np.sort(boxes[:, 2])
+    positions = np.concatenate([starts, ends])
+    steps = np.concatenate([np.ones(len(starts)), -np.ones(len(ends))])
+    # at the same x, count the starts before the ends, so touching
+    # boxes do not leave a gap
+    order = np.lexsort((-steps, positions))
+    positions = positions[order]
+    coverage = np.cumsum(steps[order])
+
+    # every place the coverage drops to zero is followed by the next start
+    empty = np.nonzero(coverage[:-1] == 0)[0]
+    gap_starts = positions[empty]
+    gap_ends = positions[empty + 1]
+    wide = gap_ends - gap_starts >= min_gap
+    return (gap_starts[wide] + gap_ends[wide]) / 2
+
+
+def reading_order(
+    boxes, columns=False, min_overlap=0.5, min_gap=None, max_height_ratio=2.0
+):
+    """Order boxes for reading.
+
+    Arguments:
+        boxes {numpy array} -- (N, 4) boxes as (startX, startY, endX, endY)
+
+    Keyword Arguments:
+        columns {bool} -- read the columns of the page one after the other
+            (default: {False})
+        min_overlap {float} -- see group_lines (default: {0.5})
+        min_gap {float} -- see find_columns (default: {None})
+        max_height_ratio {float} -- see group_lines (default: {2.0})
+
+    Returns:
+        [list] -- box indices in reading order
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    if len(boxes) == 0:
+        return []
+
+    if columns:
+        separators = find_columns(boxes, min_gap)
+        centers = (boxes[:, 0] + boxes[:, 2]) / 2
+        column_of_box = np.searchsorted(separators, centers)
+    else:
+        column_of_box = np.zeros(len(boxes), dtype=int)
+
+    order = []
+    for column in np.unique(column_of_box):
+        indices = np.nonzero(column_of_box == column)[0]
+        for line in group_lines(
+            boxes[indices], min_overlap, max_height_ratio
+        ):
+            order.extend(indices[line].tolist())
+    return order
+
+
+def random_page(num_boxes, seed=0, skew=0.02, columns=2):
+    """Make the boxes of a page of text with skewed lines, in random order.
+
+    Arguments:
+        num_boxes {int} -- number of boxes
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+        skew {float} -- slope of the lines (default: {0.02})
+        columns {int} -- number of text columns (default: {2})
+
+    Returns:
+        [numpy array] -- (num_boxes, 4) boxes
+    """
+    rng = np.random.default_rng(seed)
+    words_per_line = 8
+    line = np.arange(num_boxes) // (words_per_line * columns)
+    column = (np.arange(num_boxes) // words_per_line) % columns
+    word = np.arange(num_boxes) % words_per_line
+
+    x = column * 600 + word * 65 + rng.uniform(0, 5, num_boxes)
+    y = line * 30 + x * skew + rng.uniform(0, 2, num_boxes)
+    w = rng.uniform(30, 55, num_boxes)
+    h = rng.uniform(16, 20, num_boxes)
+    boxes = np.stack([x, y, x + w, y + h], axis=1)
+    return boxes[rng.permutation(num_boxes)]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-n",
+        "--boxes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="numbers of boxes to order",
+    )
+    args = vars(ap.parse_args())
+
+    for num_boxes in args["boxes"]:
+        boxes = random_page(num_boxes)
+        start = time.perf_counter()
+        order = reading_order(boxes, columns=True)
+        elapsed = time.perf_counter() - start
+        lines = len(group_lines(boxes))
+        print(
+            "[INFO] {:6d} boxes: {:.4f}s, {} lines, {} columns".format(
+                num_boxes, elapsed, lines, len(find_columns(boxes)) + 1
+            )
+        )
@@ -0,0 +1,422 @@
+"""Text recognition with pytesseract
+
+Every call to pytesseract starts a tesseract process, which mostly waits
+for the process to finish. There are two ways to recognize the text in
+the boxes from the text detector:
+
+1. `recognize_rois` crops every box (ROI) and recognizes the ROIs on a
+   pool of workers, one tesseract process per ROI.
+2. `recognize_page` runs tesseract once on the whole page and assigns the
+   words it finds to the boxes. This saves starting a process and
+   encoding an image for every box.
+
+pytesseract saves every ROI to a temporary PNG file for tesseract to
+read, and reads the text back from another file. The ROIs can instead
+be handed to tesseract in memory, by choosing one of these backends
+instead of the default "pytesseract":
+
+- "stdin": the ROI is sent to the tesseract process as a raw PGM image
+  (a short header and the gray pixels, no compression) over its standard
+  input, and the text is read from its standard output. No file is made.
+- "tesserocr": tesseract runs inside python through the tesserocr
+  package, when it is installed. The engines are kept between calls,
+  so the language model is loaded once per worker, and no process is
+  started at all.
+"""
+import atexit
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr  # optional, tesseract inside python
+except ImportError:
+    tesserocr = None
+
+# The next line is needed in windows only,
+# so it only runs if the system is windows.
+# It is set here, so that worker processes get it too
+if os.name == "nt":
+    pytesseract.pytesseract.tesseract_cmd = (
+        r"C:\Users\joshu\AppData\Local\Tesseract-OCR\tesseract.exe"
+    )
+
+# in order to apply Tesseract v4 to OCR text we must supply
+# (1) a language, (2) an OEM flag of 1, indicating that the we
+# wish to use the LSTM neural net model for OCR, and finally
+# (3) an PSM value, in this case, 7 which implies that we are
+# treating the ROI as a single line of text
+DEFAULT_CONFIG = "-l eng --oem 1 --psm 7"
+
+# for a whole page, PSM 11 finds as much text as possible in no
+# particular order. The words are put in order with the boxes later
+PAGE_CONFIG = "-l eng --oem 1 --psm 11"
+
+BACKENDS = ["pytesseract", "stdin", "tesserocr"]
+
+# pytesseract stays the default, the in-memory backends are chosen with
+# the backend argument
+DEFAULT_BACKEND = "pytesseract"
+
+
+def gray_pixels(roi):
+    """The ROI as a contiguous gray image. A gray ROI that is already
+    contiguous is used as it is; a view into the page is copied once.
+
+    Arguments:
+        roi {numpy array} -- gray or BGR image region
+
+    Returns:
+        [numpy array] -- contiguous uint8 gray image
+    """
+    if roi.ndim == 3:
+        # cvtColor reads the view in place and writes a new image
+        return cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    return np.ascontiguousarray(roi, dtype=np.uint8)
+
+
+def encode_pgm(roi):
+    """Encode a ROI as a binary PGM image, which any tesseract can read:
+    a short text header followed by the raw gray pixels.
+
+    Arguments:
+        roi {numpy array} -- gray or BGR image region
+
+    Returns:
+        [bytes] -- the PGM file content
+    """
+    gray = gray_pixels(roi)
+    (height, width) = gray.shape
+    header = "P5\n{} {}\n255\n".format(width, height).encode("ascii")
+    return b"".join((header, memoryview(gray)))
+
+
+def run_tesseract_stdin(roi, config=DEFAULT_CONFIG, timeout=None):
+    """Recognize a ROI with a tesseract process, through its standard
+    input and output instead of files.
+
+    Arguments:
+        roi {numpy array} -- image region
+
+    Keyword Arguments:
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+        timeout {float} -- seconds before the process is killed, no limit
+            when None (default: {None})
+
+    Raises:
+        pytesseract.TesseractNotFoundError: tesseract is not installed
+        pytesseract.TesseractError: tesseract failed
+
+    Returns:
+        [str] -- the text
+    """
+    command = [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout"]
+    command += shlex.split(config)
+    try:
+        process = subprocess.run(
+            command,
+            input=encode_pgm(roi),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+    except FileNotFoundError:
+        raise pytesseract.TesseractNotFoundError() from None
+    if process.returncode != 0:
+        raise pytesseract.TesseractError(
+            process.returncode, process.stderr.decode("utf-8", "replace")
+        )
+    return process.stdout.decode("utf-8")
+
+
+def parse_config(config):
+    """Read the language, OCR engine mode and page segmentation mode of a
+    tesseract command line config.
+
+    Arguments:
+        config {str} -- for example "-l eng --oem 1 --psm 7"
+
+    Returns:
+        [dict] -- "lang", "oem" and "psm", with tesseract defaults for the
+            missing options
+    """
+    options = {"lang": "eng", "oem": 3, "psm": 3}
+    words = shlex.split(config)
+    for flag, value in zip(words, words[1:]):
+        if flag == "-l":
+            options["lang"] = value
+        elif flag == "--oem":
+            options["oem"] = int(value)
+        elif flag == "--psm":
+            options["psm"] = int(value)
+    return options
+
+
+class EnginePool:
+    """Long lived tesserocr engines, shared by the worker threads. An
+    engine is made the first time no engine of a config is free, and
+    kept for the next calls, so the language model is loaded once per
+    worker and not once per ROI.
+
+    Keyword Arguments:
+        max_engines {int} -- most engines alive at once, over all the
+            configs. A thread finding none free waits for one. Uses the
+            number of cpus, the default number of workers, when None
+            (default: {None})
+    """
+
+    def __init__(self, max_engines=None):
+        self.max_engines = max_engines or os.cpu_count()
+        self._free = {}
+        self._count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, config):
+        """Take a free engine for a config, or make one.
+
+        Arguments:
+            config {str} -- tesseract options
+
+        Returns:
+            [tesserocr.PyTessBaseAPI] -- the engine
+        """
+        with self._condition:
+            while True:
+                free = self._free.setdefault(config, [])
+                if free:
+                    return free.pop()
+                if self._count < self.max_engines:
+                    self._count += 1
+                    break
+                # make room by closing an idle engine of another config
+                idle = [engines for engines in self._free.values() if engines]
+                if idle:
+                    idle[0].pop().End()
+                    self._count -= 1
+                    continue
+                self._condition.wait()
+
+        options = parse_config(config)
+        try:
+            return tesserocr.PyTessBaseAPI(
+                lang=options["lang"], psm=options["psm"], oem=options["oem"]
+            )
+        except Exception:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            raise
+
+    def allow(self, max_engines):
+        """Raise the number of engines alive at once, never lower it, so
+        threads with other settings still get their engines.
+
+        Arguments:
+            max_engines {int} -- engines needed at once
+        """
+        with self._condition:
+            if max_engines > self.max_engines:
+                self.max_engines = max_engines
+                self._condition.notify_all()
+
+    def release(self, config, engine):
+        """Give an engine back, for the next ROI."""
+        with self._condition:
+            if self._closed:
+                engine.End()
+                self._count -= 1
+                return
+            self._free[config].append(engine)
+            self._condition.notify()
+
+    def close(self):
+        """End the idle engines. The engines in use are ended when they
+        are given back."""
+        with self._condition:
+            self._closed = True
+            for engines in self._free.values():
+                for engine in engines:
+                    engine.End()
+                self._count -= len(engines)
+            self._free = {}
+
+
+_engines = EnginePool()
+atexit.register(_engines.close)
+
+
+def run_tesserocr(roi, config=DEFAULT_CONFIG):
+    """Recognize a ROI with a tesseract engine inside this process.
+
+    Arguments:
+        roi {numpy array} -- image region
+
+    Keyword Arguments:
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+
+    Returns:
+        [str] -- the text
+    """
+    if tesserocr is None:
+        raise ImportError("the tesserocr backend needs tesserocr")
+    gray = gray_pixels(roi)
+    (height, width) = gray.shape
+    engine = _engines.acquire(config)
+    try:
+        # the raw pixels, with no image encoding
+        engine.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        return engine.GetUTF8Text()
+    finally:
+        _engines.release(config, engine)
+
+
+def recognize_roi(roi, config=DEFAULT_CONFIG, backend=None, timeout=None):
+    """Recognize the text in one region of an image.
+
+    Arguments:
+        roi {numpy array} -- image region with a single line of text
+
+    Keyword Arguments:
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+        backend {str} -- "pytesseract", "stdin" or "tesserocr". Uses
+            DEFAULT_BACKEND when None (default: {None})
+        timeout {float} -- seconds before the tesseract process is
+            killed, no limit when None. tesserocr runs no process and
+            ignores it (default: {None})
+
+    Raises:
+        ValueError: the backend is not known
+
+    Returns:
+        [tuple] -- (text, seconds taken)
+    """
+    backend = backend or DEFAULT_BACKEND
+    start = time.time()
+    if backend == "stdin":
+        text = run_tesseract_stdin(roi, config, timeout)
+    elif backend == "tesserocr":
+        text = run_tesserocr(roi, config)
+    elif backend == "pytesseract":
+        # pytesseract takes 0 for no limit
+        text = pytesseract.image_to_string(
+            roi, config=config, timeout=timeout or 0
+        )
+    else:
+        raise ValueError(
+            "unknown backend {!r}, choose from {}".format(
+                backend, ", ".join(BACKENDS)
+            )
+        )
+    return text, time.time() - start
+
+
+def recognize_rois(
+    rois, config=DEFAULT_CONFIG, workers=None, processes=False, backend=None
+):
+    """Recognize the text in many regions at the same time.
+
+    Arguments:
+        rois {list} -- image regions, each with a single line of text
+
+    Keyword Arguments:
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+        workers {int} -- number of workers. Uses the number of cpus when
+            None. With the "tesserocr" backend, each worker thread keeps
+            one engine (default: {None})
+        processes {bool} -- use a pool of processes instead of threads.
+            Threads are enough as tesseract runs in its own process, or
+            releases the GIL with tesserocr (default: {False})
+        backend {str} -- recognition backend, see recognize_roi
+            (default: {None})
+
+    Returns:
+        [list] -- a (text, seconds taken) tuple for each ROI, in the same
+            order as the ROIs
+    """
+    if len(rois) == 0:
+        return []
+
+    workers = workers or os.cpu_count()
+    if backend == "tesserocr" and not processes:
+        # one engine per thread, and no more
+        _engines.allow(workers)
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        # map returns the results in the order of the ROIs, whichever
+        # worker finishes first
+        return list(
+            executor.map(
+                recognize_roi,
+                rois,
+                [config] * len(rois),
+                [backend] * len(rois),
+            )
+        )
+
+
+def recognize_page(image, boxes, config=PAGE_CONFIG, min_overlap=0.5):
+    """Recognize the text in many regions with a single tesseract run on
+    the whole image. Each word found by tesseract is given to the box it
+    overlaps most, and the words of a box are joined from left to right.
+
+    Arguments:
+        image {numpy array} -- the whole image
+        boxes {list} -- (startX, startY, endX, endY) text regions
+
+    Keyword Arguments:
+        config {str} -- tesseract options (default: {PAGE_CONFIG})
+        min_overlap {float} -- minimum fraction of a word inside a box for
+            the word to belong to the box (default: {0.5})
+
+    Returns:
+        [list] -- a (text, seconds taken) tuple for each box, in the same
+            order as the boxes. The time is the page time shared equally
+            between the boxes
+    """
+    if len(boxes) == 0:
+        return []
+
+    start = time.time()
+    data = pytesseract.image_to_data(
+        image, config=config, output_type=pytesseract.Output.DICT
+    )
+
+    # keep the entries that are words, not blocks, lines or empty text
+    texts = [text.strip() for text in data["text"]]
+    is_word = np.array([len(text) > 0 for text in texts], dtype=bool)
+    words = np.stack(
+        [data["left"], data["top"], data["width"], data["height"]], axis=1
+    ).astype(float)[is_word]
+    texts = [text for text, keep in zip(texts, is_word) if keep]
+    words[:, 2:] += words[:, :2]
+
+    # intersection of every word (rows) with every box (columns)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    w = np.minimum(words[:, None, 2], boxes[None, :, 2]) - np.maximum(
+        words[:, None, 0], boxes[None, :, 0]
+    )
+    h = np.minimum(words[:, None, 3], boxes[None, :, 3]) - np.maximum(
+        words[:, None, 1], boxes[None, :, 1]
+    )
+    intersection = np.maximum(0, w) * np.maximum(0, h)
+    word_areas = (words[:, 2] - words[:, 0]) * (words[:, 3] - words[:, 1])
+    overlap = intersection / np.maximum(word_areas, 1)[:, None]
+
+    # the box each word belongs to, if any
+    box_words = [[] for _ in range(len(boxes))]
+    if len(texts) > 0:
+        best = overlap.argmax(axis=1)
+        for i in np.argsort(words[:, 0], kind="stable"):
+            if overlap[i, best[i]] >= min_overlap:
+                box_words[best[i]].append(texts[i])
+
+    seconds = (time.time() - start) / len(boxes)
+    return [(" ".join(words_in_box), seconds) for words_in_box in box_words]
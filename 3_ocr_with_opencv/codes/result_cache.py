@@ -0,0 +1,250 @@
+"""Content-addressed cache of OCR results
+
+The same documents are often scanned again. Every result is saved in a
+SQLite database, keyed by a hash of the decoded image bytes and of the
+pipeline configuration, so a document seen before is answered from the
+database in milliseconds, and a change of configuration never returns a
+stale result. The database has a size limit, and the least recently used
+results are removed first.
+
+USAGE (benchmark of lookups and inserts)
+python result_cache.py --num_results 2000
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def content_key(image, config):
+    """Hash of an image and of the configuration that processes it.
+
+    Arguments:
+        image {numpy array} -- decoded image
+        config {dict} -- everything that changes the result, JSON
+            serializable
+
+    Returns:
+        [str] -- hex digest
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=20)
+    # the shape and type too, so two images with the same bytes but
+    # different sizes do not share a key
+    digest.update("{}|{}|".format(image.shape, image.dtype).encode())
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """OCR results in a SQLite database, with size-based LRU eviction.
+
+    Keyword Arguments:
+        path {str} -- database file, ":memory:" for a cache that is not
+            saved (default: {"ocr_cache.sqlite"})
+        max_bytes {int} -- size limit of the saved results
+            (default: {256 MB})
+    """
+
+    def __init__(self, path="ocr_cache.sqlite", max_bytes=256 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        # one connection shared by the threads of the pipeline
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # a lost result is only recomputed, so the database does not
+        # need to wait for the disk on every commit
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used "
+                "ON results (last_used)"
+            )
+            self._bytes = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """The result saved for a key, and mark it as used.
+
+        Arguments:
+            key {str} -- content key
+
+        Returns:
+            [dict] -- the result, or None when it is not in the cache
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        """Save a result, then remove the least recently used results if
+        the cache is too large.
+
+        Arguments:
+            key {str} -- content key
+            result {dict} -- JSON serializable result
+        """
+        value = json.dumps(result)
+        size = len(value)
+        with self._lock, self._connection:
+            old = self._connection.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove the least recently used results, down to 90% of the
+        limit, so the next puts do not evict again at once."""
+        target = 0.9 * self.max_bytes
+        rows = self._connection.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        )
+        removed = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            removed.append((key,))
+            self._bytes -= size
+        self._connection.executemany(
+            "DELETE FROM results WHERE key = ?", removed
+        )
+
+    def clear(self):
+        """Remove every result."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM results")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()[0]
+
+    def metrics(self):
+        """Hits, misses and size of the cache.
+
+        Returns:
+            [dict] -- "hits", "misses", "hit_rate" and "bytes"
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._bytes,
+            }
+
+
+def benchmark(num_results, max_mb=None, seed=0):
+    """Time the hashing of pages, and the inserts and lookups of results.
+
+    Arguments:
+        num_results {int} -- number of results
+
+    Keyword Arguments:
+        max_mb {float} -- size limit in MB, no limit when None
+            (default: {None})
+        seed {int} -- random seed (default: {0})
+    """
+    rng = np.random.default_rng(seed)
+    page = rng.integers(0, 255, (720, 540, 3), dtype=np.uint8)
+    config = {"model": "frozen_east_text_detection.pb", "psm": 7}
+
+    start = time.perf_counter()
+    for _ in range(100):
+        content_key(page, config)
+    print(
+        "[INFO] hash of a 540x720 page: {:.3f} ms".format(
+            (time.perf_counter() - start) * 10
+        )
+    )
+
+    words = [
+        {"box": [i, i, i + 50, i + 20], "text": "word", "seconds": 0.1}
+        for i in range(100)
+    ]
+    result = {"words": words, "text": " ".join(["word"] * 100)}
+    keys = [
+        hashlib.blake2b(str(i).encode(), digest_size=20).hexdigest()
+        for i in range(num_results)
+    ]
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "ocr_cache.sqlite")
+    max_bytes = 2 ** 60 if max_mb is None else int(max_mb * 2 ** 20)
+    cache = ResultCache(path, max_bytes)
+    try:
+        start = time.perf_counter()
+        for key in keys:
+            cache.put(key, result)
+        put_seconds = (time.perf_counter() - start) / num_results
+
+        start = time.perf_counter()
+        for key in keys:
+            cache.get(key)
+        get_seconds = (time.perf_counter() - start) / num_results
+        print(
+            "[INFO] {} results: put {:.3f} ms, get {:.3f} ms".format(
+                num_results, put_seconds * 1000, get_seconds * 1000
+            )
+        )
+        print("[INFO] {} kept, {}".format(len(cache), cache.metrics()))
+    finally:
+        cache.close()
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-n", "--num_results", type=int, default=2000, help="results"
+    )
+    ap.add_argument(
+        "-m",
+        "--max_mb",
+        type=float,
+        default=None,
+        help="size limit in MB, to see the evictions",
+    )
+    args = vars(ap.parse_args())
+    benchmark(args["num_results"], args["max_mb"])
@@ -0,0 +1,698 @@
+"""Streaming writer of OCR results
+
+Every page result becomes one JSON Lines record, with the boxes, text,
+confidences and stage timings of its words. A tesseract style TSV file
+and one hOCR file per page can be written too. The records are written
+by a background thread through a large buffer, so the OCR workers only
+put the result in a queue and never wait for the disk. Files ending in
+".gz" are gzip compressed.
+
+An interrupted batch can be resumed: the records already written are
+read back, a record cut in the middle by the interruption is dropped,
+and the pages already done are skipped. A page written again, by name,
+replaces its record, so the files keep one record per page.
+
+USAGE (benchmark of the time the OCR workers spend writing)
+python result_writer.py --pages 500 --words 200 --gzip --tsv
+"""
+import argparse
+import gzip
+import html
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from reading_order import group_lines
+
+TSV_HEADER = [
+    "level",
+    "page_num",
+    "block_num",
+    "par_num",
+    "line_num",
+    "word_num",
+    "left",
+    "top",
+    "width",
+    "height",
+    "conf",
+    "text",
+]
+
+HOCR_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">
+ <head>
+  <title>{title}</title>
+  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>
+  <meta name="ocr-system" content="east + tesseract"/>
+  <meta name="ocr-capabilities" content="ocr_page ocr_line ocrx_word"/>
+ </head>
+ <body>
+"""
+
+HOCR_FOOTER = """ </body>
+</html>
+"""
+
+
+def _open(path, mode, buffer_size=2 ** 20, compresslevel=6):
+    """Open a text file, gzip compressed when the path ends with ".gz".
+
+    Arguments:
+        path {str} -- file path
+        mode {str} -- "r", "w" or "a"
+
+    Keyword Arguments:
+        buffer_size {int} -- write buffer in bytes (default: {1 MB})
+        compresslevel {int} -- gzip level, 1 is the fastest
+            (default: {6})
+
+    Returns:
+        [file] -- text file
+    """
+    if path.endswith(".gz"):
+        if mode == "r":
+            return gzip.open(path, "rt", encoding="utf-8")
+        return gzip.open(
+            path, mode + "t", compresslevel=compresslevel, encoding="utf-8"
+        )
+    return open(path, mode, buffering=buffer_size, encoding="utf-8")
+
+
+def _read_lines(path):
+    """The complete lines of a file written by an interrupted run.
+
+    Arguments:
+        path {str} -- text file, gzip compressed or not
+
+    Returns:
+        [tuple] -- (complete lines, whether the end of the file is cut)
+    """
+    lines = []
+    damaged = False
+    try:
+        with _open(path, "r") as file:
+            for line in file:
+                lines.append(line)
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        # a gzip member without its end, the lines read so far are good
+        damaged = True
+    if lines and not lines[-1].endswith("\n"):
+        lines.pop()
+        damaged = True
+    return lines, damaged
+
+
+def _rewrite(path, lines):
+    """Replace a file with some of its lines, through a temporary file."""
+    folder = os.path.dirname(os.path.abspath(path))
+    # the same suffix, so the copy is compressed like the file
+    suffix = ".tmp.gz" if path.endswith(".gz") else ".tmp"
+    handle, temporary = tempfile.mkstemp(dir=folder, suffix=suffix)
+    os.close(handle)
+    with _open(temporary, "w") as file:
+        file.writelines(lines)
+    os.replace(temporary, path)
+
+
+def read_records(path):
+    """Read the records of a JSON Lines file, skipping a last record cut
+    by an interruption.
+
+    Arguments:
+        path {str} -- JSON Lines file, gzip compressed or not
+
+    Returns:
+        [list] -- the records, as dicts
+    """
+    records = []
+    for line in _read_lines(path)[0]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records
+
+
+def page_size(result):
+    """[width, height] of the page of a result, None without a page."""
+    page = result.get("page")
+    return None if page is None else [page.shape[1], page.shape[0]]
+
+
+def make_record(result, page_id, index, size=None):
+    """The JSON record of an OCR pipeline result.
+
+    Arguments:
+        result {dict} -- result of OCRPipeline
+        page_id {str or int} -- name of the page, the image path usually
+        index {int} -- position of the page in the output
+
+    Keyword Arguments:
+        size {list} -- [width, height] of the page. Taken from the page
+            of the result when None (default: {None})
+
+    Returns:
+        [dict] -- JSON serializable record
+    """
+    if size is None:
+        size = page_size(result)
+    words = []
+    for word in result["words"]:
+        confidence = word.get("confidence")
+        if confidence is not None:
+            confidence = round(float(confidence), 4)
+        words.append(
+            {
+                "box": [int(value) for value in word["box"]],
+                "text": word["text"],
+                "confidence": confidence,
+                "seconds": float(word.get("seconds", 0.0)),
+            }
+        )
+    return {
+        "page": page_id,
+        "index": index,
+        "size": size,
+        "text": result["text"],
+        "words": words,
+        "corners": result.get("corners"),
+        "skew": result.get("skew", 0.0),
+        "cache": result.get("cache", False),
+        "timings": result.get("timings", {}),
+    }
+
+
+def _lines(record):
+    """The words of a record grouped in lines, as lists of word indices."""
+    boxes = [word["box"] for word in record["words"]]
+    if not boxes:
+        return []
+    return group_lines(np.asarray(boxes, dtype=float))
+
+
+def tsv_rows(record):
+    """Rows of a record in the TSV format of tesseract. The block and
+    paragraph are always 1, and the conf is the detector confidence in
+    percent, or -1 when it is not known.
+
+    Arguments:
+        record {dict} -- page record
+
+    Returns:
+        [list] -- lines of text
+    """
+    page_num = record["index"] + 1
+    (width, height) = record["size"] or (0, 0)
+    rows = [[1, page_num, 0, 0, 0, 0, 0, 0, width, height, -1, ""]]
+    for line_num, line in enumerate(_lines(record), 1):
+        for word_num, i in enumerate(line, 1):
+            word = record["words"][i]
+            (x1, y1, x2, y2) = word["box"]
+            confidence = word["confidence"]
+            rows.append(
+                [
+                    5,
+                    page_num,
+                    1,
+                    1,
+                    line_num,
+                    word_num,
+                    x1,
+                    y1,
+                    x2 - x1,
+                    y2 - y1,
+                    -1 if confidence is None else round(100 * confidence, 2),
+                    # tabs and newlines would break the columns
+                    " ".join(word["text"].split()),
+                ]
+            )
+    return ["\t".join(str(value) for value in row) + "\n" for row in rows]
+
+
+def hocr_page(record):
+    """hOCR document of a record.
+
+    Arguments:
+        record {dict} -- page record
+
+    Returns:
+        [str] -- the document
+    """
+    page_num = record["index"] + 1
+    (width, height) = record["size"] or (0, 0)
+    title = html.escape(str(record["page"]), quote=True)
+    parts = [
+        HOCR_HEADER.format(title=title),
+        '  <div class="ocr_page" id="page_{}" title="image &quot;{}&quot;; '
+        'bbox 0 0 {} {}; ppageno {}">\n'.format(
+            page_num, title, width, height, page_num - 1
+        ),
+    ]
+    for line_num, line in enumerate(_lines(record), 1):
+        boxes = np.array([record["words"][i]["box"] for i in line])
+        parts.append(
+            '   <span class="ocr_line" id="line_{}_{}" '
+            'title="bbox {} {} {} {}">\n'.format(
+                page_num,
+                line_num,
+                boxes[:, 0].min(),
+                boxes[:, 1].min(),
+                boxes[:, 2].max(),
+                boxes[:, 3].max(),
+            )
+        )
+        for word_num, i in enumerate(line, 1):
+            word = record["words"][i]
+            title = "bbox {} {} {} {}".format(*word["box"])
+            if word["confidence"] is not None:
+                title += "; x_wconf {}".format(round(100 * word["confidence"]))
+            parts.append(
+                '    <span class="ocrx_word" id="word_{}_{}_{}" '
+                'title="{}">{}</span>\n'.format(
+                    page_num,
+                    line_num,
+                    word_num,
+                    title,
+                    html.escape(word["text"]),
+                )
+            )
+        parts.append("   </span>\n")
+    parts.append("  </div>\n")
+    parts.append(HOCR_FOOTER)
+    return "".join(parts)
+
+
+class ResultWriter:
+    """Write OCR results on a background thread.
+
+    Arguments:
+        path {str} -- JSON Lines file, gzip compressed when it ends with
+            ".gz"
+
+    Keyword Arguments:
+        tsv_path {str} -- tesseract style TSV file, gzip compressed when
+            it ends with ".gz". Not written when None (default: {None})
+        hocr_dir {str} -- folder of the hOCR files, one per page. Not
+            written when None (default: {None})
+        resume {bool} -- keep the records of the file and add to them,
+            else the file is replaced. A page already in the file is
+            written again in place of its record (default: {False})
+        buffer_size {int} -- write buffer in bytes (default: {1 MB})
+        compresslevel {int} -- gzip level, 1 is the fastest
+            (default: {6})
+        max_pending {int} -- results waiting to be written before write
+            waits for the thread, so a disk slower than the OCR cannot
+            fill the memory (default: {1024})
+    """
+
+    def __init__(
+        self,
+        path,
+        tsv_path=None,
+        hocr_dir=None,
+        resume=False,
+        buffer_size=2 ** 20,
+        compresslevel=6,
+        max_pending=1024,
+    ):
+        self.path = path
+        self.tsv_path = tsv_path
+        self.hocr_dir = hocr_dir
+
+        # ids of the pages already written, to skip them when resuming
+        self.written = set()
+        self.count = 0
+        # page id -> index of its record, so a page written again keeps
+        # its index and replaces its record when the writer is closed
+        self._indexes = {}
+        self._replaced = False
+        mode = "w"
+        if resume and os.path.exists(path):
+            self._recover()
+            mode = "a"
+        if hocr_dir is not None:
+            os.makedirs(hocr_dir, exist_ok=True)
+
+        self._file = _open(path, mode, buffer_size, compresslevel)
+        self._tsv = None
+        if tsv_path is not None:
+            tsv_mode = mode if os.path.exists(tsv_path) else "w"
+            self._tsv = _open(tsv_path, tsv_mode, buffer_size, compresslevel)
+            if tsv_mode == "w":
+                self._tsv.write("\t".join(TSV_HEADER) + "\n")
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._lock = threading.Lock()
+        self.records = 0
+        self.bytes = 0
+        self.write_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _recover(self):
+        """Read the records of an interrupted run, and drop what was
+        written after the last complete record."""
+        lines, damaged = _read_lines(self.path)
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                damaged = True
+                break
+        lines = lines[: len(records)]
+        pages = {record["page"] for record in records}
+        if len(pages) < len(records):
+            # pages written more than once by earlier runs
+            records = self._compact(lines, records)
+        elif damaged:
+            _rewrite(self.path, lines)
+        self._indexes = {record["page"]: record["index"] for record in records}
+        self.written = set(self._indexes)
+        self.count = max(self._indexes.values(), default=-1) + 1
+
+        # the TSV rows of the pages after the last record are dropped
+        if self.tsv_path is not None and os.path.exists(self.tsv_path):
+            lines, damaged = _read_lines(self.tsv_path)
+            kept = lines[:1] + [
+                line
+                for line in lines[1:]
+                if int(line.split("\t", 2)[1]) <= self.count
+            ]
+            if damaged or len(kept) < len(lines):
+                _rewrite(self.tsv_path, kept)
+
+    def _compact(self, lines, records):
+        """Keep the last record of every page, in the order of the page
+        indices, and write the TSV file again from them. The hOCR files
+        of the records dropped are removed.
+
+        Arguments:
+            lines {list} -- complete lines of the JSON Lines file
+            records {list} -- the records of the lines
+
+        Returns:
+            [list] -- the records kept
+        """
+        last = {}
+        for position, record in enumerate(records):
+            last[record["page"]] = position
+        positions = sorted(
+            last.values(), key=lambda position: records[position]["index"]
+        )
+        _rewrite(self.path, [lines[position] for position in positions])
+        kept = [records[position] for position in positions]
+
+        if self.tsv_path is not None and os.path.exists(self.tsv_path):
+            rows = ["\t".join(TSV_HEADER) + "\n"]
+            for record in kept:
+                rows.extend(tsv_rows(record))
+            _rewrite(self.tsv_path, rows)
+        if self.hocr_dir is not None:
+            indexes = {record["index"] for record in kept}
+            for record in records:
+                path = self._hocr_path(record["index"])
+                if record["index"] not in indexes and os.path.exists(path):
+                    os.remove(path)
+        return kept
+
+    def _hocr_path(self, index):
+        """The hOCR file of the page with this index."""
+        name = "page_{:06d}.hocr".format(index + 1)
+        return os.path.join(self.hocr_dir, name)
+
+    def write(self, result, page_id=None):
+        """Queue a result to be written. Usable as the emit function of
+        OCRPipeline.
+
+        Arguments:
+            result {dict} -- result of OCRPipeline
+
+        Keyword Arguments:
+            page_id {str or int} -- name of the page. Uses the "source"
+                of the result, or the page number when None
+                (default: {None})
+
+        Raises:
+            Exception: the writer thread failed, with its error
+        """
+        self._check()
+        if page_id is None:
+            page_id = result.get("source")
+        with self._lock:
+            index = self._indexes.get(page_id)
+            if index is None:
+                index = self.count
+                self.count += 1
+            else:
+                self._replaced = True
+            if page_id is None:
+                page_id = index
+            self._indexes[page_id] = index
+        self.written.add(page_id)
+        # the record is made on the thread. The page image is left out,
+        # so the queue does not keep whole pages in memory
+        size = page_size(result)
+        result = {key: result[key] for key in result if key != "page"}
+
+        start = time.perf_counter()
+        self._queue.put((result, page_id, index, size))
+        self.blocked_seconds += time.perf_counter() - start
+
+    __call__ = write
+
+    def _run(self):
+        """Write the queued records, until None is queued."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                if self._error is None:
+                    start = time.perf_counter()
+                    self._write_record(make_record(*item))
+                    # the records reach the file as soon as the thread
+                    # has nothing else to do, so an interruption loses
+                    # as little as possible
+                    if self._queue.empty():
+                        self._flush_files()
+                    self.write_seconds += time.perf_counter() - start
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _write_record(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._file.write(line)
+        self.bytes += len(line)
+        if self._tsv is not None:
+            self._tsv.writelines(tsv_rows(record))
+        if self.hocr_dir is not None:
+            path = self._hocr_path(record["index"])
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(hocr_page(record))
+        self.records += 1
+
+    def _flush_files(self):
+        self._file.flush()
+        if self._tsv is not None:
+            self._tsv.flush()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """Wait until every queued result is written to the files."""
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        """Write the queued results, stop the thread and close the files.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+        if self._tsv is not None:
+            self._tsv.close()
+        self._check()
+        if self._replaced:
+            # the new records of pages written again were added at the
+            # end, the old ones are dropped now
+            lines, _ = _read_lines(self.path)
+            self._compact(lines, [json.loads(line) for line in lines])
+            self._replaced = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def metrics(self):
+        """Counters of the writer.
+
+        Returns:
+            [dict] -- "records" written, "bytes" of JSON, "write_seconds"
+                spent by the thread and "blocked_seconds" the callers
+                waited for a full queue
+        """
+        return {
+            "records": self.records,
+            "bytes": self.bytes,
+            "write_seconds": self.write_seconds,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+def synthetic_result(num_words, seed=0):
+    """OCR pipeline result with random words.
+
+    Arguments:
+        num_words {int} -- words on the page
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [dict] -- result, without a page image
+    """
+    rng = np.random.default_rng(seed)
+    words = []
+    for i in range(num_words):
+        (x, y) = (70 * (i % 8), 30 * (i // 8))
+        words.append(
+            {
+                "box": (x, y, x + 60, y + 20),
+                "text": "word{}".format(rng.integers(1000)),
+                "confidence": float(rng.random()),
+                "seconds": 0.01,
+            }
+        )
+    return {
+        "words": words,
+        "text": " ".join(word["text"] for word in words),
+        "corners": None,
+        "skew": 0.0,
+        "timings": {"detect": 0.1, "recognize": 0.5},
+        "cache": False,
+    }
+
+
+def benchmark(num_pages, num_words, compress=False, tsv=False, ocr_ms=10):
+    """Print the time the caller spends per page when writing the records
+    directly and with the writer thread, and check that a file cut in
+    the middle of a record resumes.
+
+    Arguments:
+        num_pages {int} -- pages written
+        num_words {int} -- words per page
+
+    Keyword Arguments:
+        compress {bool} -- gzip the files (default: {False})
+        tsv {bool} -- write the TSV file too (default: {False})
+        ocr_ms {float} -- time spent waiting for the OCR of each page,
+            like a worker waiting for tesseract (default: {10})
+    """
+    result = synthetic_result(num_words)
+    suffix = ".gz" if compress else ""
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "results.jsonl" + suffix)
+        tsv_path = None
+        if tsv:
+            tsv_path = os.path.join(folder, "results.tsv" + suffix)
+
+        # only the time spent writing is counted, not the OCR wait
+        direct = 0.0
+        with _open(path, "w") as file:
+            tsv_file = _open(tsv_path, "w") if tsv else None
+            for index in range(num_pages):
+                time.sleep(ocr_ms / 1000)
+                start = time.perf_counter()
+                record = make_record(result, index, index)
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if tsv:
+                    tsv_file.writelines(tsv_rows(record))
+                direct += time.perf_counter() - start
+            if tsv:
+                tsv_file.close()
+        direct /= num_pages
+
+        caller = 0.0
+        writer = ResultWriter(path, tsv_path)
+        for _ in range(num_pages):
+            time.sleep(ocr_ms / 1000)
+            start = time.perf_counter()
+            writer.write(result)
+            caller += time.perf_counter() - start
+        writer.close()
+        caller /= num_pages
+
+        print(
+            "[INFO] {} pages of {} words, {:.1f} MB{}".format(
+                num_pages,
+                num_words,
+                os.path.getsize(path) / 2 ** 20,
+                ", gzip" if compress else "",
+            )
+        )
+        print("    direct writes   {:8.3f} ms per page".format(1000 * direct))
+        print("    writer thread   {:8.3f} ms per page".format(1000 * caller))
+        print("    {}".format(writer.metrics()))
+
+        # cut the file in the middle of the last record, then resume
+        size = os.path.getsize(path)
+        with open(path, "r+b") as file:
+            file.truncate(size - 100)
+        with ResultWriter(path, tsv_path, resume=True) as writer:
+            resumed = writer.count
+            for index in range(resumed, num_pages):
+                writer.write(result)
+        records = read_records(path)
+        print(
+            "    resumed after {} records, {} records, pages in order: "
+            "{}".format(
+                resumed,
+                len(records),
+                [r["page"] for r in records] == list(range(num_pages)),
+            )
+        )
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-p", "--pages", type=int, default=500, help="pages written"
+    )
+    ap.add_argument(
+        "-w", "--words", type=int, default=200, help="words per page"
+    )
+    ap.add_argument("--gzip", action="store_true", help="gzip the files")
+    ap.add_argument("--tsv", action="store_true", help="write a TSV file")
+    ap.add_argument(
+        "--ocr_ms",
+        type=float,
+        default=10,
+        help="milliseconds of OCR wait per page",
+    )
+    args = vars(ap.parse_args())
+    benchmark(
+        args["pages"], args["words"], args["gzip"], args["tsv"], args["ocr_ms"]
+    )
@@ -0,0 +1,505 @@
+"""Persistent pool of tesseract workers
+
+Every tesseract run loads the eng LSTM model again, which takes longer
+than recognizing a short line of text. The pool keeps a few long lived
+worker processes, each with its tesseract engine loaded once, and feeds
+them the ROIs over pipes. A worker is replaced by a fresh one after a
+number of jobs, so a slow leak in the engine cannot grow forever. A job
+that takes too long, or whose worker crashes, is sent again to another
+worker, so one bad ROI never loses the batch. A missing tesseract or a
+bad config fails every ROI, so it is raised in the caller instead.
+
+The engines stay loaded with the "tesserocr" backend. With the "stdin"
+and the default "pytesseract" backends the workers still start a
+tesseract process per ROI, so only the python side is warm.
+
+USAGE (benchmark of warm and cold latency)
+python tesseract_pool.py --rois 50 --workers 4 --backend tesserocr
+"""
+import argparse
+import os
+import signal
+import threading
+import time
+from collections import deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+import numpy as np
+import pytesseract
+
+from recognition import (
+    BACKENDS,
+    DEFAULT_BACKEND,
+    DEFAULT_CONFIG,
+    gray_pixels,
+    recognize_roi,
+)
+
+# errors of a job that every other job would get too
+FATAL_ERRORS = (pytesseract.TesseractNotFoundError, ImportError, ValueError)
+
+
+def _error_info(exception):
+    """Describe an exception of a worker, so the pool can raise it again.
+    The pytesseract exceptions cannot be sent through a pipe as they are.
+
+    Arguments:
+        exception {Exception} -- exception raised in the worker
+
+    Returns:
+        [tuple] -- (kind, details) of the exception
+    """
+    if isinstance(exception, pytesseract.TesseractNotFoundError):
+        return ("not found", None)
+    if isinstance(exception, pytesseract.TesseractError):
+        return ("tesseract", (exception.status, exception.message))
+    return ("other", repr(exception))
+
+
+def _error_from_info(info):
+    """The exception described by _error_info.
+
+    Arguments:
+        info {tuple} -- (kind, details) of the exception
+
+    Returns:
+        [Exception] -- the exception to raise
+    """
+    (kind, details) = info
+    if kind == "not found":
+        return pytesseract.TesseractNotFoundError()
+    if kind == "tesseract":
+        return pytesseract.TesseractError(*details)
+    return RuntimeError("tesseract worker failed: {}".format(details))
+
+
+def _recognize(roi, config, backend, timeout):
+    """Recognize a ROI in a worker. The tesseract process must not
+    outlive a timed out job."""
+    text, _ = recognize_roi(roi, config, backend, timeout)
+    return text
+
+
+def _worker_main(connection, config, backend, timeout):
+    """Recognize the ROIs received on the connection until it is closed.
+    This runs in the worker processes.
+
+    Arguments:
+        connection {Connection} -- pipe end of the worker
+        config {str} -- tesseract options
+        backend {str} -- recognition backend
+        timeout {float} -- seconds before a tesseract process is killed
+    """
+    if hasattr(os, "setpgrp"):
+        # a process group of its own, so a killed worker takes its
+        # tesseract process with it
+        os.setpgrp()
+    # a blank ROI loads the tesserocr model now, so the first ROI finds a
+    # warm engine, and finds a missing tesseract or a bad config before
+    # any job is lost to them
+    try:
+        _recognize(np.full((32, 32), 255, np.uint8), config, backend, timeout)
+    except Exception as exception:
+        connection.send(("error", _error_info(exception)))
+        connection.close()
+        return
+    connection.send("ready")
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        (job, roi) = message
+        start = time.time()
+        try:
+            text = _recognize(roi, config, backend, timeout)
+            error = None
+        except Exception as exception:
+            fatal = isinstance(exception, FATAL_ERRORS)
+            text, error = "", (fatal, _error_info(exception))
+        connection.send((job, text, time.time() - start, error))
+    connection.close()
+
+
+class _Worker:
+    """A worker process and its end of the pipe."""
+
+    def __init__(self, config, backend, timeout):
+        self.connection, child = Pipe()
+        self.process = Process(
+            target=_worker_main,
+            args=(child, config, backend, timeout),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.jobs = 0
+        self.ready = False
+        self.started = time.time()
+
+    def stop(self, kill=False):
+        """Stop the process, at once when kill is True."""
+        if not kill:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            try:
+                # the whole process group, with a running tesseract
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class TesseractPool:
+    """Long lived tesseract worker processes.
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes. Uses the number of
+            cpus when None (default: {None})
+        config {str} -- tesseract options (default: {DEFAULT_CONFIG})
+        backend {str} -- "pytesseract", "stdin" or "tesserocr", see
+            recognition.py. Uses DEFAULT_BACKEND when None
+            (default: {None})
+        max_jobs {int} -- jobs done by a worker before it is replaced
+            (default: {1000})
+        timeout {float} -- seconds a job may take (default: {10.0})
+        retries {int} -- times a job is sent again after a timeout or a
+            crash, before it is given up (default: {1})
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        config=DEFAULT_CONFIG,
+        backend=None,
+        max_jobs=1000,
+        timeout=10.0,
+        retries=1,
+    ):
+        self.num_workers = workers or os.cpu_count()
+        self.config = config
+        self.backend = backend or DEFAULT_BACKEND
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.retries = retries
+        self._workers = []
+        # one batch at a time, the workers are shared
+        self._lock = threading.Lock()
+
+        self.jobs = 0
+        self.recycled = 0
+        self.timeouts = 0
+        self.crashes = 0
+        # (ROI index, reason) of the jobs of the last batch given up or
+        # failed
+        self.failures = []
+
+    def start(self, wait_ready=True):
+        """Start the workers.
+
+        Keyword Arguments:
+            wait_ready {bool} -- wait until the engines are loaded
+                (default: {True})
+
+        Raises:
+            pytesseract.TesseractNotFoundError: tesseract is not installed
+            pytesseract.TesseractError: tesseract fails with the config
+
+        Returns:
+            [TesseractPool] -- the pool itself
+        """
+        with self._lock:
+            while len(self._workers) < self.num_workers:
+                self._workers.append(self._new_worker())
+            if wait_ready:
+                self._wait_ready(self._workers)
+        return self
+
+    def _new_worker(self):
+        return _Worker(self.config, self.backend, self.timeout)
+
+    def _check_ready(self, worker):
+        """Read the "ready" message of a new worker, without waiting.
+
+        Raises:
+            Exception: the error of the worker, when it cannot recognize
+                anything. The workers are stopped
+
+        Returns:
+            [bool] -- True when the worker is ready, None while it starts,
+                False when it died or did not start within the timeout
+        """
+        if worker.ready:
+            return True
+        if not worker.connection.poll():
+            if time.time() - worker.started < self.timeout:
+                return None
+            return False
+        try:
+            message = worker.connection.recv()
+        except (EOFError, OSError):
+            return False
+        if isinstance(message, tuple) and message[0] == "error":
+            self._fail(_error_from_info(message[1]))
+        worker.ready = message == "ready"
+        return worker.ready
+
+    def _wait_ready(self, workers):
+        """Wait for the "ready" messages of new workers, all at once.
+
+        Arguments:
+            workers {list} -- the workers
+        """
+        starting = [w for w in workers if self._check_ready(w) is None]
+        while starting:
+            oldest = min(worker.started for worker in starting)
+            remaining = max(0.0, oldest + self.timeout - time.time())
+            wait([worker.connection for worker in starting], remaining)
+            starting = [w for w in starting if self._check_ready(w) is None]
+
+    def _fail(self, error):
+        """Stop the workers, with the jobs they have, and raise an error.
+        The next batch starts new workers."""
+        self._stop_workers(kill=True)
+        raise error
+
+    def _stop_workers(self, kill=False):
+        for worker in self._workers:
+            worker.stop(kill)
+        self._workers = []
+
+    def _replace(self, index, kill=False):
+        """Replace a worker with a fresh one."""
+        self._workers[index].stop(kill)
+        self._workers[index] = self._new_worker()
+
+    def recognize(self, rois):
+        """Recognize the text of the ROIs on the workers.
+
+        Arguments:
+            rois {list} -- image regions, each with a single line of text
+
+        Raises:
+            RuntimeError: the workers die before they are ready
+            pytesseract.TesseractNotFoundError: tesseract is not installed
+            pytesseract.TesseractError: tesseract fails with the config
+
+        Returns:
+            [list] -- a (text, seconds taken) tuple for each ROI, in the
+                same order as the ROIs. The ROIs given up have no text
+        """
+        if len(rois) == 0:
+            return []
+        self.start(wait_ready=False)
+        self.failures = []
+
+        results = [None] * len(rois)
+        attempts = [0] * len(rois)
+        pending = deque(range(len(rois)))
+        # worker index -> (ROI index, start time)
+        busy = {}
+        # workers that died before they were ready, since the last result
+        start_failures = 0
+
+        def lost(index, job, reason):
+            """Send a job again, or give it up."""
+            attempts[job] += 1
+            self._replace(index, kill=True)
+            if attempts[job] <= self.retries:
+                pending.appendleft(job)
+            else:
+                results[job] = ("", time.time() - busy[index][1])
+                self.failures.append((job, reason))
+            del busy[index]
+
+        with self._lock:
+            while pending or busy:
+                # give a job to every idle worker that is ready. The ones
+                # still starting are waited for with the busy ones
+                starting = []  # worker indices
+                for index, worker in enumerate(self._workers):
+                    if not pending:
+                        break
+                    if index in busy:
+                        continue
+                    ready = self._check_ready(worker)
+                    if ready is None:
+                        starting.append(index)
+                        continue
+                    if not ready:
+                        self.crashes += 1
+                        start_failures += 1
+                        if start_failures > 2 * self.num_workers:
+                            raise RuntimeError(
+                                "the tesseract workers do not start"
+                            )
+                        self._replace(index, kill=True)
+                        starting.append(index)
+                        continue
+                    job = pending.popleft()
+                    try:
+                        worker.connection.send((job, gray_pixels(rois[job])))
+                    except (BrokenPipeError, OSError):
+                        pending.appendleft(job)
+                        self.crashes += 1
+                        self._replace(index, kill=True)
+                        continue
+                    busy[index] = (job, time.time())
+
+                if not busy and not starting:
+                    continue
+
+                # wait for a result, a worker to be ready, or for the
+                # oldest job or start to time out
+                deadlines = [started for _, started in busy.values()]
+                deadlines += [self._workers[i].started for i in starting]
+                remaining = max(
+                    0.0, min(deadlines) + self.timeout - time.time()
+                )
+                connections = {
+                    self._workers[index].connection: index
+                    for index in list(busy) + starting
+                }
+                for connection in wait(list(connections), remaining):
+                    index = connections[connection]
+                    if index not in busy:
+                        # a worker ready, or dead, is seen at the next turn
+                        continue
+                    (job, _) = busy[index]
+                    try:
+                        (job, text, seconds, error) = connection.recv()
+                    except (EOFError, OSError):
+                        self.crashes += 1
+                        lost(index, job, "worker crashed")
+                        continue
+                    results[job] = (text, seconds)
+                    start_failures = 0
+                    if error is not None:
+                        (fatal, info) = error
+                        error = _error_from_info(info)
+                        if fatal:
+                            self._fail(error)
+                        self.failures.append((job, repr(error)))
+                    del busy[index]
+                    self.jobs += 1
+                    self._workers[index].jobs += 1
+                    if self._workers[index].jobs >= self.max_jobs:
+                        self.recycled += 1
+                        self._replace(index)
+
+                now = time.time()
+                for index, (job, started) in list(busy.items()):
+                    if now - started >= self.timeout:
+                        self.timeouts += 1
+                        lost(index, job, "timed out")
+        return results
+
+    def close(self):
+        """Stop the workers."""
+        with self._lock:
+            self._stop_workers()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def metrics(self):
+        """Counters of the pool.
+
+        Returns:
+            [dict] -- "jobs" done, workers "recycled", "timeouts",
+                "crashes" and "failures" of the last batch
+        """
+        return {
+            "jobs": self.jobs,
+            "recycled": self.recycled,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "failures": len(self.failures),
+        }
+
+
+def benchmark(rois, workers, backend=None):
+    """Print the latency of a ROI with a cold worker (started for it, as
+    recognize_roi does) and with the warm workers of a running pool.
+
+    Arguments:
+        rois {list} -- image regions
+        workers {int} -- number of workers
+
+    Keyword Arguments:
+        backend {str} -- recognition backend (default: {None})
+    """
+    cold = []
+    for roi in rois[:5]:
+        start = time.time()
+        with TesseractPool(workers=1, backend=backend) as pool:
+            pool.recognize([roi])
+        cold.append(time.time() - start)
+
+    with TesseractPool(workers=workers, backend=backend) as pool:
+        warm = []
+        for roi in rois:
+            start = time.time()
+            pool.recognize([roi])
+            warm.append(time.time() - start)
+
+        start = time.time()
+        pool.recognize(rois)
+        batch = time.time() - start
+        metrics = pool.metrics()
+
+    print("[INFO] backend {}".format(backend or DEFAULT_BACKEND))
+    print(
+        "    cold worker {:8.2f} ms per ROI".format(
+            1000 * sum(cold) / len(cold)
+        )
+    )
+    print(
+        "    warm worker {:8.2f} ms per ROI".format(
+            1000 * sum(warm) / len(warm)
+        )
+    )
+    print(
+        "    batch of {} on {} workers {:8.2f} ms per ROI".format(
+            len(rois), workers, 1000 * batch / len(rois)
+        )
+    )
+    print("    {}".format(metrics))
+
+
+if __name__ == "__main__":
+    from benchmark_recognition import synthetic_rois
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-r", "--rois", type=int, default=50, help="number of synthetic ROIs"
+    )
+    ap.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of workers",
+    )
+    ap.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default=None,
+        choices=BACKENDS,
+        help="recognition backend",
+    )
+    args = vars(ap.parse_args())
+    benchmark(synthetic_rois(args["rois"]), args["workers"], args["backend"])
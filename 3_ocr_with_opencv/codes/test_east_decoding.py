@@ -0,0 +1,72 @@
+"""Tests of the vectorized EAST geometry decoding
+
+The vectorized decoder must give exactly the boxes of the original loop
+decoder, kept in benchmark_east.py as the reference.
+
+USAGE
+python -m pytest test_east_decoding.py
+"""
+import numpy as np
+import pytest
+
+from benchmark_east import decode_predictions_loop
+from east_text_detector import decode_predictions
+
+
+def fixed_predictions(size, seed):
+    """Random float32 score and geometry volumes of a (size x size) input.
+
+    Arguments:
+        size {int} -- input image width and height (multiple of 32)
+        seed {int} -- random seed
+
+    Returns:
+        [tuple] -- (scores, geometry) float32 volumes
+    """
+    rng = np.random.default_rng(seed)
+    cells = size // 4
+    scores = rng.random((1, 1, cells, cells), dtype=np.float32)
+    geometry = rng.random((1, 5, cells, cells), dtype=np.float32)
+    geometry[0, :4] *= np.float32(40)
+    # angles are predicted between -pi/4 and pi/4
+    geometry[0, 4] = (geometry[0, 4] - np.float32(0.5)) * np.float32(
+        np.pi / 2
+    )
+    return scores, geometry
+
+
+@pytest.mark.parametrize("size", [32, 320, 640])
+@pytest.mark.parametrize("min_confidence", [0.1, 0.5, 0.9])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_same_boxes_as_loop(size, min_confidence, seed):
+    scores, geometry = fixed_predictions(size, seed)
+
+    rects, confidences = decode_predictions(scores, geometry, min_confidence)
+    loop_rects, loop_confidences = decode_predictions_loop(
+        scores, geometry, min_confidence
+    )
+
+    np.testing.assert_array_equal(
+        rects, np.array(loop_rects, dtype=int).reshape(-1, 4)
+    )
+    np.testing.assert_allclose(
+        confidences, np.array(loop_confidences, dtype=np.float32), rtol=0
+    )
+
+
+def test_output_types():
+    scores, geometry = fixed_predictions(320, 0)
+    rects, confidences = decode_predictions(scores, geometry)
+
+    assert rects.ndim == 2 and rects.shape[1] == 4
+    assert np.issubdtype(rects.dtype, np.integer)
+    assert confidences.dtype == np.float32
+    assert len(rects) == len(confidences)
+
+
+def test_no_text():
+    scores, geometry = fixed_predictions(320, 0)
+    rects, confidences = decode_predictions(scores, geometry, 1.1)
+
+    assert rects.shape == (0, 4)
+    assert confidences.shape == (0,)
@@ -0,0 +1,342 @@
+"""OCR on video streams
+
+Running the text detector and tesseract on every frame of a video is far
+too slow. On document-camera footage most frames show the same page, so
+here every frame gets a cheap signature (a tiny grayscale copy and its
+difference hash), and the OCR pipeline only runs again when the
+signature changes more than a threshold from the last frame that was
+OCR'd. The other frames reuse the cached result.
+
+USAGE
+python video_ocr.py --video document.avi --east frozen_east_text_detection.pb
+
+USAGE (benchmark of the OCR calls saved on synthetic document footage)
+python video_ocr.py --synthetic 1000
+"""
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from box_tracker import BoxTracker
+from ocr_pipeline import OCRPipeline
+from process_frame import find_paper_corners
+
+
+def frame_signature(frame, size=(32, 32)):
+    """Cheap signature of a frame: a tiny grayscale copy of it.
+
+    Arguments:
+        frame {numpy array} -- input frame
+
+    Keyword Arguments:
+        size {tuple} -- (width, height) of the copy (default: {(32, 32)})
+
+    Returns:
+        [numpy array] -- (height, width) float32 image between 0 and 1
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    # INTER_AREA averages the pixels, so noise does not change the copy
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32) / 255.0
+
+
+def difference_hash(signature):
+    """64 bit perceptual difference hash of a signature: whether each
+    pixel is brighter than its right neighbour, on an 8 x 9 copy.
+
+    Arguments:
+        signature {numpy array} -- frame signature
+
+    Returns:
+        [numpy array] -- 64 booleans
+    """
+    small = cv2.resize(signature, (9, 8), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).ravel()
+
+
+def scene_change(first, second):
+    """How much the scene changed between two signatures, from 0 (same)
+    to 1. The larger of the mean pixel difference and the fraction of
+    differing hash bits, so both lighting and layout changes count.
+
+    Arguments:
+        first {numpy array} -- frame signature
+        second {numpy array} -- frame signature
+
+    Returns:
+        [float] -- the change
+    """
+    pixels = float(np.mean(np.abs(first - second)))
+    bits = float(
+        np.mean(difference_hash(first) != difference_hash(second))
+    )
+    return max(pixels, bits)
+
+
+class VideoOCR:
+    """OCR the frames of a video, only when the scene changes.
+
+    Arguments:
+        pipeline {OCRPipeline} -- the OCR pipeline
+
+    Keyword Arguments:
+        threshold {float} -- scene change that triggers a new OCR
+            (default: {0.05})
+        signature_size {tuple} -- size of the frame signatures
+            (default: {(32, 32)})
+    """
+
+    def __init__(self, pipeline, threshold=0.05, signature_size=(32, 32)):
+        self.pipeline = pipeline
+        self.threshold = threshold
+        self.signature_size = signature_size
+
+        # signature of the frame the cached result comes from
+        self._signature = None
+        self._result = None
+
+        self.frames = 0
+        self.ocr_runs = 0
+        self.total_time = 0.0
+
+    def process(self, frame):
+        """OCR a frame, or reuse the last result if the scene is the same.
+
+        Arguments:
+            frame {numpy array} -- input frame
+
+        Returns:
+            [tuple] -- (result, cached). result is the OCRPipeline result,
+                cached is True when it was reused
+        """
+        start = time.time()
+        signature = frame_signature(frame, self.signature_size)
+
+        cached = (
+            self._signature is not None
+            and scene_change(signature, self._signature) <= self.threshold
+        )
+        if not cached:
+            self._result = self.pipeline(frame)
+            self._signature = signature
+            self.ocr_runs += 1
+
+        self.frames += 1
+        self.total_time += time.time() - start
+        return self._result, cached
+
+    def report(self):
+        """Summary of the work saved.
+
+        Returns:
+            [str] -- frames, OCR runs and mean time per frame
+        """
+        return (
+            "{} frames, {} OCR runs ({:.1%} of frames), "
+            "{:.6f} seconds per frame".format(
+                self.frames,
+                self.ocr_runs,
+                self.ocr_runs / max(self.frames, 1),
+                self.total_time / max(self.frames, 1),
+            )
+        )
+
+
+def synthetic_page(seed, size=(640, 480)):
+    """A page of random words, as a document camera sees it.
+
+    Arguments:
+        seed {int} -- random seed, one per page
+
+    Keyword Arguments:
+        size {tuple} -- (width, height) (default: {(640, 480)})
+
+    Returns:
+        [numpy array] -- color page
+    """
+    rng = np.random.default_rng(seed)
+    (width, height) = size
+    page = np.full((height, width, 3), 235, dtype=np.uint8)
+    letters = list("abcdefghijklmnopqrstuvwxyz")
+    for y in range(40, height - 20, 28):
+        x = 20
+        while x < width - 100:
+            word = "".join(rng.choice(letters, rng.integers(2, 9)))
+            cv2.putText(
+                page,
+                word,
+                (x, y),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                (30, 30, 30),
+                1,
+            )
+            x += 12 * len(word) + 14
+    return page
+
+
+def synthetic_video(num_frames, frames_per_page=100, transition=10, seed=0):
+    """Frames of document camera footage: each page stays still, with
+    sensor noise and flicker, then slides out as the next one comes in.
+
+    Arguments:
+        num_frames {int} -- number of frames
+
+    Keyword Arguments:
+        frames_per_page {int} -- frames of each page, with its transition
+            (default: {100})
+        transition {int} -- frames taken by the slide to the next page
+            (default: {10})
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        [generator] -- the frames
+    """
+    rng = np.random.default_rng(seed)
+    pages = {}
+    for i in range(num_frames):
+        (number, position) = divmod(i, frames_per_page)
+        for page in (number, number + 1):
+            if page not in pages:
+                pages[page] = synthetic_page(seed + page)
+        pages.pop(number - 1, None)
+        frame = pages[number]
+        moving = position - (frames_per_page - transition) + 1
+        if moving > 0:
+            shift = moving * frame.shape[1] // (transition + 1)
+            frame = np.concatenate(
+                [frame[:, shift:], pages[number + 1][:, :shift]], axis=1
+            )
+        noise = rng.normal(0, 3, frame.shape) + rng.uniform(-4, 4)
+        yield np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def benchmark(num_frames, frames_per_page=100, transition=10, threshold=0.05):
+    """Print the OCR calls made on synthetic document footage with and
+    without the scene change gating, and whether every page was read once
+    it was still. A stand-in for the pipeline counts the calls, so no
+    model is needed.
+
+    Arguments:
+        num_frames {int} -- number of frames
+
+    Keyword Arguments:
+        frames_per_page {int} -- frames of each page (default: {100})
+        transition {int} -- frames of the slide between two pages
+            (default: {10})
+        threshold {float} -- scene change that triggers a new OCR
+            (default: {0.05})
+    """
+    ocr_frames = []
+
+    def count_call(frame):
+        ocr_frames.append(video_ocr.frames)
+        return {"text": ""}
+
+    video_ocr = VideoOCR(count_call, threshold=threshold)
+    for frame in synthetic_video(num_frames, frames_per_page, transition):
+        video_ocr.process(frame)
+
+    # a page is read when an OCR call falls in its still frames
+    still = frames_per_page - transition
+    pages = -(-num_frames // frames_per_page)
+    read = len(
+        {
+            i // frames_per_page
+            for i in ocr_frames
+            if i % frames_per_page < still
+        }
+    )
+    print(
+        "[INFO] {} frames, {} pages of {} frames".format(
+            num_frames, pages, frames_per_page
+        )
+    )
+    print("    OCR calls without gating {:8d}".format(num_frames))
+    print(
+        "    OCR calls with gating    {:8d} ({:.1f} times fewer)".format(
+            video_ocr.ocr_runs, num_frames / max(video_ocr.ocr_runs, 1)
+        )
+    )
+    print("    pages read while still   {:8d} of {}".format(read, pages))
+    print(
+        "    gating {:.3f} ms per frame".format(
+            1000 * video_ocr.total_time / max(video_ocr.frames, 1)
+        )
+    )
+
+
+def paper_corners_or_none(frame, min_confidence=0.2):
+    """Paper corners of a frame, or None to OCR the whole frame."""
+    corners, confidence = find_paper_corners(frame)
+    return corners if confidence >= min_confidence else None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "-v",
+        "--video",
+        type=str,
+        default="0",
+        help="video file path or camera number",
+    )
+    ap.add_argument(
+        "-east",
+        "--east",
+        type=str,
+        default="frozen_east_text_detection.pb",
+        help="path to input EAST text detector",
+    )
+    ap.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="scene change that triggers a new OCR, between 0 and 1",
+    )
+    ap.add_argument(
+        "--track",
+        action="store_true",
+        help="track the text boxes and only recognize new or changed ones",
+    )
+    ap.add_argument(
+        "-s",
+        "--synthetic",
+        type=int,
+        default=0,
+        help="count the OCR calls on this many synthetic frames instead",
+    )
+    args = vars(ap.parse_args())
+
+    if args["synthetic"]:
+        benchmark(args["synthetic"], threshold=args["threshold"])
+        sys.exit()
+
+    source = int(args["video"]) if args["video"].isdigit() else args["video"]
+    cap = cv2.VideoCapture(source)
+
+    tracker = BoxTracker() if args["track"] else None
+    pipeline = OCRPipeline(
+        model=args["east"],
+        corner_finder=paper_corners_or_none,
+        tracker=tracker,
+    )
+    video_ocr = VideoOCR(pipeline, threshold=args["threshold"])
+
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        result, cached = video_ocr.process(frame)
+        if not cached:
+            print(result["text"])
+
+    cap.release()
+    print("[INFO] " + video_ocr.report())
+    if tracker is not None:
+        print("[INFO] tracker: {}".format(tracker.metrics()))